@@ -13,4 +13,8 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'SoftDesk_RESTful_API.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from api.live import LiveUpdatesMiddleware  # noqa: E402 -> needs the apps
+
+application = LiveUpdatesMiddleware(django_application)
@@ -10,12 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
-from rich.box import SIMPLE
-
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 
@@ -47,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -81,11 +81,184 @@ WSGI_APPLICATION = 'SoftDesk_RESTful_API.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.0/ref/settings/#databases
 
+# SQLite tuned for concurrent requests (api/sqlite): WAL lets readers run
+# next to the writer, writers queue for busy_timeout ms instead of failing
+# and connections live for CONN_MAX_AGE seconds instead of one request.
+# The cache pragmas are per connection, mmap shares the pages between them.
+SQLITE_OPTIONS = {
+    'pragmas': {
+        'busy_timeout': 5000,
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -20000,  # KiB
+        'mmap_size': 256 * 2 ** 20,
+        'temp_store': 'MEMORY',
+    },
+    'transaction_mode': 'IMMEDIATE',
+}
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        'ENGINE': 'api.sqlite',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': 600,
+    },
+    # stands in for a read replica, `manage.py sync_replica` copies the
+    # primary into it
+    'replica': {
+        'ENGINE': 'api.sqlite',
+        'NAME': BASE_DIR / 'db.replica.sqlite3',
+        'OPTIONS': SQLITE_OPTIONS,
+        'CONN_MAX_AGE': 600,
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+
+DATABASE_ROUTERS = ['api.replicas.ReplicaRouter']
+
+# Read replicas (api/replicas.py): the GET requests of the project,
+# contributor, issue and comment views read from one of REPLICAS, a user
+# who wrote reads from the primary for PIN_SECONDS (pins are kept in CACHE).
+# Add 'replica' after running `manage.py sync_replica`.
+DATABASE_REPLICATION = {
+    'REPLICAS': [],
+    'PIN_SECONDS': 10,
+    'CACHE': 'default',
+}
+
+
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # rendered API responses, use a file based or shared cache in production
+    'responses': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'responses',
+        'OPTIONS': {'MAX_ENTRIES': 1000},
+    },
+    # shared by the worker processes of the host, the invalidations of the
+    # membership cache and the live stream tickets have to reach all of
+    # them. Use Redis or Memcached when the workers run on several hosts.
+    # The keys are prefixed with the database, deployments that share the
+    # directory do not read each other's entries.
+    'membership': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('MEMBERSHIP_CACHE_DIR',
+                                   BASE_DIR / '.cache' / 'membership'),
+        'KEY_PREFIX': str(DATABASES['default']['NAME']),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
+
+# the tests keep the caches above in the test process
+TEST_RUNNER = 'SoftDesk_RESTful_API.test_runner.TestRunner'
+
+# Contributor-membership cache (api/cache.py): shared tier in CACHE (a cache
+# of all processes), bounded in-process LRU tier with a short TTL in front of
+# it.
+MEMBERSHIP_CACHE = {
+    'CACHE': 'membership',
+    'TIMEOUT': 300,
+    'LOCAL_MAXSIZE': 4096,
+    'LOCAL_TIMEOUT': 5,
+}
+
+# Cache of rendered project / issue / comment responses (api/cache.py),
+# the keys contain the version of the project.
+RESPONSE_CACHE = {
+    'CACHE': 'responses',
+    'TIMEOUT': 600,
+}
+
+
+# Event log of the project trees (api/events.py): /projects/{pk}/changes/
+# returns up to PAGE_SIZE events, `manage.py compact_events` deletes the
+# events older than RETENTION_DAYS.
+EVENT_LOG = {
+    'RETENTION_DAYS': 30,
+    'PAGE_SIZE': 500,
+}
+
+
+# Live updates (api/live.py): GET /live/projects/{pk}/ streams the issue and
+# comment events of the project (Server-Sent Events, ?mode=poll for long
+# polling). Served by the ASGI application only. PUBSUB connects the workers,
+# api.live.LocalPubSub only reaches the connections of its own process.
+# EventSource clients connect with a single-use ?ticket= from
+# POST /live/projects/{pk}/tickets/, kept in TICKET_CACHE (of all workers).
+LIVE_UPDATES = {
+    'PUBSUB': 'api.live.LocalPubSub',
+    'QUEUE_SIZE': 100,  # messages a connection may fall behind
+    'HEARTBEAT': 15,  # seconds
+    'IDLE_TIMEOUT': 300,  # seconds without an update
+    'MAX_SUBSCRIBERS': 1000,  # connections per worker
+    'POLL_TIMEOUT': 25,  # seconds
+    'TICKET_TIMEOUT': 30,  # seconds
+    'TICKET_CACHE': 'membership',
+}
+
+
+# Request instrumentation (api/instrumentation.py): Server-Timing header and
+# a JSON log of slow requests and repeated queries on 'api.requests'.
+REQUEST_METRICS = {
+    'SERVER_TIMING': True,
+    'SLOW_REQUEST_MS': 500,
+    'DUPLICATE_QUERY_THRESHOLD': 3,
+    'LOCATE_QUERIES': True,
+}
+
+# Prometheus metrics on /metrics (api/metrics.py). With several worker
+# processes every process writes its counts to DIRECTORY (shared by all
+# workers of the deployment, emptied before they start) and /metrics adds
+# them up. The endpoint requires the bearer token TOKEN (from the
+# environment) and answers 403 without one, PUBLIC: True opens it to
+# everybody.
+METRICS = {
+    'DIRECTORY': None,
+    'FLUSH_INTERVAL': 1.0,
+    'TOKEN': os.environ.get('METRICS_TOKEN'),
+    'PUBLIC': False,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'api.requests': {'handlers': ['console'], 'level': 'WARNING'},
+    },
+}
+
+
+# Password hashing
+# https://docs.djangoproject.com/en/4.0/topics/auth/passwords/
+# The first hasher hashes new passwords, the others verify existing hashes
+# (upgraded on the next login). Move Argon2PasswordHasher first to use
+# argon2 (needs argon2-cffi). The parameters come from
+# `python manage.py calibrate_password_hasher`, WORKERS hashes run at the
+# same time, QUEUE more wait up to TIMEOUT seconds, then 503.
+
+PASSWORD_HASHERS = [
+    'authentication.hashers.ScryptPasswordHasher',
+    'authentication.hashers.Argon2PasswordHasher',
+    'authentication.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+]
+
+PASSWORD_HASHING = {
+    'SCRYPT': {'work_factor': 2 ** 14, 'block_size': 8, 'parallelism': 1},
+    'ARGON2': {'time_cost': 2, 'memory_cost': 102400, 'parallelism': 8},
+    'PBKDF2': {'iterations': 320000},
+    'WORKERS': 4,
+    'QUEUE': 64,
+    'TIMEOUT': 10,
 }
 
 
@@ -137,7 +310,7 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'authentication.authentication.StatelessJWTAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated'
@@ -149,5 +322,15 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=5),
     'ROTATE_REFRESH_TOKENS': False,
     'BLACKLIST_AFTER_ROTATION': False,
-    'UPDATE_LAST_LOGIN': False
+    'UPDATE_LAST_LOGIN': False,
+    'TOKEN_OBTAIN_SERIALIZER':
+        'authentication.serializers.TokenObtainPairSerializer',
+}
+
+# Users whose tokens are revoked (authentication/revocation.py), has to be
+# a cache that all processes share: the file based 'membership' cache of the
+# host (Redis or Memcached with several hosts). `manage.py check` fails on a
+# LocMemCache when WEB_CONCURRENCY is above 1.
+TOKEN_REVOCATION = {
+    'CACHE': 'membership',
 }
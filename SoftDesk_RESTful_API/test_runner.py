@@ -0,0 +1,20 @@
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+from api.cache import process_caches
+
+
+class TestRunner(DiscoverRunner):
+    """
+    DiscoverRunner that keeps the caches in the test process, the file based
+    cache of settings.py is shared with the servers of the host.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.process_caches = override_settings(CACHES=process_caches('test'))
+        self.process_caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.process_caches.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,176 @@
+"""
+Async (ASGI-native) read endpoints for projects, issues and comments.
+
+They answer with the same JSON as the GET routes of the viewsets, but only
+hold a thread while a query or the serialization actually runs; waiting for
+the client, the cache and between the steps happens on the event loop.
+
+Django 4.0 has no async QuerySet API yet (QuerySet.aget, aexists and
+``async for`` came with Django 4.1). The steps only read, so unlike the
+thread-sensitive sync_to_async of the 4.1 methods they run in the shared
+thread pool with thread_sensitive=False: the steps of concurrent requests
+run in parallel instead of queueing for the threads of their requests.
+Database connections are per thread and a pool thread serves any request,
+so it closes its connections after every step. CONN_MAX_AGE would keep them
+open (close_old_connections() only closes the expired ones), one per pool
+thread and database that nothing else closes.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from api.cache import membership_cache
+from api.models import Comment, Contributor, Issue, Project
+from api.pagination import KeysetPagination
+from api.rows import row_mapper
+from api.serializers import (
+    CommentSerializer,
+    IssueSerializer,
+    ProjectSerializer,
+    query_param_set,
+    requested_expand,
+)
+from api.views import IssueViewSet
+
+
+def read_only(func):
+    """func as a coroutine function that runs it in the thread pool"""
+    @functools.wraps(func)
+    def step(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            connections.close_all()
+    return sync_to_async(step, thread_sensitive=False)
+
+
+async def aget(queryset, **kwargs):
+    return await read_only(queryset.get)(**kwargs)
+
+
+async def aexists(queryset):
+    return await read_only(queryset.exists)()
+
+
+def render(data, status=200):
+    return HttpResponse(JSONRenderer().render(data), status=status,
+                        content_type='application/json')
+
+
+def error_response(exc):
+    return render({'detail': exc.detail}, status=exc.status_code)
+
+
+def authenticate(request):
+    """
+    Runs the DEFAULT_AUTHENTICATION_CLASSES on the request and returns the
+    DRF request, raises NotAuthenticated for anonymous users.
+    """
+    drf_request = Request(request, authenticators=[
+        authentication() for authentication
+        in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    if not drf_request.user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    return drf_request
+
+
+async def check_contributor(user, project_id):
+    """
+    Async IsContributor: answered from the membership cache when possible,
+    raises NotFound / PermissionDenied like the permission class.
+    """
+    is_member = await membership_cache.aget(user.id, project_id)
+    if is_member is None:
+        is_member = await aexists(Contributor.objects.filter(
+            project_id=project_id, user_id=user.id))
+        if not is_member and not await aexists(
+                Project.objects.filter(id=project_id)):
+            raise exceptions.NotFound(
+                'A Project with that id does not exist')
+        await membership_cache.aset(user.id, project_id, is_member)
+    if not is_member:
+        raise exceptions.PermissionDenied()
+
+
+def serialize_page(drf_request, queryset, serializer_class, **kwargs):
+    """A page of .values() rows, like the list actions of the viewsets"""
+    mapper = row_mapper(serializer_class(**kwargs))
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(
+        mapper.values(queryset, paginator.ordering), drf_request)
+    return paginator.get_paginated_response(mapper.serialize(page)).data
+
+
+def serialize_project(drf_request, project_id):
+    expand = requested_expand(ProjectSerializer, drf_request.query_params,
+                              default_all=True)
+    project = ProjectSerializer.setup_eager_loading(
+        Project.objects.filter(id=project_id), expand).get()
+    return ProjectSerializer(
+        project, context={'request': drf_request},
+        fields=query_param_set(drf_request.query_params, 'fields'),
+        expand=expand).data
+
+
+def serialize_issues(drf_request, project_id):
+    expand = requested_expand(IssueSerializer, drf_request.query_params,
+                              default_all=False)
+    queryset = Issue.objects.filter(project_id=project_id).order_by(
+        'created_time', 'id')
+    # the backends only read class attributes like ordering_fields
+    for backend in IssueViewSet.filter_backends:
+        queryset = backend().filter_queryset(drf_request, queryset,
+                                             IssueViewSet)
+    return serialize_page(
+        drf_request, queryset, IssueSerializer,
+        fields=query_param_set(drf_request.query_params, 'fields'),
+        expand=expand)
+
+
+def serialize_comments(drf_request, issue_id):
+    queryset = Comment.objects.filter(issue_id=issue_id).order_by(
+        'created_time', 'id')
+    return serialize_page(drf_request, queryset, CommentSerializer)
+
+
+async def project_detail(request, pk):
+    """Async GET /projects/{pk}/"""
+    try:
+        drf_request = await read_only(authenticate)(request)
+        await check_contributor(drf_request.user, pk)
+    except exceptions.APIException as exc:
+        return error_response(exc)
+    return render(await read_only(serialize_project)(drf_request, pk))
+
+
+async def issue_list(request, project_pk):
+    """Async GET /projects/{project_pk}/issues/"""
+    try:
+        drf_request = await read_only(authenticate)(request)
+        await check_contributor(drf_request.user, project_pk)
+        data = await read_only(serialize_issues)(drf_request, project_pk)
+    except exceptions.APIException as exc:
+        return error_response(exc)
+    return render(data)
+
+
+async def comment_list(request, project_pk, issue_pk):
+    """Async GET /projects/{project_pk}/issues/{issue_pk}/comments/"""
+    try:
+        drf_request = await read_only(authenticate)(request)
+        await check_contributor(drf_request.user, project_pk)
+        try:
+            issue = await aget(Issue.objects.only('id'), id=issue_pk,
+                               project_id=project_pk)
+        except Issue.DoesNotExist:
+            raise exceptions.NotFound('A Issue with that id does not exist')
+        data = await read_only(serialize_comments)(drf_request, issue.id)
+    except exceptions.APIException as exc:
+        return error_response(exc)
+    return render(data)
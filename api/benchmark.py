@@ -0,0 +1,350 @@
+"""
+Benchmark suite of the SoftDesk API.
+
+seed() fills the database with synthetic data at a configurable scale,
+run_benchmark() sends requests to the real URL routes of api/urls.py and
+authentication/urls.py through the in-process test client (the complete
+middleware, authentication and permission stack) and measures requests/s,
+latency percentiles and queries per request of every endpoint.
+The results are plain JSON, compare_results() compares the results of two
+runs, e.g. of two commits.
+run_serialization_benchmark() compares the serializers of the list
+endpoints with the .values() rows of api/rows.py, per row.
+"""
+import math
+import platform
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from api.cache import membership_cache, response_cache
+from api.counters import rebuild_counters
+from api.models import Comment, Contributor, Issue, Project
+from api.rows import row_mapper
+from api.serializers import (
+    CommentSerializer,
+    ContributorSerializer,
+    IssueSerializer,
+)
+from authentication.models import User
+from authentication.tokens import AccessToken
+
+SCALE_DEFAULTS = {
+    'users': 50,
+    'projects': 20,
+    'contributors': 5,
+    'issues': 20,
+    'comments': 5,
+}
+
+SEED_PASSWORD = 'Benchmark-Password-1'
+
+# name, method, path, authentication ('token' / 'anonymous') and the body
+# of the request number n for writes. The paths are formatted with the
+# ids of the benchmark user's first project and its first issue / comment.
+ENDPOINTS = [
+    ('projects-list', 'get', '/projects/', 'token', None),
+    ('projects-list-expanded', 'get',
+     '/projects/?expand=contributors,issues.comments', 'token', None),
+    ('project-detail', 'get', '/projects/{project}/', 'token', None),
+    ('contributors-list', 'get', '/projects/{project}/users/', 'token', None),
+    ('issues-list', 'get', '/projects/{project}/issues/', 'token', None),
+    ('issues-filtered', 'get',
+     '/projects/{project}/issues/?status=To-Do,In-Progress'
+     '&ordering=-priority', 'token', None),
+    ('issues-search', 'get', '/projects/{project}/issues/?q=issue',
+     'token', None),
+    ('issues-keyset', 'get',
+     '/projects/{project}/issues/?pagination=keyset', 'token', None),
+    ('issue-detail', 'get', '/projects/{project}/issues/{issue}/',
+     'token', None),
+    ('comments-list', 'get', '/projects/{project}/issues/{issue}/comments/',
+     'token', None),
+    ('comment-detail', 'get',
+     '/projects/{project}/issues/{issue}/comments/{comment}/', 'token', None),
+    ('project-export', 'get', '/projects/{project}/export/', 'token', None),
+    ('users-list', 'get', '/users/', 'token', None),
+    ('issue-create', 'post', '/projects/{project}/issues/', 'token',
+     lambda n: {'title': f'benchmark issue {n}', 'description': 'created',
+                'tag': 'TASK', 'priority': 'MEDIUM', 'status': 'To-Do',
+                'assignee': None}),
+    ('comment-create', 'post',
+     '/projects/{project}/issues/{issue}/comments/', 'token',
+     lambda n: {'description': f'benchmark comment {n}'}),
+    ('token-obtain', 'post', '/login/token/', 'anonymous',
+     lambda n: {'email': 'user0@softdesk.test', 'password': SEED_PASSWORD}),
+    ('signup', 'post', '/signup/', 'anonymous',
+     lambda n: {'email': f'signup{n}@softdesk.test', 'first_name': 'Sign',
+                'last_name': 'Up', 'password': SEED_PASSWORD}),
+]
+
+
+def percentile(values, percent):
+    """Nearest-rank percentile of the values"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = math.ceil(percent / 100 * len(ordered))
+    return ordered[max(rank, 1) - 1]
+
+
+def latency_summary(latencies):
+    """Mean and percentiles of the latencies (seconds) in milliseconds"""
+    if not latencies:
+        return dict.fromkeys(
+            ('mean_ms', 'p50_ms', 'p90_ms', 'p95_ms', 'p99_ms', 'max_ms'))
+    summary = {'mean_ms': round(statistics.mean(latencies) * 1000, 3)}
+    for percent in (50, 90, 95, 99):
+        summary[f'p{percent}_ms'] = round(
+            percentile(latencies, percent) * 1000, 3)
+    summary['max_ms'] = round(max(latencies) * 1000, 3)
+    return summary
+
+
+def seed(users=50, projects=20, contributors=5, issues=20, comments=5,
+         password=SEED_PASSWORD):
+    """
+    Creates `users` users (user0 is staff), `projects` projects with
+    `contributors` contributors (the author included) each, `issues` issues
+    per project and `comments` comments per issue with bulk inserts.
+    Project i is authored by user i % users. Returns the user0.
+    bulk_create sends no signals: the caches have to start empty and the
+    counters are rebuilt at the end.
+    """
+    if users < 1:
+        raise ValueError('At least one user is needed')
+    hashed = make_password(password)
+    User.objects.bulk_create([
+        User(email=f'user{i}@softdesk.test', first_name='User',
+             last_name=str(i), password=hashed, is_staff=i == 0)
+        for i in range(users)])
+    user_ids = list(User.objects.filter(
+        email__endswith='@softdesk.test').order_by('id').values_list(
+        'id', flat=True))
+
+    Project.objects.bulk_create([
+        Project(title=f'project {i}', description='description',
+                type='back end', author_id=user_ids[i % users])
+        for i in range(projects)])
+    project_rows = list(Project.objects.order_by('id').values_list(
+        'id', 'author_id'))
+
+    members = []
+    for project_id, author_id in project_rows:
+        members.append(Contributor(
+            user_id=author_id, project_id=project_id, permission='manage',
+            role='AUTHOR'))
+        start = user_ids.index(author_id)
+        for k in range(1, min(contributors, users)):
+            members.append(Contributor(
+                user_id=user_ids[(start + k) % users], project_id=project_id,
+                permission='edit', role='COLLABORATOR'))
+    Contributor.objects.bulk_create(members, batch_size=500)
+
+    statuses = [choice for choice, _ in Issue.STATS]
+    priorities = [choice for choice, _ in Issue.PRIORITIES]
+    tags = [choice for choice, _ in Issue.TAGS]
+    Issue.objects.bulk_create([
+        Issue(title=f'issue {j} of project {project_id}',
+              description=f'description of issue {j}',
+              tag=tags[j % len(tags)],
+              priority=priorities[j % len(priorities)],
+              status=statuses[j % len(statuses)], project_id=project_id,
+              author_id=author_id, assignee_id=author_id)
+        for project_id, author_id in project_rows for j in range(issues)],
+        batch_size=500)
+    Comment.objects.bulk_create([
+        Comment(description=f'comment {k}', author_id=author_id,
+                issue_id=issue_id)
+        for issue_id, author_id in Issue.objects.order_by('id').values_list(
+            'id', 'author_id').iterator()
+        for k in range(comments)], batch_size=500)
+    rebuild_counters()
+    return User.objects.get(id=user_ids[0])
+
+
+def benchmark_ids(user):
+    """The ids the ENDPOINTS paths are formatted with"""
+    project = Project.objects.filter(author=user).order_by('id').first()
+    issue = project.issue_set.order_by('id').first() if project else None
+    comment = issue.comment_set.order_by('id').first() if issue else None
+    return {'project': getattr(project, 'id', 0),
+            'issue': getattr(issue, 'id', 0),
+            'comment': getattr(comment, 'id', 0)}
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(client, method, path, data=None):
+    """
+    Sends one request and reads its body, a streamed response (the export)
+    runs its queries while it is read. Returns (status, seconds, queries).
+    """
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = getattr(client, method)(path, data, format='json')
+        if response.streaming:
+            b''.join(response.streaming_content)
+        elapsed = time.perf_counter() - start
+    return response.status_code, elapsed, len(queries)
+
+
+def run_endpoint(client, method, path, data, requests, warmup, cold):
+    statuses, latencies, query_counts = {}, [], []
+    for n in range(warmup + requests):
+        if cold:
+            membership_cache.clear()
+            response_cache.clear()
+        status, elapsed, queries = measure(
+            client, method, path, data(n) if data else None)
+        if n < warmup:
+            continue
+        statuses[status] = statuses.get(status, 0) + 1
+        latencies.append(elapsed)
+        query_counts.append(queries)
+    total = sum(latencies)
+    return {
+        'method': method.upper(),
+        'path': path,
+        'requests': requests,
+        'statuses': {str(status): count for status, count in statuses.items()},
+        'errors': sum(count for status, count in statuses.items()
+                      if status >= 400),
+        'requests_per_second': round(requests / total, 2) if total else None,
+        **latency_summary(latencies),
+        'queries_per_request': round(statistics.mean(query_counts), 2)
+        if query_counts else None,
+        'max_queries': max(query_counts, default=None),
+    }
+
+
+def run_benchmark(user, requests=50, warmup=5, endpoints=None, cold=False):
+    """
+    Benchmarks the endpoints (names of ENDPOINTS, all by default) as the
+    given user. Writes run after the reads in ENDPOINTS order, with cold=True
+    the membership and response caches are cleared before every request.
+    """
+    ids = benchmark_ids(user)
+    token = f'Bearer {AccessToken.for_user(user)}'
+    results = {}
+    for name, method, path, auth, data in ENDPOINTS:
+        if endpoints is not None and name not in endpoints:
+            continue
+        client = APIClient()
+        if auth == 'token':
+            client.credentials(HTTP_AUTHORIZATION=token)
+        results[name] = run_endpoint(client, method, path.format(**ids), data,
+                                     requests, warmup, cold)
+    return results
+
+
+def serialization_cases():
+    """
+    name -> (serializer class, serializer kwargs, queryset) like the list
+    actions read them
+    """
+    issues = Issue.objects.order_by('created_time', 'id')
+    return {
+        'issues': (IssueSerializer, {'expand': set()}, issues),
+        'issues-expanded': (IssueSerializer, {'expand': {'comments'}},
+                            issues.prefetch_related('comment_set')),
+        'comments': (CommentSerializer, {},
+                     Comment.objects.order_by('created_time', 'id')),
+        'contributors': (ContributorSerializer, {},
+                         Contributor.objects.select_related('user').order_by(
+                             'id')),
+    }
+
+
+def fastest(function, repeat):
+    """The fastest of `repeat` calls in seconds and the last result"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def run_serialization_benchmark(rows=500, repeat=10):
+    """
+    Reads and serializes up to `rows` rows per case with the serializer
+    (model instances) and with the RowMapper (.values() rows), returns the
+    microseconds per row of both and whether the JSON is identical.
+    """
+    renderer = JSONRenderer()
+    results = {}
+    for name, (serializer_class, kwargs, queryset) in (
+            serialization_cases().items()):
+        queryset = queryset[:rows]
+        mapper = row_mapper(serializer_class(**kwargs))
+        serializer_seconds, expected = fastest(
+            lambda: serializer_class(
+                list(queryset), many=True, **kwargs).data, repeat)
+        rows_seconds, data = fastest(
+            lambda: mapper.serialize(mapper.values(queryset)), repeat)
+        count = max(len(data), 1)
+        results[name] = {
+            'rows': len(data),
+            'serializer_us_per_row': round(
+                serializer_seconds / count * 10 ** 6, 2),
+            'rows_us_per_row': round(rows_seconds / count * 10 ** 6, 2),
+            'speedup': round(serializer_seconds / rows_seconds, 2)
+            if rows_seconds else None,
+            'identical': renderer.render(expected) == renderer.render(data),
+        }
+    return results
+
+
+def benchmark_report(results, scale, options):
+    return {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'scale': scale,
+            'options': options,
+        },
+        'endpoints': results,
+    }
+
+
+def compare_results(baseline, current, threshold=0.1):
+    """
+    Compares two benchmark reports endpoint by endpoint. An endpoint
+    regressed if its p50 latency grew by more than `threshold` (relative)
+    or it needs more queries per request.
+    Returns {name: {'p50_change', 'queries_change', 'regressed'}}.
+    """
+    comparison = {}
+    for name, new in current['endpoints'].items():
+        old = baseline['endpoints'].get(name)
+        if old is None or not old['p50_ms'] or new['p50_ms'] is None:
+            continue
+        p50_change = (new['p50_ms'] - old['p50_ms']) / old['p50_ms']
+        queries_change = (new['queries_per_request']
+                          - old['queries_per_request'])
+        comparison[name] = {
+            'p50_change': round(p50_change, 4),
+            'queries_change': round(queries_change, 2),
+            'regressed': p50_change > threshold or queries_change > 0,
+        }
+    return comparison
@@ -0,0 +1,189 @@
+from django.db import transaction
+from rest_framework import status
+
+from api.cache import membership_cache
+from api.counters import add_counters, issue_counters
+from api.events import record_events
+from api.models import Contributor, Issue, Project
+from api.serializers import (
+    BulkContributorSerializer,
+    BulkIssueSerializer,
+    ContributorSerializer,
+    IssueSerializer,
+)
+from authentication.models import User
+
+BULK_BATCH_SIZE = 500
+
+
+class BulkResult:
+    """Collects the per-item results of a bulk request in request order."""
+
+    def __init__(self, size):
+        self.items = [None] * size
+
+    def error(self, index, errors):
+        self.items[index] = {'index': index,
+                             'status': status.HTTP_400_BAD_REQUEST,
+                             'errors': errors}
+
+    def success(self, index, data, code=status.HTTP_201_CREATED):
+        self.items[index] = {'index': index, 'status': code, 'data': data}
+
+    @property
+    def status_code(self):
+        """201 if every item succeeded, 400 if none did, 207 otherwise"""
+        failed = sum(item['status'] == status.HTTP_400_BAD_REQUEST
+                     for item in self.items)
+        if not failed:
+            return status.HTTP_201_CREATED
+        if failed == len(self.items):
+            return status.HTTP_400_BAD_REQUEST
+        return status.HTTP_207_MULTI_STATUS
+
+    @property
+    def data(self):
+        return {'results': self.items}
+
+
+def validate_items(serializer_class, items, result):
+    """
+    Validates every item on its own (no queries are needed for that) and
+    returns the (index, validated_data) of the valid ones.
+    """
+    valid = []
+    for index, item in enumerate(items):
+        serializer = serializer_class(data=item)
+        if serializer.is_valid():
+            valid.append((index, serializer.validated_data))
+        else:
+            result.error(index, serializer.errors)
+    return valid
+
+
+def resolve_users(emails):
+    """All users of the given emails with a single query, keyed by email."""
+    return {user.email: user
+            for user in User.objects.filter(email__in=set(emails))}
+
+
+def user_error(email):
+    return {'user': [f'Object with email={email} does not exist.']}
+
+
+def add_missing_contributors(project, users):
+    """
+    Adds the users that are not yet contributors of the project as
+    collaborators with one bulk insert, returns how many were added.
+    bulk_create sends no post_save, so the membership cache is invalidated
+    and the events are recorded here.
+    """
+    members = set(Contributor.objects.filter(
+        project=project, user__in=users).values_list('user_id', flat=True))
+    missing = {user.id for user in users} - members
+    contributors = Contributor.objects.bulk_create(
+        [Contributor(user_id=user_id, project=project, permission='edit',
+                     role='COLLABORATOR') for user_id in missing],
+        batch_size=BULK_BATCH_SIZE)
+    record_events(contributors, 'created', project.id)
+    for user_id in missing:
+        membership_cache.invalidate_on_commit(user_id, project.id)
+    return len(missing)
+
+
+def bulk_create_issues(project, author, items, batch_size=BULK_BATCH_SIZE):
+    """
+    Creates the issues of a bulk import in one transaction.
+    Works like IssueSerializer.create: the author is the default assignee
+    and assignees that are not contributors yet are added to the project.
+    """
+    result = BulkResult(len(items))
+    valid = validate_items(BulkIssueSerializer, items, result)
+    users = resolve_users(data['assignee'] for _, data in valid
+                          if data.get('assignee'))
+
+    issues = []
+    for index, data in valid:
+        email = data.pop('assignee', None)
+        if email and email not in users:
+            result.error(index, {'assignee': user_error(email)['user']})
+            continue
+        assignee = users[email] if email else author
+        issues.append((index, Issue(project=project, author=author,
+                                    assignee=assignee, **data)))
+
+    with transaction.atomic():
+        add_missing_contributors(
+            project, list({issue.assignee for _, issue in issues}))
+        Issue.objects.bulk_create([issue for _, issue in issues],
+                                  batch_size=batch_size)
+        # bulk_create sends no post_save
+        Project.bump_version(
+            add_counters(*(issue_counters(issue) for _, issue in issues)),
+            id=project.id)
+        record_events([issue for _, issue in issues], 'created', project.id)
+
+    serializer = IssueSerializer(
+        [issue for _, issue in issues], many=True, expand=set())
+    for (index, _), data in zip(issues, serializer.data):
+        result.success(index, data)
+    return result
+
+
+def bulk_save_contributors(project, items, batch_size=BULK_BATCH_SIZE):
+    """
+    Creates or updates the contributors of a bulk request in one
+    transaction. The permission follows the role like in
+    ContributorSerializer.create.
+    """
+    result = BulkResult(len(items))
+    valid = validate_items(BulkContributorSerializer, items, result)
+    users = resolve_users(data['user'] for _, data in valid)
+    existing = {contributor.user_id: contributor for contributor
+                in Contributor.objects.filter(
+                    project=project, user__in=users.values())}
+
+    created, updated, seen = [], [], set()
+    for index, data in valid:
+        user = users.get(data['user'])
+        if user is None:
+            result.error(index, user_error(data['user']))
+            continue
+        if user.id in seen:
+            result.error(index, {'user': ['Duplicate user in request.']})
+            continue
+        seen.add(user.id)
+        role = data.get('role') or 'COLLABORATOR'
+        permission = 'manage' if role == 'AUTHOR' else 'edit'
+        if user.id in existing:
+            contributor = existing[user.id]
+            contributor.role, contributor.permission = role, permission
+            updated.append((index, contributor))
+        else:
+            contributor = Contributor(user=user, project=project, role=role,
+                                      permission=permission)
+            created.append((index, contributor))
+        contributor.user = user
+
+    with transaction.atomic():
+        Contributor.objects.bulk_create(
+            [contributor for _, contributor in created],
+            batch_size=batch_size)
+        Contributor.objects.bulk_update(
+            [contributor for _, contributor in updated],
+            ['role', 'permission'], batch_size=batch_size)
+        Project.bump_version(id=project.id)
+        record_events([contributor for _, contributor in created],
+                      'created', project.id)
+        record_events([contributor for _, contributor in updated],
+                      'updated', project.id)
+    for _, contributor in created:
+        membership_cache.invalidate_on_commit(contributor.user_id, project.id)
+
+    for rows, code in ((created, status.HTTP_201_CREATED),
+                       (updated, status.HTTP_200_OK)):
+        serializer = ContributorSerializer(
+            [contributor for _, contributor in rows], many=True)
+        for (index, _), data in zip(rows, serializer.data):
+            result.success(index, data, code)
+    return result
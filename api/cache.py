@@ -0,0 +1,240 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+MEMBERSHIP_CACHE_DEFAULTS = {
+    'CACHE': 'default',
+    'TIMEOUT': 300,
+    'LOCAL_MAXSIZE': 4096,
+    'LOCAL_TIMEOUT': 5,
+}
+
+RESPONSE_CACHE_DEFAULTS = {
+    'CACHE': 'default',
+    'TIMEOUT': 600,
+}
+
+
+def process_caches(name):
+    """
+    settings.CACHES with every cache kept in this process (LocMemCache),
+    for the test runner and the benchmark: the entries of their throwaway
+    databases must not reach (and clear() must not wipe) a shared cache.
+    """
+    return {
+        alias: {**config,
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': f'{name}-{alias}'}
+        for alias, config in settings.CACHES.items()}
+
+
+class CacheStats:
+    """Thread-safe hit / miss counters of a cache in this process."""
+    counters = ('hits', 'misses')
+
+    def _count(self, counter):
+        with self._lock:
+            self._stats[counter] += 1
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = dict.fromkeys(self.counters, 0)
+
+
+class LocalLRUCache:
+    """
+    Small thread-safe in-process cache with least-recently-used eviction and
+    a time to live for every entry.
+    """
+
+    def __init__(self, maxsize=1024, timeout=5, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.timer = timer
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                expires, value = self._data[key]
+            except KeyError:
+                return default
+            if expires <= self.timer():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (self.timer() + self.timeout, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class MembershipCache(CacheStats):
+    """
+    Cache of the contributor-membership (True / False) of (user, project)
+    pairs.
+    A bounded in-process LRU tier is checked first, then the shared Django
+    cache that is selected with settings.MEMBERSHIP_CACHE['CACHE'].
+    Entries are invalidated by the Contributor signals in api/signals.py,
+    the short TTL of the local tier bounds the staleness in other processes.
+    The shared tier has to be a cache all processes see (not LocMemCache),
+    otherwise the invalidations stay in the process that wrote.
+    """
+    key_prefix = 'membership'
+    counters = ('local_hits', 'shared_hits', 'misses', 'invalidations')
+
+    def __init__(self, options=None, timer=time.monotonic):
+        if options is None:
+            options = getattr(settings, 'MEMBERSHIP_CACHE', {})
+        options = {**MEMBERSHIP_CACHE_DEFAULTS, **options}
+        self.alias = options['CACHE']
+        self.timeout = options['TIMEOUT']
+        self.local = LocalLRUCache(maxsize=options['LOCAL_MAXSIZE'],
+                                   timeout=options['LOCAL_TIMEOUT'],
+                                   timer=timer)
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def shared(self):
+        return caches[self.alias]
+
+    def make_key(self, user_id, project_id):
+        return f'{self.key_prefix}:{int(user_id)}:{int(project_id)}'
+
+    def get(self, user_id, project_id):
+        """Returns the cached membership or None if it is not cached."""
+        key = self.make_key(user_id, project_id)
+        is_member = self.local.get(key)
+        if is_member is not None:
+            self._count('local_hits')
+            return is_member
+        is_member = self.shared.get(key)
+        if is_member is not None:
+            self._count('shared_hits')
+            self.local.set(key, is_member)
+            return is_member
+        self._count('misses')
+        return None
+
+    def set(self, user_id, project_id, is_member):
+        key = self.make_key(user_id, project_id)
+        self.local.set(key, is_member)
+        self.shared.set(key, is_member, self.timeout)
+
+    async def aget(self, user_id, project_id):
+        """get() for async code, a local hit never leaves the event loop"""
+        key = self.make_key(user_id, project_id)
+        is_member = self.local.get(key)
+        if is_member is not None:
+            self._count('local_hits')
+            return is_member
+        is_member = await self.shared.aget(key)
+        if is_member is not None:
+            self._count('shared_hits')
+            self.local.set(key, is_member)
+            return is_member
+        self._count('misses')
+        return None
+
+    async def aset(self, user_id, project_id, is_member):
+        key = self.make_key(user_id, project_id)
+        self.local.set(key, is_member)
+        await self.shared.aset(key, is_member, self.timeout)
+
+    def invalidate(self, user_id, project_id):
+        key = self.make_key(user_id, project_id)
+        self.local.delete(key)
+        self.shared.delete(key)
+        self._count('invalidations')
+
+    def invalidate_on_commit(self, user_id, project_id, using=None):
+        """
+        Invalidates now and again when the transaction of the write commits,
+        a request that checks the membership in between reads the old rows
+        and caches the old answer.
+        """
+        self.invalidate(user_id, project_id)
+        if transaction.get_connection(using).in_atomic_block:
+            transaction.on_commit(
+                lambda: self.invalidate(user_id, project_id), using=using)
+
+    def clear(self):
+        """Clears the local tier and the whole shared cache."""
+        self.local.clear()
+        self.shared.clear()
+
+    def stats(self):
+        stats = super().stats()
+        stats['hits'] = stats['local_hits'] + stats['shared_hits']
+        return stats
+
+
+class ResponseCache(CacheStats):
+    """
+    Cache of rendered API responses in the Django cache that is selected
+    with settings.RESPONSE_CACHE['CACHE'].
+    The keys contain the version of the project the response belongs to,
+    every write to the project tree bumps it (api/signals.py), so outdated
+    entries are never read again and leave through the size-bounded
+    eviction of the cache backend (MAX_ENTRIES for locmem / file caches).
+    """
+    key_prefix = 'response'
+
+    def __init__(self, options=None):
+        if options is None:
+            options = getattr(settings, 'RESPONSE_CACHE', {})
+        options = {**RESPONSE_CACHE_DEFAULTS, **options}
+        self.alias = options['CACHE']
+        self.timeout = options['TIMEOUT']
+        self._lock = threading.Lock()
+        self.reset_stats()
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def make_key(self, *parts):
+        digest = hashlib.sha1('|'.join(map(str, parts)).encode()).hexdigest()
+        return f'{self.key_prefix}:{digest}'
+
+    def get(self, key):
+        """Returns the cached (content, content_type) or None"""
+        entry = self.backend.get(key)
+        self._count('misses' if entry is None else 'hits')
+        return entry
+
+    def set(self, key, content, content_type):
+        self.backend.set(key, (content, content_type), self.timeout)
+
+    def clear(self):
+        self.backend.clear()
+
+
+membership_cache = MembershipCache()
+response_cache = ResponseCache()
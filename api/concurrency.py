@@ -0,0 +1,304 @@
+"""
+Concurrency benchmark of the SQLite configuration.
+
+Several threads send the same mix of reads (an issue page of a project)
+and write transactions (read the project, add an issue, bump its version,
+like the issue create view) to a fresh database file per profile:
+'stock' is Django's sqlite3 backend with a connection per request, as
+before api/sqlite, 'configured' is the default database of settings.py.
+Every operation ends like a request, with close_if_unusable_or_obsolete(),
+so CONN_MAX_AGE counts. The results are the throughput, the latency
+percentiles and the failed ("database is locked") operations per profile.
+
+run_create_benchmark() compares the create path of IssueSerializer with
+the previous one (every contributor loaded to check the assignee, the
+contributor saved twice, every save its own transaction) the same way:
+threads create issues with random assignees, some of them not yet
+contributors, through the real models and signal receivers.
+"""
+import os
+import random
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import (
+    DEFAULT_DB_ALIAS,
+    IntegrityError,
+    OperationalError,
+    connections,
+    transaction,
+)
+from django.db.models import F
+from django.test.utils import CaptureQueriesContext
+
+from api.benchmark import latency_summary
+from api.models import Contributor, Issue, Project
+from api.serializers import create_issue
+from authentication.models import User
+
+PROFILES = ('stock', 'configured')
+CREATE_PATHS = ('previous', 'coalesced')
+BENCHMARK_ALIAS = 'concurrency_benchmark'
+
+
+def profile_settings(profile):
+    """The DATABASES entry of a profile, without NAME"""
+    if profile == 'stock':
+        return {'ENGINE': 'django.db.backends.sqlite3'}
+    default = settings.DATABASES[DEFAULT_DB_ALIAS]
+    if 'sqlite' not in default['ENGINE']:
+        raise ValueError('The default database is not SQLite')
+    return {key: default[key] for key in ('ENGINE', 'OPTIONS', 'CONN_MAX_AGE')
+            if key in default}
+
+
+@contextmanager
+def benchmark_database(profile, alias=BENCHMARK_ALIAS):
+    """A migrated database file with the settings of the profile"""
+    with tempfile.TemporaryDirectory() as directory:
+        connections.settings[alias] = {
+            **profile_settings(profile),
+            'NAME': os.path.join(directory, 'db.sqlite3')}
+        try:
+            call_command('migrate', database=alias, verbosity=0,
+                         interactive=False)
+            yield alias
+        finally:
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+
+
+def seed_database(alias, issues=50):
+    """One user and project with `issues` issues, returns their ids"""
+    # bulk_create: the signal receivers would write to the default database
+    user = User.objects.using(alias).bulk_create([
+        User(email='user@softdesk.test', password='!')])[0]
+    project = Project.objects.using(alias).bulk_create([
+        Project(title='project', description='description',
+                type='back end', author=user)])[0]
+    Contributor.objects.using(alias).bulk_create([
+        Contributor(user=user, project=project, permission='manage',
+                    role='AUTHOR')])
+    Issue.objects.using(alias).bulk_create([
+        new_issue(project.id, user.id, i) for i in range(issues)])
+    return user.id, project.id
+
+
+def new_issue(project_id, user_id, number):
+    return Issue(title=f'issue {number}', description='description',
+                 tag='BUG', priority='LOW', status='To-Do',
+                 project_id=project_id, author_id=user_id,
+                 assignee_id=user_id)
+
+
+def read(alias, project_id, user_id):
+    list(Issue.objects.using(alias).filter(
+        project_id=project_id).order_by('-id')[:25])
+
+
+def write(alias, project_id, user_id):
+    with transaction.atomic(using=alias):
+        Project.objects.using(alias).get(pk=project_id)
+        Issue.objects.using(alias).bulk_create(
+            [new_issue(project_id, user_id, 'new')])
+        Project.objects.using(alias).filter(pk=project_id).update(
+            version=F('version') + 1)
+
+
+def run_profile(profile, threads=8, operations=200, write_ratio=0.2,
+                issues=50):
+    """
+    `threads` threads run `operations` operations each, `write_ratio` of
+    them writes. Returns the results of the profile.
+    """
+    with benchmark_database(profile) as alias:
+        user_id, project_id = seed_database(alias, issues)
+        connections[alias].close()
+        latencies = {'read': [], 'write': []}
+        errors = {'read': 0, 'write': 0}
+        lock = threading.Lock()
+        start_line = threading.Barrier(threads + 1)
+
+        def worker(seed):
+            rng = random.Random(seed)
+            done = {'read': [], 'write': []}
+            failed = {'read': 0, 'write': 0}
+            start_line.wait()
+            for _ in range(operations):
+                kind = 'write' if rng.random() < write_ratio else 'read'
+                start = time.perf_counter()
+                try:
+                    (write if kind == 'write' else read)(
+                        alias, project_id, user_id)
+                except OperationalError:
+                    failed[kind] += 1
+                else:
+                    done[kind].append(time.perf_counter() - start)
+                # the end of a request
+                connections[alias].close_if_unusable_or_obsolete()
+            connections[alias].close()
+            with lock:
+                for name in latencies:
+                    latencies[name].extend(done[name])
+                    errors[name] += failed[name]
+
+        workers = [threading.Thread(target=worker, args=(i,))
+                   for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        start_line.wait()
+        start = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        seconds = time.perf_counter() - start
+
+    completed = len(latencies['read']) + len(latencies['write'])
+    return {
+        'settings': profile_settings(profile),
+        'seconds': round(seconds, 3),
+        'operations_per_second': round(completed / seconds, 1),
+        'errors': errors,
+        'read': latency_summary(latencies['read']),
+        'write': latency_summary(latencies['write']),
+    }
+
+
+def run_concurrency_benchmark(profiles=PROFILES, **options):
+    return {profile: run_profile(profile, **options) for profile in profiles}
+
+
+@contextmanager
+def default_database(profile='configured'):
+    """
+    Points the default database at a migrated temporary file, the signal
+    receivers and serializers write to the default database.
+    """
+    previous_settings = connections.settings[DEFAULT_DB_ALIAS]
+    previous = connections[DEFAULT_DB_ALIAS]
+    with tempfile.TemporaryDirectory() as directory:
+        connections.settings[DEFAULT_DB_ALIAS] = {
+            **previous_settings, **profile_settings(profile),
+            'NAME': os.path.join(directory, 'db.sqlite3')}
+        del connections[DEFAULT_DB_ALIAS]
+        try:
+            call_command('migrate', verbosity=0, interactive=False)
+            yield
+        finally:
+            connections[DEFAULT_DB_ALIAS].close()
+            connections.settings[DEFAULT_DB_ALIAS] = previous_settings
+            connections[DEFAULT_DB_ALIAS] = previous
+
+
+def seed_create_benchmark(contributors=100, outsiders=50):
+    """
+    One project with `contributors` contributors and `outsiders` users
+    that do not contribute yet, returns the project id and all users.
+    """
+    users = User.objects.bulk_create([
+        User(email=f'user{i}@softdesk.test', password='!')
+        for i in range(max(contributors, 1) + outsiders)])
+    project = Project.objects.bulk_create([
+        Project(title='project', description='description',
+                type='back end', author=users[0])])[0]
+    Contributor.objects.bulk_create([
+        Contributor(user=user, project=project,
+                    permission='manage' if i == 0 else 'edit',
+                    role='AUTHOR' if i == 0 else 'COLLABORATOR')
+        for i, user in enumerate(users[:max(contributors, 1)])])
+    return project.id, users
+
+
+def previous_create_issue(project, **data):
+    """The create path of IssueSerializer before it was one transaction"""
+    if data['assignee'] not in project.contributors.all():
+        contributor = Contributor.objects.create(
+            user=data['assignee'], project=project, permission='edit',
+            role='COLLABORATOR')
+        contributor.save()
+    return Issue.objects.create(project=project, **data)
+
+
+CREATE_FUNCTIONS = {
+    'previous': previous_create_issue,
+    'coalesced': create_issue,
+}
+
+
+def run_create_path(path, threads=8, operations=50, contributors=100,
+                    outsiders=50, profile='configured'):
+    """
+    `threads` threads create `operations` issues each with the create path,
+    returns its results.
+    """
+    create = CREATE_FUNCTIONS[path]
+    with default_database(profile):
+        project_id, users = seed_create_benchmark(contributors, outsiders)
+        connections[DEFAULT_DB_ALIAS].close()
+        latencies = []
+        queries = []
+        errors = {}
+        lock = threading.Lock()
+        start_line = threading.Barrier(threads + 1)
+
+        def worker(seed):
+            rng = random.Random(seed)
+            done, counted, failed = [], [], {}
+            connection = connections[DEFAULT_DB_ALIAS]
+            start_line.wait()
+            for number in range(operations):
+                assignee = rng.choice(users)
+                start = time.perf_counter()
+                try:
+                    with CaptureQueriesContext(connection) as captured:
+                        # like a request: the project is loaded first
+                        project = Project.objects.get(pk=project_id)
+                        create(project, title=f'issue {number}',
+                               description='description', tag='BUG',
+                               priority='LOW', status='To-Do',
+                               author=users[0], assignee=assignee)
+                except (IntegrityError, OperationalError) as error:
+                    name = type(error).__name__
+                    failed[name] = failed.get(name, 0) + 1
+                else:
+                    done.append(time.perf_counter() - start)
+                    counted.append(len(captured))
+                connection.close_if_unusable_or_obsolete()
+            connection.close()
+            with lock:
+                latencies.extend(done)
+                queries.extend(counted)
+                for name, count in failed.items():
+                    errors[name] = errors.get(name, 0) + count
+
+        workers = [threading.Thread(target=worker, args=(i,))
+                   for i in range(threads)]
+        for thread in workers:
+            thread.start()
+        start_line.wait()
+        start = time.perf_counter()
+        for thread in workers:
+            thread.join()
+        seconds = time.perf_counter() - start
+        issues = Issue.objects.count()
+        enrolled = Contributor.objects.count() - max(contributors, 1)
+        connections[DEFAULT_DB_ALIAS].close()
+
+    return {
+        'seconds': round(seconds, 3),
+        'issues_per_second': round(issues / seconds, 1),
+        'issues': issues,
+        'enrolled': enrolled,
+        'errors': errors,
+        'queries_per_issue': round(sum(queries) / len(queries), 1)
+        if queries else None,
+        'create': latency_summary(latencies),
+    }
+
+
+def run_create_benchmark(paths=CREATE_PATHS, **options):
+    return {path: run_create_path(path, **options) for path in paths}
@@ -0,0 +1,107 @@
+"""
+Denormalized issue and comment counters.
+
+Every Project counts its issues, its comments and its issues by status,
+priority and tag, every Issue counts its comments. The receivers in
+api/signals.py move the counters in the transaction of the save / delete
+(bulk_create_issues does it itself), rebuild_counters() recounts them from
+the issue and comment tables, e.g. after raw imports.
+"""
+from django.apps import apps as django_apps
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+# Issue field -> {value: Project counter}
+ISSUE_COUNTERS = {
+    'status': {
+        'To-Do': 'todo_count',
+        'In-Progress': 'in_progress_count',
+        'Completed': 'completed_count',
+    },
+    'priority': {
+        'LOW': 'low_priority_count',
+        'MEDIUM': 'medium_priority_count',
+        'HIGH': 'high_priority_count',
+    },
+    'tag': {
+        'BUG': 'bug_count',
+        'ENHANCEMENT': 'enhancement_count',
+        'TASK': 'task_count',
+    },
+}
+PROJECT_COUNTERS = ['issue_count', 'comment_count'] + [
+    counter for counters in ISSUE_COUNTERS.values()
+    for counter in counters.values()]
+COUNTED_FIELDS = ('project_id', *ISSUE_COUNTERS)
+
+
+def issue_counters(values, sign=1):
+    """The Project counters of one issue (an Issue or a dict), times sign"""
+    if not isinstance(values, dict):
+        values = {field: getattr(values, field) for field in COUNTED_FIELDS}
+    counters = {'issue_count': sign}
+    for field, choices in ISSUE_COUNTERS.items():
+        counter = choices.get(values[field])
+        if counter is not None:
+            counters[counter] = sign
+    return counters
+
+
+def add_counters(*counters):
+    total = {}
+    for counter in counters:
+        for field, delta in counter.items():
+            total[field] = total.get(field, 0) + delta
+    return {field: delta for field, delta in total.items() if delta}
+
+
+def project_stats(row):
+    """The stats of one project from its counters"""
+    return {
+        'issues': row['issue_count'],
+        'comments': row['comment_count'],
+        **{field: {value: row[counter] for value, counter in choices.items()}
+           for field, choices in ISSUE_COUNTERS.items()},
+    }
+
+
+def count(queryset, group_by):
+    """Correlated subquery that counts the rows of the queryset, 0 if none"""
+    return Coalesce(Subquery(
+        queryset.order_by().values(group_by).annotate(
+            count=Count('pk')).values('count')), Value(0))
+
+
+def rebuild_counters(project_ids=None, using=DEFAULT_DB_ALIAS,
+                     apps=django_apps):
+    """
+    Recounts the counters of the projects (all if None) and of their issues
+    with one UPDATE per table, returns the number of projects. apps are the
+    historical models in a migration.
+    """
+    Project = apps.get_model('api', 'Project')
+    Issue = apps.get_model('api', 'Issue')
+    Comment = apps.get_model('api', 'Comment')
+    projects = Project.objects.using(using)
+    issues = Issue.objects.using(using)
+    if project_ids is not None:
+        projects = projects.filter(pk__in=project_ids)
+        issues = issues.filter(project_id__in=project_ids)
+
+    project_issues = Issue.objects.filter(project=OuterRef('pk'))
+    counters = {
+        'issue_count': count(project_issues, 'project'),
+        'comment_count': count(
+            Comment.objects.filter(issue__project=OuterRef('pk')),
+            'issue__project'),
+    }
+    for field, choices in ISSUE_COUNTERS.items():
+        for value, counter in choices.items():
+            counters[counter] = count(
+                project_issues.filter(**{field: value}), 'project')
+
+    with transaction.atomic(using=using):
+        issues.update(comment_count=count(
+            Comment.objects.filter(issue=OuterRef('pk')), 'issue'))
+        return projects.update(**counters)
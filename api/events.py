@@ -0,0 +1,133 @@
+"""
+Event log of the project trees for incremental sync.
+
+Every write of a Project, Contributor, Issue or Comment appends an Event
+(api/signals.py, the bulk paths in api/bulk.py record theirs themselves)
+with the fields of the object after the change. /projects/{pk}/changes/
+returns the events after a cursor (the id of the last event the client
+has), so clients fetch what changed instead of the whole tree.
+
+A client starts by asking for the current cursor (no ?since=), then loads
+the tree and from then on polls with ?since=. Deleting an issue deletes
+its comments without events of their own. compact_events() removes the
+events older than EVENT_LOG['RETENTION_DAYS'] and remembers the last
+removed id per project, a client with an older cursor gets 410 Gone and
+loads the tree again.
+
+The ids are a valid cursor because the writes of SQLite are serialized
+(BEGIN IMMEDIATE), ids are handed out in commit order.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.dispatch import Signal
+from django.utils import timezone
+
+from api.counters import PROJECT_COUNTERS
+from api.models import Event, Project
+
+EVENT_LOG_DEFAULTS = {
+    'RETENTION_DAYS': 30,
+    'PAGE_SIZE': 500,
+}
+
+# sent with the new events, e.g. for the live updates of api/live.py
+events_recorded = Signal()
+
+# bookkeeping fields that are not part of the events
+EXCLUDED_FIELDS = {'id', 'version', 'updated_time', 'compacted_event_id',
+                   *PROJECT_COUNTERS}
+
+
+def event_log_options():
+    return {**EVENT_LOG_DEFAULTS, **getattr(settings, 'EVENT_LOG', {})}
+
+
+def event_data(instance):
+    """The concrete fields of the instance by attname (author_id, ...)"""
+    return {field.attname: field.value_from_object(instance)
+            for field in instance._meta.concrete_fields
+            if field.attname not in EXCLUDED_FIELDS}
+
+
+def project_id_of(instance):
+    if isinstance(instance, Project):
+        return instance.pk
+    if hasattr(instance, 'project_id'):
+        return instance.project_id
+    # a Comment, one query unless the issue is loaded already
+    return instance.issue.project_id
+
+
+def new_event(instance, action, project_id=None):
+    return Event(
+        project_id=project_id or project_id_of(instance),
+        model=instance._meta.model_name, object_id=instance.pk,
+        action=action,
+        data=event_data(instance) if action != 'deleted' else {})
+
+
+def record_event(instance, action):
+    event = new_event(instance, action)
+    event.save()
+    events_recorded.send(sender=Event, events=[event])
+    return event
+
+
+def record_events(instances, action, project_id):
+    """One insert for the events of a bulk write to one project"""
+    events = Event.objects.bulk_create(
+        [new_event(instance, action, project_id) for instance in instances])
+    events_recorded.send(sender=Event, events=events)
+    return events
+
+
+def serialize_event(event):
+    return {'cursor': event.id, 'model': event.model,
+            'id': event.object_id, 'action': event.action,
+            'data': event.data, 'time': event.created_time}
+
+
+def project_changes(project, since=None, limit=None):
+    """
+    The events of the project after the cursor `since` as
+    {'events', 'cursor', 'has_more'}, only the current cursor if since is
+    None. Returns None if the events after `since` were compacted away.
+    """
+    if limit is None:
+        limit = event_log_options()['PAGE_SIZE']
+    events = Event.objects.filter(project=project).order_by('-id')
+    if since is None:
+        last = events.values_list('id', flat=True).first()
+        return {'events': [], 'cursor': last or project.compacted_event_id,
+                'has_more': False}
+    if since < project.compacted_event_id:
+        return None
+    page = list(events.filter(id__gt=since).order_by('id')[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    return {'events': [serialize_event(event) for event in page],
+            'cursor': page[-1].id if page else since,
+            'has_more': has_more}
+
+
+def compact_events(days=None, now=None):
+    """
+    Deletes the events older than `days` (EVENT_LOG['RETENTION_DAYS']) and
+    moves compacted_event_id of their projects, returns the number of
+    deleted events.
+    """
+    if days is None:
+        days = event_log_options()['RETENTION_DAYS']
+    cutoff = (now or timezone.now()) - timedelta(days=days)
+    old = Event.objects.filter(created_time__lt=cutoff)
+    with transaction.atomic():
+        last_removed = old.filter(project=OuterRef('pk')).order_by().values(
+            'project').annotate(last=Max('id')).values('last')
+        Project.objects.filter(
+            pk__in=old.values('project')).update(
+            compacted_event_id=Subquery(last_removed))
+        deleted, _ = old.delete()
+    return deleted
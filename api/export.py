@@ -0,0 +1,120 @@
+import csv
+import json
+from collections import defaultdict
+from itertools import islice
+
+from api.models import Comment, Issue
+
+EXPORT_CHUNK_SIZE = 500
+
+# content types of the export formats
+EXPORT_FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+
+ISSUE_FIELDS = ('id', 'title', 'description', 'tag', 'priority',
+                'project_id', 'status', 'author_id', 'assignee_id',
+                'created_time')
+COMMENT_FIELDS = ('id', 'description', 'author_id', 'issue_id',
+                  'created_time')
+CSV_HEADER = ('record', 'issue_id', 'comment_id', 'title', 'description',
+              'tag', 'priority', 'status', 'author_user_id',
+              'assignee_user_id', 'created_time')
+
+
+def format_datetime(value):
+    """Same ISO 8601 representation as the DateTimeFields of the API"""
+    value = value.isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+def issue_record(row):
+    return {
+        'issue_id': row['id'],
+        'title': row['title'],
+        'description': row['description'],
+        'tag': row['tag'],
+        'priority': row['priority'],
+        'project_id': row['project_id'],
+        'status': row['status'],
+        'author_user_id': row['author_id'],
+        'assignee_user_id': row['assignee_id'],
+        'created_time': format_datetime(row['created_time']),
+    }
+
+
+def comment_record(row):
+    return {
+        'comment_id': row['id'],
+        'description': row['description'],
+        'author_user_id': row['author_id'],
+        'issue_id': row['issue_id'],
+        'created_time': format_datetime(row['created_time']),
+    }
+
+
+def iter_issues_with_comments(project_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Yields (issue, comments) of the project in (created_time, id) order.
+    The issues are read with a server-side iterator and the comments are
+    loaded with one query per chunk of issues, so only one chunk is held in
+    memory at any time.
+    """
+    issues = Issue.objects.filter(project_id=project_id).order_by(
+        'created_time', 'id').values(*ISSUE_FIELDS).iterator(
+        chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(issues, chunk_size))
+        if not chunk:
+            return
+        comments = defaultdict(list)
+        rows = Comment.objects.filter(
+            issue_id__in=[issue['id'] for issue in chunk]).order_by(
+            'created_time', 'id').values(*COMMENT_FIELDS).iterator(
+            chunk_size=chunk_size)
+        for row in rows:
+            comments[row['issue_id']].append(comment_record(row))
+        for issue in chunk:
+            yield issue_record(issue), comments.pop(issue['id'], [])
+
+
+def export_ndjson(project_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """One JSON line per issue, with its comments embedded."""
+    for issue, comments in iter_issues_with_comments(project_id, chunk_size):
+        issue['comments'] = comments
+        yield json.dumps(issue) + '\n'
+
+
+class Echo:
+    """Pseudo-buffer for csv.writer that returns the written line."""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(project_id, chunk_size=EXPORT_CHUNK_SIZE):
+    """One row per issue, followed by one row per comment of the issue."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER)
+    for issue, comments in iter_issues_with_comments(project_id, chunk_size):
+        yield writer.writerow((
+            'issue', issue['issue_id'], '', issue['title'],
+            issue['description'], issue['tag'], issue['priority'],
+            issue['status'], issue['author_user_id'],
+            issue['assignee_user_id'], issue['created_time']))
+        for comment in comments:
+            yield writer.writerow((
+                'comment', comment['issue_id'], comment['comment_id'], '',
+                comment['description'], '', '', '',
+                comment['author_user_id'], '', comment['created_time']))
+
+
+def export_project(project_id, export_format='ndjson',
+                   chunk_size=EXPORT_CHUNK_SIZE):
+    """Generator of the text chunks of the project export."""
+    if export_format == 'csv':
+        return export_csv(project_id, chunk_size)
+    return export_ndjson(project_id, chunk_size)
@@ -0,0 +1,89 @@
+from datetime import datetime, time
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import BaseFilterBackend, OrderingFilter
+
+from api.models import Issue
+from api.search import search_issues
+
+
+class IssueFilterBackend(BaseFilterBackend):
+    """
+    Server-side filtering of the issues of a project.
+    ?status=, ?priority= and ?tag= take one or more comma separated choices,
+    ?assignee= a user id or email, ?created_after= / ?created_before= an
+    ISO 8601 date or datetime and ?q= runs a full-text search over title and
+    description.
+    """
+    choice_filters = {
+        'status': Issue.STATS,
+        'priority': Issue.PRIORITIES,
+        'tag': Issue.TAGS,
+    }
+
+    def filter_queryset(self, request, queryset, view):
+        params = request.query_params
+        for name, choices in self.choice_filters.items():
+            if name in params:
+                queryset = queryset.filter(**{
+                    f'{name}__in': self.parse_choices(name, params[name],
+                                                      choices)})
+
+        assignee = params.get('assignee')
+        if assignee:
+            if assignee.isdigit():
+                queryset = queryset.filter(assignee_id=assignee)
+            else:
+                queryset = queryset.filter(assignee__email=assignee)
+
+        if 'created_after' in params:
+            queryset = queryset.filter(created_time__gte=self.parse_time(
+                'created_after', params['created_after']))
+        if 'created_before' in params:
+            queryset = queryset.filter(created_time__lt=self.parse_time(
+                'created_before', params['created_before']))
+
+        if 'q' in params:
+            queryset = search_issues(queryset, params['q'])
+        return queryset
+
+    @staticmethod
+    def parse_choices(name, value, choices):
+        values = [part.strip() for part in value.split(',') if part.strip()]
+        allowed = [choice for choice, _ in choices]
+        invalid = [part for part in values if part not in allowed]
+        if invalid:
+            raise ValidationError({name: [
+                f'"{part}" is not a valid choice.' for part in invalid]})
+        return values
+
+    @staticmethod
+    def parse_time(name, value):
+        try:
+            parsed = parse_datetime(value) or parse_date(value)
+        except ValueError:
+            parsed = None
+        if parsed is None:
+            raise ValidationError({name: [
+                'Expected an ISO 8601 date or datetime.']})
+        if not isinstance(parsed, datetime):
+            parsed = datetime.combine(parsed, time.min)
+        if timezone.is_naive(parsed):
+            parsed = timezone.make_aware(parsed)
+        return parsed
+
+
+class IssueOrderingFilter(OrderingFilter):
+    """
+    ?ordering= with the id as last ordering field, so that issues with the
+    same value keep a stable order over the pages.
+    Keyset pagination always uses its own (created_time, id) ordering.
+    """
+
+    def get_ordering(self, request, queryset, view):
+        ordering = super().get_ordering(request, queryset, view)
+        if ordering and not {'id', '-id'} & set(ordering):
+            ordering = [*ordering, 'id']
+        return ordering
@@ -0,0 +1,283 @@
+"""
+Per-request SQL and timing instrumentation.
+
+RequestMetricsMiddleware records for every request the number of queries,
+the repeated queries, the database time and, through RequestMetricsMixin
+on the DRF views, the authentication, permission-check and serializer
+time. It does not depend on DEBUG / connection.queries: every database
+connection gets a QueryRecorder execute wrapper when it is opened (see
+ApiConfig.ready), which reports to the metrics of the current request.
+
+The numbers are sent as Server-Timing header and counted for /metrics
+(api/metrics.py). Requests that are slower than
+REQUEST_METRICS['SLOW_REQUEST_MS'] are logged to the 'api.requests' logger
+as JSON, together with the repeated query patterns and the lines of code
+that sent them.
+"""
+import asyncio
+import contextvars
+import json
+import logging
+import sys
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.utils.deprecation import MiddlewareMixin
+
+from api.metrics import observe_request
+
+logger = logging.getLogger('api.requests')
+
+REQUEST_METRICS_DEFAULTS = {
+    'SERVER_TIMING': True,
+    'SLOW_REQUEST_MS': 500,
+    # a statement that runs this often in one request is reported
+    'DUPLICATE_QUERY_THRESHOLD': 3,
+    'LOCATE_QUERIES': True,
+}
+
+current_metrics = contextvars.ContextVar('request_metrics', default=None)
+
+
+def metrics_options():
+    return {**REQUEST_METRICS_DEFAULTS,
+            **getattr(settings, 'REQUEST_METRICS', {})}
+
+
+def query_location(depth=3):
+    """
+    'file.py:line in function' of the project code that sent a query, with
+    up to `depth` of its callers: 'models.py:48 in save < views.py:12 in ...'
+    """
+    root = str(settings.BASE_DIR)
+    frames = []
+    frame = sys._getframe(2)
+    while frame is not None and len(frames) < depth:
+        filename = frame.f_code.co_filename
+        if (filename.startswith(root) and filename != __file__
+                and 'site-packages' not in filename):
+            frames.append(f'{filename[len(root) + 1:]}:{frame.f_lineno} '
+                          f'in {frame.f_code.co_name}')
+        frame = frame.f_back
+    return ' < '.join(frames) or None
+
+
+class RequestMetrics:
+    """Queries and timings of one request."""
+
+    def __init__(self, locate_queries=True):
+        self.start = time.perf_counter()
+        self.locate_queries = locate_queries
+        self.queries = 0
+        self.db_time = 0.0
+        # sql -> [count, {(params): count}, {locations}]
+        self.statements = {}
+        self.timings = {}
+        self._running = set()
+
+    def add_query(self, sql, params, duration, many=False):
+        self.queries += 1
+        self.db_time += duration
+        statement = self.statements.setdefault(sql, [0, {}, set()])
+        statement[0] += 1
+        key = repr(params) if not many else None
+        statement[1][key] = statement[1].get(key, 0) + 1
+        if self.locate_queries:
+            location = query_location()
+            if location:
+                statement[2].add(location)
+
+    @contextmanager
+    def timer(self, name):
+        """Adds the time of the block to `name`, nested blocks count once"""
+        if name in self._running:
+            yield
+            return
+        self._running.add(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = (self.timings.get(name, 0.0)
+                                  + time.perf_counter() - start)
+            self._running.discard(name)
+
+    @property
+    def duration(self):
+        return time.perf_counter() - self.start
+
+    @property
+    def duplicate_queries(self):
+        """Queries that repeated an earlier query with the same parameters"""
+        return sum(count - 1 for _, by_params, _ in self.statements.values()
+                   for key, count in by_params.items() if key is not None)
+
+    def repeated_statements(self, threshold):
+        """The statements that ran at least `threshold` times, most first"""
+        repeated = [
+            {'sql': sql, 'count': count,
+             'same_params': max(by_params.values()),
+             'locations': sorted(locations)}
+            for sql, (count, by_params, locations) in self.statements.items()
+            if count >= threshold]
+        return sorted(repeated, key=lambda item: -item['count'])
+
+    def server_timing(self):
+        parts = [f'db;dur={self.db_time * 1000:.2f};'
+                 f'desc="{self.queries} queries, '
+                 f'{self.duplicate_queries} duplicates"']
+        for name, duration in self.timings.items():
+            parts.append(f'{name};dur={duration * 1000:.2f}')
+        parts.append(f'total;dur={self.duration * 1000:.2f}')
+        return ', '.join(parts)
+
+    def as_dict(self, threshold):
+        return {
+            'duration_ms': round(self.duration * 1000, 2),
+            'queries': self.queries,
+            'duplicate_queries': self.duplicate_queries,
+            'db_ms': round(self.db_time * 1000, 2),
+            **{f'{name}_ms': round(duration * 1000, 2)
+               for name, duration in self.timings.items()},
+            'repeated': self.repeated_statements(threshold),
+        }
+
+
+class QueryRecorder:
+    """
+    Execute wrapper that reports every query to the metrics of the current
+    request, a no-op outside of requests.
+    """
+
+    def __call__(self, execute, sql, params, many, context):
+        metrics = current_metrics.get()
+        if metrics is None:
+            return execute(sql, params, many, context)
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            metrics.add_query(sql, params, time.perf_counter() - start, many)
+
+
+query_recorder = QueryRecorder()
+
+
+def install_query_recorder(connection, **kwargs):
+    """
+    connection_created receiver. The recorder goes first, so it also times
+    the other wrappers and a later execute_wrapper() block pops its own.
+    """
+    if query_recorder not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, query_recorder)
+
+
+def view_labels(request):
+    """
+    (url name, view, action) of the request, e.g. ('issue-list',
+    'IssueViewSet', 'list'). The action of views that are not viewsets
+    is the lower case method.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return ('unmatched', 'unmatched', request.method.lower())
+    func = match.func
+    view = getattr(getattr(func, 'cls', None), '__name__', None)
+    actions = getattr(func, 'actions', None) or {}
+    return (match.url_name or match.view_name,
+            view or getattr(func, '__name__', 'unknown'),
+            actions.get(request.method.lower(), request.method.lower()))
+
+
+@contextmanager
+def timer(name):
+    """Times the block for the metrics of the current request, if any"""
+    metrics = current_metrics.get()
+    if metrics is None:
+        yield
+    else:
+        with metrics.timer(name):
+            yield
+
+
+class RequestMetricsMiddleware(MiddlewareMixin):
+    """
+    Collects the RequestMetrics of every request, adds the Server-Timing
+    header and logs slow requests.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        options = metrics_options()
+        metrics = RequestMetrics(options['LOCATE_QUERIES'])
+        token = current_metrics.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics, options)
+
+    async def __acall__(self, request):
+        options = metrics_options()
+        metrics = RequestMetrics(options['LOCATE_QUERIES'])
+        token = current_metrics.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        return self.finish(request, response, metrics, options)
+
+    def finish(self, request, response, metrics, options):
+        request.metrics = metrics
+        labels = view_labels(request)
+        observe_request(labels, request.method, response.status_code,
+                        metrics.duration, metrics.queries, metrics.db_time)
+        if options['SERVER_TIMING']:
+            response['Server-Timing'] = metrics.server_timing()
+
+        threshold = options['DUPLICATE_QUERY_THRESHOLD']
+        slow = metrics.duration * 1000 >= options['SLOW_REQUEST_MS']
+        repeated = metrics.repeated_statements(threshold)
+        if slow or repeated:
+            record = {
+                'event': 'slow_request' if slow else 'repeated_queries',
+                'method': request.method,
+                'path': request.get_full_path(),
+                'status': response.status_code,
+                'view': '.'.join(labels[1:]),
+                **metrics.as_dict(threshold),
+            }
+            logger.warning(json.dumps(record), extra={'metrics': record})
+        return response
+
+
+class RequestMetricsMixin:
+    """
+    DRF view mixin that adds the authentication, permission-check and
+    serializer time to the metrics of the request.
+    """
+
+    def perform_authentication(self, request):
+        with timer('auth'):
+            super().perform_authentication(request)
+
+    def check_permissions(self, request):
+        with timer('permissions'):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with timer('permissions'):
+            super().check_object_permissions(request, obj)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        to_representation = serializer.to_representation
+
+        def timed_to_representation(*args, **kwargs):
+            with timer('serializer'):
+                return to_representation(*args, **kwargs)
+
+        serializer.to_representation = timed_to_representation
+        return serializer
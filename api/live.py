@@ -0,0 +1,456 @@
+"""
+Live issue and comment updates over Server-Sent Events or long polling.
+
+GET /live/projects/{pk}/ is answered by LiveUpdatesMiddleware in front of
+the Django ASGI application (Django 4.0 cannot stream from async code) and
+holds no thread while it waits. The access token comes from the
+Authorization header. EventSource cannot send headers, its clients first
+POST /live/projects/{pk}/tickets/ with the header and connect with the
+?ticket= of the answer. A ticket is valid once and for TICKET_TIMEOUT
+seconds, unlike an access token in the URL it is worthless in access logs.
+
+The events of api/events.py are published when their transaction commits
+to the pub/sub of LIVE_UPDATES['PUBSUB'], which hands every message to the
+Broker of every worker. The broker fans them out to the subscriptions of
+the project in this worker. LocalPubSub is the in-process stand-in for a
+pub/sub server such as Redis, several brokers attached to it behave like
+the workers of one deployment.
+
+Every SSE message has the event cursor as id. A reconnecting EventSource
+sends it back as Last-Event-ID (or the client sends ?since=) and the
+events it missed are replayed from the event log first, so dropping a
+connection never loses an update:
+- a subscription that falls QUEUE_SIZE messages behind is closed with an
+  'overflow' event, the client reconnects and catches up from the log,
+- a connection without any update for IDLE_TIMEOUT seconds is closed,
+  HEARTBEAT keeps it alive through proxies until then,
+- the membership of the user is checked again every HEARTBEAT seconds, a
+  contributor who was removed gets a 'revoked' event and is disconnected,
+- more than MAX_SUBSCRIBERS connections per worker are answered with 503.
+
+?mode=poll answers with the JSON of /projects/{pk}/changes/ instead, as
+soon as there are events after ?since= or after POLL_TIMEOUT seconds.
+"""
+import asyncio
+import io
+import json
+import re
+import secrets
+import threading
+import time
+from collections import deque
+from urllib.parse import parse_qs
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework import exceptions, status
+
+from api.async_views import authenticate, check_contributor
+from api.events import events_recorded, project_changes, serialize_event
+from api.models import Project
+
+LIVE_UPDATES_DEFAULTS = {
+    'PUBSUB': 'api.live.LocalPubSub',
+    'MODELS': ['issue', 'comment'],
+    'QUEUE_SIZE': 100,
+    'HEARTBEAT': 15,
+    'IDLE_TIMEOUT': 300,
+    'MAX_SUBSCRIBERS': 1000,
+    'POLL_TIMEOUT': 25,
+    'TICKET_TIMEOUT': 30,
+    'TICKET_CACHE': 'default',
+}
+
+LIVE_PATH = re.compile(r'^/live/projects/(?P<pk>\d+)/(?P<tickets>tickets/)?$')
+
+
+def live_options():
+    return {**LIVE_UPDATES_DEFAULTS, **getattr(settings, 'LIVE_UPDATES', {})}
+
+
+class TooManySubscribers(exceptions.APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many live connections, try again later.'
+    default_code = 'too_many_subscribers'
+
+
+class LocalPubSub:
+    """Delivers every published message to every attached callback."""
+
+    def __init__(self):
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def attach(self, callback):
+        with self._lock:
+            self._callbacks.append(callback)
+
+    def detach(self, callback):
+        with self._lock:
+            self._callbacks.remove(callback)
+
+    def publish(self, messages):
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            callback(messages)
+
+
+class Subscription:
+    """The messages of a project for one connection, on its event loop."""
+
+    def __init__(self, project_id, size):
+        self.project_id = project_id
+        self.size = size
+        self.loop = asyncio.get_running_loop()
+        self.pending = deque()
+        self.overflowed = False
+        self.closed = False
+        self._wakeup = asyncio.Event()
+
+    def deliver(self, message):
+        if self.closed:
+            return
+        if len(self.pending) >= self.size:
+            self.overflowed = True
+        else:
+            self.pending.append(message)
+        self._wakeup.set()
+
+    def close(self):
+        self.closed = True
+        self._wakeup.set()
+
+    async def get(self, timeout):
+        """The pending messages, waits up to `timeout` seconds for one"""
+        if not (self.pending or self.overflowed or self.closed):
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        messages = list(self.pending)
+        self.pending.clear()
+        return messages
+
+
+class Broker:
+    """Fans the messages of the pub/sub out to the local subscriptions."""
+
+    def __init__(self, pubsub):
+        self.pubsub = pubsub
+        self._subscriptions = {}
+        self._count = 0
+        self._lock = threading.Lock()
+        pubsub.attach(self.receive)
+
+    def subscribe(self, project_id):
+        options = live_options()
+        with self._lock:
+            if self._count >= options['MAX_SUBSCRIBERS']:
+                raise TooManySubscribers()
+            subscription = Subscription(project_id, options['QUEUE_SIZE'])
+            self._subscriptions.setdefault(project_id, set()).add(
+                subscription)
+            self._count += 1
+        return subscription
+
+    def unsubscribe(self, subscription):
+        subscription.close()
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.project_id)
+            if subscriptions and subscription in subscriptions:
+                subscriptions.discard(subscription)
+                self._count -= 1
+                if not subscriptions:
+                    del self._subscriptions[subscription.project_id]
+
+    @property
+    def subscribers(self):
+        return self._count
+
+    def publish(self, messages):
+        self.pubsub.publish(messages)
+
+    def receive(self, messages):
+        """Called by the pub/sub, from any thread"""
+        for message in messages:
+            with self._lock:
+                subscriptions = list(
+                    self._subscriptions.get(message['project'], ()))
+            for subscription in subscriptions:
+                try:
+                    subscription.loop.call_soon_threadsafe(
+                        subscription.deliver, message)
+                except RuntimeError:
+                    # the loop of the connection is closed
+                    self.unsubscribe(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = Broker(import_string(live_options()['PUBSUB'])())
+        return _broker
+
+
+def event_message(event):
+    """The pub/sub message of an Event, JSON encoded once"""
+    return {
+        'project': event.project_id,
+        'cursor': event.id,
+        'type': f'{event.model}.{event.action}',
+        'event': json.dumps(serialize_event(event), cls=DjangoJSONEncoder),
+    }
+
+
+@receiver(events_recorded)
+def publish_on_commit(sender, events, **kwargs):
+    models = live_options()['MODELS']
+    messages = [event_message(event) for event in events
+                if event.model in models]
+    if messages:
+        transaction.on_commit(lambda: get_broker().publish(messages))
+
+
+def ticket_key(ticket):
+    return f'live-ticket:{ticket}'
+
+
+def issue_ticket(user, project_id):
+    """A new stream ticket of the user for the project"""
+    options = live_options()
+    ticket = secrets.token_urlsafe(32)
+    caches[options['TICKET_CACHE']].set(
+        ticket_key(ticket), (user.pk, project_id), options['TICKET_TIMEOUT'])
+    return ticket
+
+
+def redeem_ticket(ticket, project_id):
+    """
+    The active user of the ticket, None if it is unknown, expired, used or
+    for another project. Of two connections with one ticket only the one
+    that deletes it gets the user.
+    """
+    cache = caches[live_options()['TICKET_CACHE']]
+    key = ticket_key(ticket)
+    value = cache.get(key)
+    if value is None or not cache.delete(key) or value[1] != project_id:
+        return None
+    return get_user_model().objects.filter(
+        pk=value[0], is_active=True).first()
+
+
+def sse(message):
+    return (f'id: {message["cursor"]}\nevent: {message["type"]}\n'
+            f'data: {message["event"]}\n\n').encode()
+
+
+def replay(project_id, since):
+    """
+    The messages of the events after `since` from the event log, None if
+    they were compacted.
+    """
+    project = Project.objects.get(pk=project_id)
+    models = live_options()['MODELS']
+    messages = []
+    while True:
+        changes = project_changes(project, since)
+        if changes is None:
+            return None
+        for event in changes['events']:
+            if event['model'] in models:
+                messages.append({
+                    'project': project_id, 'cursor': event['cursor'],
+                    'type': f'{event["model"]}.{event["action"]}',
+                    'event': json.dumps(event, cls=DjangoJSONEncoder)})
+        since = changes['cursor']
+        if not changes['has_more']:
+            return messages
+
+
+def current_cursor(project_id):
+    project = Project.objects.get(pk=project_id)
+    return project_changes(project)['cursor']
+
+
+async def send_json(send, data, status_code=200, headers=()):
+    await send({
+        'type': 'http.response.start', 'status': status_code,
+        'headers': [(b'content-type', b'application/json'), *headers]})
+    await send({'type': 'http.response.body',
+                'body': json.dumps(data, cls=DjangoJSONEncoder).encode()})
+
+
+class LiveUpdatesMiddleware:
+    """ASGI middleware that answers /live/projects/{pk}/ itself."""
+
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        match = (LIVE_PATH.match(scope['path'])
+                 if scope['type'] == 'http' else None)
+        if match is None:
+            return await self.application(scope, receive, send)
+        method = 'POST' if match['tickets'] else 'GET'
+        if scope['method'] != method:
+            return await send_json(
+                send, {'detail': f'Method "{scope["method"]}" not allowed.'},
+                status.HTTP_405_METHOD_NOT_ALLOWED)
+        if match['tickets']:
+            await create_ticket(scope, send, int(match['pk']))
+        else:
+            await live_updates(scope, receive, send, int(match['pk']))
+
+
+def cursor_param(value):
+    if value is None:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise exceptions.ParseError('since must be an integer.')
+
+
+async def create_ticket(scope, send, project_id):
+    """POST /live/projects/{pk}/tickets/ of a contributor"""
+    request = ASGIRequest(scope, io.BytesIO())
+    try:
+        user = (await sync_to_async(authenticate)(request)).user
+        await check_contributor(user, project_id)
+    except exceptions.APIException as exc:
+        return await send_json(send, {'detail': exc.detail}, exc.status_code)
+    ticket = await sync_to_async(issue_ticket)(user, project_id)
+    await send_json(send, {
+        'ticket': ticket, 'expires_in': live_options()['TICKET_TIMEOUT']},
+        status.HTTP_201_CREATED)
+
+
+async def live_updates(scope, receive, send, project_id):
+    request = ASGIRequest(scope, io.BytesIO())
+    broker = get_broker()
+    try:
+        if 'ticket' in request.GET:
+            user = await sync_to_async(redeem_ticket)(
+                request.GET['ticket'], project_id)
+            if user is None:
+                raise exceptions.AuthenticationFailed(
+                    'Invalid or expired ticket.')
+        else:
+            user = (await sync_to_async(authenticate)(request)).user
+        await check_contributor(user, project_id)
+        since = cursor_param(request.META.get('HTTP_LAST_EVENT_ID')
+                             or request.GET.get('since'))
+        subscription = broker.subscribe(project_id)
+    except exceptions.APIException as exc:
+        headers = [(b'retry-after', b'10')] if isinstance(
+            exc, TooManySubscribers) else []
+        return await send_json(send, {'detail': exc.detail},
+                               exc.status_code, headers)
+
+    try:
+        # subscribed before the replay, nothing falls in between
+        if since is None:
+            since = await sync_to_async(current_cursor)(project_id)
+            missed = []
+        else:
+            missed = await sync_to_async(replay)(project_id, since)
+        if missed is None:
+            return await send_json(
+                send, {'detail': 'The events after this cursor were '
+                                 'compacted, load the project again.'},
+                status.HTTP_410_GONE)
+        if parse_qs(scope.get('query_string', b'').decode()).get(
+                'mode') == ['poll']:
+            await long_poll(send, subscription, since, missed)
+        else:
+            await stream(receive, send, subscription, since, missed, user)
+    finally:
+        broker.unsubscribe(subscription)
+
+
+async def long_poll(send, subscription, since, messages):
+    if not messages:
+        messages = [message for message in await subscription.get(
+            live_options()['POLL_TIMEOUT']) if message['cursor'] > since]
+    await send_json(send, {
+        'events': [json.loads(message['event']) for message in messages],
+        'cursor': messages[-1]['cursor'] if messages else since,
+        'has_more': subscription.overflowed})
+
+
+async def is_member(user, project_id):
+    try:
+        await check_contributor(user, project_id)
+    except exceptions.APIException:
+        return False
+    return True
+
+
+async def stream(receive, send, subscription, since, missed, user):
+    options = live_options()
+    await send({'type': 'http.response.start', 'status': 200, 'headers': [
+        (b'content-type', b'text/event-stream'),
+        (b'cache-control', b'no-cache'),
+        (b'x-accel-buffering', b'no'),
+    ]})
+
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        subscription.close()
+
+    watcher = asyncio.ensure_future(watch_disconnect())
+    try:
+        await send({'type': 'http.response.body', 'more_body': True,
+                    'body': b'retry: 3000\n\n'
+                            + b''.join(sse(message) for message in missed)})
+        cursor = missed[-1]['cursor'] if missed else since
+        last_update = last_check = time.monotonic()
+        body = b''
+        while not subscription.closed:
+            now = time.monotonic()
+            idle = now - last_update
+            if idle >= options['IDLE_TIMEOUT']:
+                body = b'event: timeout\ndata: {}\n\n'
+                break
+            if now - last_check >= options['HEARTBEAT']:
+                # the membership was checked when the stream opened only
+                if not await is_member(user, subscription.project_id):
+                    body = b'event: revoked\ndata: {}\n\n'
+                    break
+                last_check = now
+            messages = await subscription.get(
+                min(options['HEARTBEAT'], options['IDLE_TIMEOUT'] - idle))
+            if subscription.overflowed:
+                # the client reconnects with Last-Event-ID and catches up
+                body = b'event: overflow\ndata: {}\n\n'
+                break
+            messages = [message for message in messages
+                        if message['cursor'] > cursor]
+            if messages:
+                cursor = messages[-1]['cursor']
+                last_update = time.monotonic()
+                chunk = b''.join(sse(message) for message in messages)
+            elif subscription.closed:
+                break
+            else:
+                chunk = b': heartbeat\n\n'
+            await send({'type': 'http.response.body', 'body': chunk,
+                        'more_body': True})
+        await send({'type': 'http.response.body', 'body': body})
+    finally:
+        watcher.cancel()
@@ -0,0 +1,143 @@
+"""
+In-process load test of the ASGI application (SoftDesk_RESTful_API/asgi.py).
+
+Many concurrent clients are simulated on one event loop, every client is
+slow: it takes client_delay seconds to send its request and again to read
+the response. The database latency can be raised with db_latency, which
+sleeps in front of every query the way a remote database server would.
+The same reads are sent to the synchronous DRF viewsets and to the async
+endpoints of api/async_views.py, so both can be compared.
+"""
+import asyncio
+import itertools
+import time
+from urllib.parse import urlencode
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from api.benchmark import latency_summary
+from authentication.tokens import AccessToken
+
+# name: (sync path, async path), formatted with the seeded ids
+ROUTES = {
+    'project': ('/projects/{project}/', '/async/projects/{project}/'),
+    'issues': ('/projects/{project}/issues/',
+               '/async/projects/{project}/issues/'),
+    'comments': ('/projects/{project}/issues/{issue}/comments/',
+                 '/async/projects/{project}/issues/{issue}/comments/'),
+}
+
+
+class SimulatedLatency:
+    """
+    Sleeps `delay` seconds in front of every query, on the connections of
+    all threads, also the ones that are opened while it is installed.
+    """
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.delay)
+        return execute(sql, params, many, context)
+
+    def wrap(self, connection, **kwargs):
+        if self not in connection.execute_wrappers:
+            connection.execute_wrappers.append(self)
+
+    def __enter__(self):
+        if self.delay:
+            connection_created.connect(self.wrap)
+            for connection in connections.all():
+                self.wrap(connection)
+        return self
+
+    def __exit__(self, *exc_info):
+        connection_created.disconnect(self.wrap)
+        for connection in connections.all():
+            if self in connection.execute_wrappers:
+                connection.execute_wrappers.remove(self)
+
+
+async def slow_get(app, path, headers, client_delay):
+    """
+    Sends a GET through the ASGI app like a slow client and returns the
+    (status, seconds until the response was read).
+    """
+    path, _, query_string = path.partition('?')
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1',
+        'method': 'GET', 'scheme': 'http', 'path': path, 'raw_path':
+        path.encode(), 'query_string': query_string.encode(),
+        'root_path': '', 'headers': headers,
+        'client': ('127.0.0.1', 50000), 'server': ('testserver', 80),
+    }
+    response = {}
+
+    async def receive():
+        await asyncio.sleep(client_delay)
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        elif not message.get('more_body'):
+            await asyncio.sleep(client_delay)
+
+    start = time.perf_counter()
+    await app(scope, receive, send)
+    return response.get('status'), time.perf_counter() - start
+
+
+async def run_clients(app, path, headers, clients, requests, client_delay):
+    """
+    Sends `requests` GETs to the path with `clients` concurrent clients.
+    Every request has its own query string, so no response is served from
+    the response cache.
+    """
+    counter = itertools.count()
+    latencies, errors = [], 0
+
+    async def client():
+        nonlocal errors
+        while (number := next(counter)) < requests:
+            url = f'{path}?{urlencode({"nonce": number})}'
+            status, elapsed = await slow_get(app, url, headers, client_delay)
+            if status == 200:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(clients)))
+    duration = time.perf_counter() - start
+    return {
+        'requests': requests,
+        'errors': errors,
+        'seconds': round(duration, 4),
+        'requests_per_second': round(requests / duration, 2),
+        **latency_summary(latencies),
+    }
+
+
+def load_test(app, user, ids, routes=tuple(ROUTES), clients=100,
+              requests=1000, client_delay=0.05, db_latency=0.0):
+    """
+    Runs the load test of every route against its sync and its async
+    endpoint, returns the results keyed by route and endpoint.
+    """
+    headers = [
+        (b'host', b'testserver'),
+        (b'accept', b'application/json'),
+        (b'authorization', f'Bearer {AccessToken.for_user(user)}'.encode()),
+    ]
+    results = {}
+    with SimulatedLatency(db_latency):
+        for route in routes:
+            results[route] = {}
+            for mode, path in zip(('sync', 'async'), ROUTES[route]):
+                results[route][mode] = asyncio.run(run_clients(
+                    app, path.format(**ids), headers, clients, requests,
+                    client_delay))
+    return results
@@ -0,0 +1,111 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    override_settings, setup_test_environment, teardown_test_environment)
+
+from api.benchmark import (
+    ENDPOINTS,
+    SCALE_DEFAULTS,
+    benchmark_report,
+    compare_results,
+    run_benchmark,
+    run_serialization_benchmark,
+    seed,
+)
+from api.cache import process_caches
+
+
+class Command(BaseCommand):
+    help = ('Seeds a test database with synthetic data and benchmarks the '
+            'API endpoints in-process. Writes requests/s, latency '
+            'percentiles and queries per request of every endpoint as JSON.')
+
+    def add_arguments(self, parser):
+        for name, default in SCALE_DEFAULTS.items():
+            parser.add_argument(f'--{name}', type=int, default=default)
+        parser.add_argument('--requests', type=int, default=50,
+                            help='measured requests per endpoint')
+        parser.add_argument('--warmup', type=int, default=5,
+                            help='unmeasured requests per endpoint')
+        parser.add_argument('--endpoints',
+                            help='comma separated endpoint names, all if '
+                                 'omitted')
+        parser.add_argument('--cold', action='store_true',
+                            help='clear the membership and response caches '
+                                 'before every request')
+        parser.add_argument('--serialization', action='store_true',
+                            help='compare the serializers of the list '
+                                 'endpoints with their .values() rows '
+                                 'instead of benchmarking the endpoints')
+        parser.add_argument('--rows', type=int, default=500,
+                            help='rows per serialization case')
+        parser.add_argument('-o', '--output',
+                            help='file to write the results to')
+        parser.add_argument('--compare', metavar='BASELINE',
+                            help='results file of an earlier run, exits '
+                                 'with an error if an endpoint regressed')
+        parser.add_argument('--threshold', type=float, default=0.1,
+                            help='relative p50 growth that counts as '
+                                 'regression')
+
+    def handle(self, *args, **options):
+        endpoints = None
+        if options['endpoints']:
+            endpoints = {name.strip()
+                         for name in options['endpoints'].split(',')}
+            unknown = endpoints - {endpoint[0] for endpoint in ENDPOINTS}
+            if unknown:
+                raise CommandError(
+                    f'Unknown endpoints: {", ".join(sorted(unknown))}')
+        scale = {name: options[name] for name in SCALE_DEFAULTS}
+        if scale['users'] < 1 or scale['projects'] < 1:
+            raise CommandError('At least one user and project are needed')
+        if options['serialization'] and options['compare']:
+            raise CommandError('--compare works on endpoint results only')
+
+        # like the test runner: DEBUG off and the testserver host allowed.
+        # The caches are the ones of this process, the seeded rows must not
+        # share keys with (and --cold must not clear) a shared cache
+        setup_test_environment(debug=False)
+        local_caches = override_settings(CACHES=process_caches('benchmark'))
+        local_caches.enable()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            user = seed(**scale)
+            if options['serialization']:
+                # the fastest of --requests runs per case
+                results = run_serialization_benchmark(
+                    rows=options['rows'], repeat=options['requests'])
+            else:
+                results = run_benchmark(
+                    user, requests=options['requests'],
+                    warmup=options['warmup'], endpoints=endpoints,
+                    cold=options['cold'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            local_caches.disable()
+            teardown_test_environment()
+
+        report = benchmark_report(results, scale, {
+            name: options[name] for name in (
+                'requests', 'warmup', 'cold', 'serialization', 'rows')})
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as file:
+                baseline = json.load(file)
+            comparison = compare_results(baseline, report,
+                                         options['threshold'])
+            self.stderr.write(json.dumps(comparison, indent=2))
+            regressed = sorted(name for name, change in comparison.items()
+                               if change['regressed'])
+            if regressed:
+                raise CommandError(f'Regressed: {", ".join(regressed)}')
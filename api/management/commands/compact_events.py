@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from api.events import compact_events
+
+
+class Command(BaseCommand):
+    help = ('Deletes the events of the project change log that are older '
+            'than the retention period, clients with older cursors have to '
+            'load the project again.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='default: EVENT_LOG["RETENTION_DAYS"]')
+
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days must not be negative.')
+        deleted = compact_events(options['days'])
+        self.stdout.write(f'Deleted {deleted} events.')
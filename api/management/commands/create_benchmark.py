@@ -0,0 +1,56 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.concurrency import CREATE_PATHS, PROFILES, run_create_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Compares the issue create path with the previous one under '
+            'concurrent writers, each on a temporary database file. '
+            'Prints the insert throughput, latencies and queries per issue '
+            'as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8,
+                            help='concurrent writers')
+        parser.add_argument('--operations', type=int, default=50,
+                            help='issues per writer')
+        parser.add_argument('--contributors', type=int, default=100,
+                            help='contributors of the project')
+        parser.add_argument('--outsiders', type=int, default=50,
+                            help='assignees that are not contributors yet')
+        parser.add_argument('--profile', default='configured',
+                            choices=PROFILES,
+                            help='SQLite settings, see sqlite_benchmark')
+        parser.add_argument('--paths', default=','.join(CREATE_PATHS),
+                            help=f'comma separated, of '
+                                 f'{", ".join(CREATE_PATHS)}')
+        parser.add_argument('-o', '--output',
+                            help='file to write the results to')
+
+    def handle(self, *args, **options):
+        paths = [name.strip() for name in options['paths'].split(',')]
+        unknown = set(paths) - set(CREATE_PATHS)
+        if unknown:
+            raise CommandError(
+                f'Unknown paths: {", ".join(sorted(unknown))}')
+        if options['threads'] < 1 or options['operations'] < 1:
+            raise CommandError('--threads and --operations must be positive')
+        names = ('threads', 'operations', 'contributors', 'outsiders',
+                 'profile')
+        try:
+            results = run_create_benchmark(
+                paths, **{name: options[name] for name in names})
+        except ValueError as error:
+            raise CommandError(error)
+
+        report = {
+            'options': {name: options[name] for name in names},
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,33 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import EXPORT_CHUNK_SIZE, EXPORT_FORMATS, export_project
+from api.models import Project
+
+
+class Command(BaseCommand):
+    help = ('Exports all issues and comments of a project as NDJSON or CSV, '
+            'the same export as /projects/{pk}/export/.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('project_id', type=int)
+        parser.add_argument('--output-format', choices=list(EXPORT_FORMATS),
+                            default='ndjson')
+        parser.add_argument('-o', '--output',
+                            help='file to write to, stdout if omitted')
+        parser.add_argument('--chunk-size', type=int,
+                            default=EXPORT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        project_id = options['project_id']
+        if not Project.objects.filter(id=project_id).exists():
+            raise CommandError(f'Project {project_id} does not exist')
+        chunks = export_project(project_id, options['output_format'],
+                                options['chunk_size'])
+        if options['output']:
+            with open(options['output'], 'w', newline='',
+                      encoding='utf-8') as file:
+                file.writelines(chunks)
+        else:
+            sys.stdout.writelines(chunks)
@@ -0,0 +1,71 @@
+import json
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_test_environment, teardown_test_environment)
+
+from api.benchmark import benchmark_ids, seed
+from api.loadtest import ROUTES, load_test
+
+
+class Command(BaseCommand):
+    help = ('Load tests the sync and the async read endpoints through the '
+            'ASGI application with many concurrent slow clients, against a '
+            'seeded test database. Prints the results as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, default=100,
+                            help='concurrent clients')
+        parser.add_argument('--requests', type=int, default=1000,
+                            help='requests per route and endpoint')
+        parser.add_argument('--client-delay', type=float, default=0.05,
+                            help='seconds a client needs to send its '
+                                 'request and again to read the response')
+        parser.add_argument('--db-latency', type=float, default=0.0,
+                            help='simulated seconds per query')
+        parser.add_argument('--routes', default=','.join(ROUTES),
+                            help=f'comma separated, of {", ".join(ROUTES)}')
+        parser.add_argument('--issues', type=int, default=20)
+        parser.add_argument('--comments', type=int, default=5,
+                            help='comments per issue')
+        parser.add_argument('-o', '--output',
+                            help='file to write the results to')
+
+    def handle(self, *args, **options):
+        routes = [route.strip() for route in options['routes'].split(',')]
+        unknown = set(routes) - set(ROUTES)
+        if unknown:
+            raise CommandError(f'Unknown routes: {", ".join(sorted(unknown))}')
+        if options['issues'] < 1:
+            raise CommandError('At least one issue is needed')
+
+        # like the test runner: DEBUG off and the testserver host allowed
+        setup_test_environment(debug=False)
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        try:
+            user = seed(users=1, projects=1, contributors=1,
+                        issues=options['issues'],
+                        comments=options['comments'])
+            results = load_test(
+                get_asgi_application(), user, benchmark_ids(user), routes,
+                clients=options['clients'], requests=options['requests'],
+                client_delay=options['client_delay'],
+                db_latency=options['db_latency'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            'options': {name: options[name] for name in (
+                'clients', 'requests', 'client_delay', 'db_latency',
+                'issues', 'comments')},
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = ('Recounts the issue and comment counters of the projects and '
+            'issues from scratch.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('projects', nargs='*', type=int,
+                            help='project ids, default: all projects')
+
+    def handle(self, *args, **options):
+        updated = rebuild_counters(options['projects'] or None)
+        self.stdout.write(f'Recounted {updated} projects.')
@@ -0,0 +1,50 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.concurrency import PROFILES, run_concurrency_benchmark
+
+
+class Command(BaseCommand):
+    help = ('Compares the SQLite configuration of settings.py with the stock '
+            'sqlite3 backend under concurrent readers and writers, each on '
+            'a temporary database file. Prints the results as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8,
+                            help='concurrent workers')
+        parser.add_argument('--operations', type=int, default=200,
+                            help='operations per worker')
+        parser.add_argument('--write-ratio', type=float, default=0.2,
+                            help='share of write transactions')
+        parser.add_argument('--profiles', default=','.join(PROFILES),
+                            help=f'comma separated, of {", ".join(PROFILES)}')
+        parser.add_argument('-o', '--output',
+                            help='file to write the results to')
+
+    def handle(self, *args, **options):
+        profiles = [name.strip() for name in options['profiles'].split(',')]
+        unknown = set(profiles) - set(PROFILES)
+        if unknown:
+            raise CommandError(
+                f'Unknown profiles: {", ".join(sorted(unknown))}')
+        if options['threads'] < 1 or options['operations'] < 1:
+            raise CommandError('--threads and --operations must be positive')
+        try:
+            results = run_concurrency_benchmark(
+                profiles, threads=options['threads'],
+                operations=options['operations'],
+                write_ratio=options['write_ratio'])
+        except ValueError as error:
+            raise CommandError(error)
+
+        report = {
+            'options': {name: options[name] for name in (
+                'threads', 'operations', 'write_ratio')},
+            'results': results,
+        }
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        self.stdout.write(output)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from api.replicas import replication_options
+
+
+class Command(BaseCommand):
+    help = ('Copies the SQLite primary database into the SQLite replicas, '
+            'which stands in for replication when trying the read replicas '
+            'locally.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('replicas', nargs='*',
+                            help='database aliases, default: '
+                                 'DATABASE_REPLICATION["REPLICAS"]')
+
+    def handle(self, *args, **options):
+        replicas = options['replicas'] or replication_options()['REPLICAS']
+        if not replicas:
+            raise CommandError('No replica given or configured.')
+        primary = connections[DEFAULT_DB_ALIAS]
+        for alias in replicas:
+            if alias not in connections:
+                raise CommandError(f'Unknown database {alias!r}.')
+            replica = connections[alias]
+            if primary.vendor != 'sqlite' or replica.vendor != 'sqlite':
+                raise CommandError('Only SQLite databases can be copied, '
+                                   'use the replication of the database.')
+            primary.ensure_connection()
+            replica.ensure_connection()
+            # the online backup of sqlite3, consistent while writes go on
+            primary.connection.backup(replica.connection)
+            self.stdout.write(f'Copied {primary.settings_dict["NAME"]} to '
+                              f'{replica.settings_dict["NAME"]}.')
@@ -0,0 +1,251 @@
+"""
+Prometheus metrics of the API, served as text exposition on /metrics.
+
+Every process counts into its own MetricsRegistry. With a
+METRICS['DIRECTORY'] the registry of each process is written to its own
+file in that directory (at most every FLUSH_INTERVAL seconds and at exit)
+and /metrics adds up the files of all processes, so the numbers are
+correct with several WSGI / ASGI workers. The files of stopped workers
+are kept, their counts stay part of the totals.
+"""
+import atexit
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+
+from api.cache import membership_cache, response_cache
+
+METRICS_DEFAULTS = {
+    'DIRECTORY': None,
+    'FLUSH_INTERVAL': 1.0,
+    # bearer token that /metrics requires, closed if None
+    'TOKEN': None,
+    # opt-out of the token, e.g. behind a network that only the scraper
+    # can reach
+    'PUBLIC': False,
+}
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+                   10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# name: (type, help, label names, histogram buckets)
+METRICS = {
+    'softdesk_http_requests_total': (
+        'counter', 'HTTP requests by route, view, action and status code.',
+        ('route', 'view', 'action', 'method', 'status'), None),
+    'softdesk_http_request_duration_seconds': (
+        'histogram', 'Time until the response was returned.',
+        ('route', 'view', 'action'), LATENCY_BUCKETS),
+    'softdesk_db_queries_per_request': (
+        'histogram', 'Database queries of a request.',
+        ('route', 'view', 'action'), QUERY_BUCKETS),
+    'softdesk_db_query_seconds_total': (
+        'counter', 'Time spent in database queries.',
+        ('route', 'view', 'action'), None),
+    'softdesk_cache_requests_total': (
+        'counter', 'Lookups of the membership and response caches.',
+        ('cache', 'result'), None),
+}
+
+
+def metrics_options():
+    return {**METRICS_DEFAULTS, **getattr(settings, 'METRICS', {})}
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms of one process, keyed by metric name and the
+    tuple of label values.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.samples = {name: {} for name in METRICS}
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            values = self.samples[name]
+            values[labels] = values.get(labels, 0) + amount
+
+    def set(self, name, labels, value):
+        """For counters that are counted elsewhere, like the cache stats"""
+        with self._lock:
+            self.samples[name][labels] = value
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][3]
+        with self._lock:
+            # [count per bucket (not cumulative) ..., +Inf, sum]
+            values = self.samples[name].setdefault(
+                labels, [0] * (len(buckets) + 1) + [0.0])
+            for index, bound in enumerate(buckets):
+                if value <= bound:
+                    values[index] += 1
+                    break
+            else:
+                values[len(buckets)] += 1
+            values[-1] += value
+
+    def dump(self):
+        with self._lock:
+            return {name: [[list(labels), value]
+                           for labels, value in values.items()]
+                    for name, values in self.samples.items()}
+
+
+registry = MetricsRegistry()
+
+
+def collect_cache_stats():
+    for cache, stats in (('membership', membership_cache.stats()),
+                         ('response', response_cache.stats())):
+        for result, value in stats.items():
+            if result != 'hits' or cache == 'response':
+                registry.set('softdesk_cache_requests_total',
+                             (cache, result), value)
+
+
+def observe_request(labels, method, status, duration, queries, db_time):
+    """Counts a finished request, labels are (route, view, action)"""
+    registry.inc('softdesk_http_requests_total',
+                 (*labels, method, str(status)))
+    registry.observe('softdesk_http_request_duration_seconds', labels,
+                     duration)
+    registry.observe('softdesk_db_queries_per_request', labels, queries)
+    registry.inc('softdesk_db_query_seconds_total', labels, db_time)
+    process_file.flush()
+
+
+class ProcessFile:
+    """The file of this process in the METRICS['DIRECTORY']"""
+
+    def __init__(self):
+        self.name = None
+        self.last_flush = 0.0
+        self._lock = threading.Lock()
+
+    def path(self, directory):
+        if self.name is None:
+            # not only the pid, restarted workers can get the same one
+            self.name = f'metrics_{os.getpid()}_{uuid.uuid4().hex[:8]}.json'
+        return os.path.join(directory, self.name)
+
+    def flush(self, force=False):
+        directory = metrics_options()['DIRECTORY']
+        if not directory:
+            return
+        interval = metrics_options()['FLUSH_INTERVAL']
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self.last_flush < interval:
+                return
+            self.last_flush = now
+            collect_cache_stats()
+            path = self.path(directory)
+            os.makedirs(directory, exist_ok=True)
+            with open(f'{path}.tmp', 'w', encoding='utf-8') as file:
+                json.dump(registry.dump(), file)
+            os.replace(f'{path}.tmp', path)
+
+
+process_file = ProcessFile()
+atexit.register(process_file.flush, force=True)
+
+
+def merged_samples():
+    """The samples of this process, added up with the other processes"""
+    directory = metrics_options()['DIRECTORY']
+    if not directory:
+        collect_cache_stats()
+        return registry.dump()
+    process_file.flush(force=True)
+    merged = {name: {} for name in METRICS}
+    for path in glob.glob(os.path.join(directory, 'metrics_*.json')):
+        try:
+            with open(path, encoding='utf-8') as file:
+                dump = json.load(file)
+        except (OSError, ValueError):
+            continue
+        for name, values in dump.items():
+            if name not in merged:
+                continue
+            for labels, value in values:
+                labels = tuple(labels)
+                if labels not in merged[name]:
+                    merged[name][labels] = value
+                elif isinstance(value, list):
+                    merged[name][labels] = [
+                        a + b for a, b in zip(merged[name][labels], value)]
+                else:
+                    merged[name][labels] += value
+    return {name: [[list(labels), value] for labels, value in values.items()]
+            for name, values in merged.items()}
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def label_string(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"')
+               .replace('\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value
+                          in zip(pairs, escaped)) + '}'
+
+
+def render_metrics(samples):
+    """Prometheus text exposition format 0.0.4"""
+    lines = []
+    for name, (kind, help_text, label_names, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(samples.get(name, ()),
+                                    key=lambda sample: sample[0]):
+            if kind != 'histogram':
+                lines.append(f'{name}{label_string(label_names, labels)} '
+                             f'{format_value(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), value[:-1]):
+                cumulative += count
+                le = (('le', bound if bound == '+Inf' else
+                       format_value(float(bound))),)
+                lines.append(f'{name}_bucket'
+                             f'{label_string(label_names, labels, le)} '
+                             f'{cumulative}')
+            lines.append(f'{name}_sum{label_string(label_names, labels)} '
+                         f'{format_value(float(value[-1]))}')
+            lines.append(f'{name}_count{label_string(label_names, labels)} '
+                         f'{cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    """GET /metrics, with the bearer token of METRICS['TOKEN']"""
+    options = metrics_options()
+    if not options['PUBLIC']:
+        token = options['TOKEN']
+        # compared as bytes, compare_digest() refuses non-ASCII str
+        if not token or not hmac.compare_digest(
+                request.headers.get('Authorization', '').encode(),
+                f'Bearer {token}'.encode()):
+            return HttpResponseForbidden()
+    return HttpResponse(render_metrics(merged_samples()),
+                        content_type=CONTENT_TYPE)
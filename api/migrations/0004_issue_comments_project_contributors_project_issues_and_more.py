@@ -0,0 +1,47 @@
+# Generated by Django 4.0.3 on 2026-10-18 10:00
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('authentication', '0001_initial'),
+        ('api', '0003_alter_contributor_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='issue',
+            name='comments',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='comment', to='api.comment'),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='contributors',
+            field=models.ManyToManyField(blank=True, related_name='creator', through='api.Contributor', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='project',
+            name='issues',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='issue', to='api.issue'),
+        ),
+        migrations.AlterField(
+            model_name='contributor',
+            name='permission',
+            field=models.CharField(choices=[('manage', 'manage'), ('edit', 'edit')], max_length=30, null=True),
+        ),
+        migrations.AlterField(
+            model_name='contributor',
+            name='role',
+            field=models.CharField(choices=[('AUTHOR', 'AUTHOR'), ('COLLABORATOR', 'COLLABORATOR')], max_length=30, null=True),
+        ),
+        migrations.AlterField(
+            model_name='project',
+            name='author',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='owner', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
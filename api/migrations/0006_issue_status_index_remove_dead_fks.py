@@ -0,0 +1,25 @@
+# Generated by Django 4.0.3 on 2026-10-18 10:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0005_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='issue',
+            name='comments',
+        ),
+        migrations.RemoveField(
+            model_name='project',
+            name='issues',
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['project', 'status', 'priority'], name='issue_project_status_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.0.3 on 2026-10-18 10:09
+
+from django.db import migrations, models
+
+import api.search
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_issue_status_index_remove_dead_fks'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['project', 'tag'], name='issue_project_tag_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='issue',
+            index=models.Index(fields=['project', 'assignee'], name='issue_project_assignee_idx'),
+        ),
+        migrations.RunPython(
+            api.search.install_issue_fts,
+            api.search.uninstall_issue_fts,
+        ),
+    ]
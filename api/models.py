@@ -1,8 +1,56 @@
-from django.db import models
-from django.conf import settings
-
+from contextlib import contextmanager
+from contextvars import ContextVar
 
-class Project(models.Model):
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models, router, transaction
+from django.conf import settings
+from django.utils import timezone
+
+
+# (filters) -> {counter: delta} of the Project.bump_version calls that wait
+# for the end of the coalesce_bumps() block, None outside of one
+pending_bumps = ContextVar('pending_bumps', default=None)
+
+
+@contextmanager
+def coalesce_bumps():
+    """
+    Combines the Project.bump_version calls of the block into one UPDATE
+    per project at its end, e.g. of an issue and the Contributor-row of its
+    new assignee. Nested blocks join the outer one. Nothing is written if
+    the block raises, a savepoint rolled back inside it would keep its bumps.
+    """
+    if pending_bumps.get() is not None:
+        yield
+        return
+    pending = {}
+    token = pending_bumps.set(pending)
+    try:
+        yield
+    finally:
+        pending_bumps.reset(token)
+    for filters, counters in pending.items():
+        Project.bump_version(counters, **dict(filters))
+
+
+class AtomicSaveMixin:
+    """
+    Saves in a transaction, together with the counters and the event that
+    the receivers of api/signals.py write. Within a surrounding transaction
+    the save joins it without a savepoint of its own. The membership cache
+    is invalidated again when the transaction commits (a Contributor save is
+    never outside of one). The project version is bumped once per save.
+    """
+
+    def save(self, *args, **kwargs):
+        using = kwargs.get('using') or router.db_for_write(
+            type(self), instance=self)
+        with transaction.atomic(using=using, savepoint=False), \
+                coalesce_bumps():
+            super().save(*args, **kwargs)
+
+
+class Project(AtomicSaveMixin, models.Model):
     TYPES = (
         ('back end', 'back end'),
         ('front end', 'front end'),
@@ -24,18 +72,57 @@ class Project(models.Model):
         related_name='creator',
         blank=True
     )
-    issues = models.ForeignKey(
-        'Issue',
-        on_delete=models.CASCADE,
-        related_name='issue',
-        null=True
-    )
+    # bumped on every change of the project tree, see api/signals.py
+    version = models.PositiveBigIntegerField(default=1)
+    updated_time = models.DateTimeField(default=timezone.now)
+    # denormalized counts of the issues and comments, see api/counters.py
+    issue_count = models.IntegerField(default=0)
+    comment_count = models.IntegerField(default=0)
+    todo_count = models.IntegerField(default=0)
+    in_progress_count = models.IntegerField(default=0)
+    completed_count = models.IntegerField(default=0)
+    low_priority_count = models.IntegerField(default=0)
+    medium_priority_count = models.IntegerField(default=0)
+    high_priority_count = models.IntegerField(default=0)
+    bug_count = models.IntegerField(default=0)
+    enhancement_count = models.IntegerField(default=0)
+    task_count = models.IntegerField(default=0)
+    # the last Event of the project that compact_events removed
+    compacted_event_id = models.BigIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # backs the (title, id) keyset pagination
+            models.Index(fields=['title', 'id'], name='project_title_id_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
-
-class Contributor(models.Model):
+    @classmethod
+    def bump_version(cls, counters=None, **filters):
+        """
+        Marks the filtered projects as changed with a single UPDATE, the
+        version and updated_time are the ETag and Last-Modified of the
+        project tree. counters ({field: delta}) are added in the same
+        UPDATE. Within coalesce_bumps() the UPDATE waits for the end of the
+        block.
+        """
+        pending = pending_bumps.get()
+        if pending is not None:
+            key = tuple(sorted(filters.items()))
+            merged = pending.setdefault(key, {})
+            for field, delta in (counters or {}).items():
+                merged[field] = merged.get(field, 0) + delta
+            return None
+        changes = {field: models.F(field) + delta
+                   for field, delta in (counters or {}).items() if delta}
+        return cls.objects.filter(**filters).update(
+            version=models.F('version') + 1, updated_time=timezone.now(),
+            **changes)
+
+
+class Contributor(AtomicSaveMixin, models.Model):
     PERMISSIONS = (
         ('manage', 'manage'),
         ('edit', 'edit'),
@@ -62,7 +149,7 @@ class Contributor(models.Model):
         return f"{self.user}_{self.project}"
 
 
-class Issue(models.Model):
+class Issue(AtomicSaveMixin, models.Model):
     TAGS = (
         ('BUG', 'BUG'),
         ('ENHANCEMENT', 'ENHANCEMENT'),
@@ -93,18 +180,28 @@ class Issue(models.Model):
                                  related_name='assignee',
                                  null=True)
     created_time = models.DateTimeField(auto_now_add=True)
-    comments = models.ForeignKey(
-        'Comment',
-        on_delete=models.CASCADE,
-        related_name='comment',
-        null=True
-    )
+    # denormalized, see api/counters.py
+    comment_count = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # backs the (created_time, id) keyset pagination per project
+            models.Index(fields=['project', 'created_time', 'id'],
+                         name='issue_project_created_idx'),
+            # status / priority filters inside a project
+            models.Index(fields=['project', 'status', 'priority'],
+                         name='issue_project_status_idx'),
+            models.Index(fields=['project', 'tag'],
+                         name='issue_project_tag_idx'),
+            models.Index(fields=['project', 'assignee'],
+                         name='issue_project_assignee_idx'),
+        ]
 
     def __str__(self):
         return self.title
 
 
-class Comment(models.Model):
+class Comment(AtomicSaveMixin, models.Model):
     description = models.CharField(max_length=255)
     author = models.ForeignKey(to=settings.AUTH_USER_MODEL,
                                on_delete=models.CASCADE,)
@@ -112,5 +209,42 @@ class Comment(models.Model):
                               on_delete=models.CASCADE)
     created_time = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # backs the (created_time, id) keyset pagination per issue
+            models.Index(fields=['issue', 'created_time', 'id'],
+                         name='comment_issue_created_idx'),
+        ]
+
     def __str__(self):
         return self.id
+
+
+class Event(models.Model):
+    """
+    Append-only log of the changes of a project tree, the id is the cursor
+    of /projects/{pk}/changes/. See api/events.py.
+    """
+    ACTIONS = (
+        ('created', 'created'),
+        ('updated', 'updated'),
+        ('deleted', 'deleted'),
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    project = models.ForeignKey(to=Project, on_delete=models.CASCADE,
+                                related_name='events')
+    model = models.CharField(max_length=20)
+    object_id = models.BigIntegerField()
+    action = models.CharField(max_length=10, choices=ACTIONS)
+    data = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_time = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            # the changes of a project after a cursor
+            models.Index(fields=['project', 'id'],
+                         name='event_project_id_idx'),
+            models.Index(fields=['created_time'],
+                         name='event_created_idx'),
+        ]
@@ -0,0 +1,152 @@
+import binascii
+import json
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict
+from datetime import datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(PageNumberPagination):
+    """
+    Page-number pagination with an opt-in keyset (cursor) mode.
+
+    Clients switch to keyset mode with ?pagination=keyset and follow the
+    next / previous links, which carry an opaque ?cursor=. A keyset page is
+    selected with a WHERE clause on the ordering fields instead of an
+    OFFSET, so deep pages cost the same as the first one. The total COUNT(*)
+    only runs if the client asks for it with ?count=true.
+    The ordering fields are ascending and the last one has to be unique.
+    """
+    ordering = ('created_time', 'id')
+    mode_query_param = 'pagination'
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+
+    def use_keyset(self, request):
+        return (request.query_params.get(self.mode_query_param) == 'keyset'
+                or self.cursor_query_param in request.query_params)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = self.use_keyset(request)
+        if not self.keyset:
+            return super().paginate_queryset(queryset, request, view)
+
+        self.request = request
+        self.display_page_controls = False
+        page_size = self.get_page_size(request)
+        if not page_size:
+            return None
+        values, reverse = self.decode_cursor(request, queryset.model)
+
+        self.count = None
+        if request.query_params.get(self.count_query_param) == 'true':
+            self.count = queryset.count()
+
+        if values is None:
+            queryset = queryset.order_by(*self.ordering)
+        elif reverse:
+            queryset = queryset.filter(
+                self.keyset_filter(values, 'lt')).order_by(
+                *[f'-{field}' for field in self.ordering])
+        else:
+            queryset = queryset.filter(
+                self.keyset_filter(values, 'gt')).order_by(*self.ordering)
+
+        rows = list(queryset[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, values is not None
+        self.rows = rows
+        return rows
+
+    def keyset_filter(self, values, lookup):
+        """
+        (a, b, c) > (x, y, z) written as
+        a > x OR (a = x AND b > y) OR (a = x AND b = y AND c > z)
+        """
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            equal = {name: value for name, value
+                     in zip(self.ordering[:i], values[:i])}
+            condition |= Q(**equal, **{f'{field}__{lookup}': values[i]})
+        return condition
+
+    def position(self, obj):
+        values = []
+        for field in self.ordering:
+            # a model instance or a .values() row
+            value = obj[field] if isinstance(obj, dict) else getattr(
+                obj, field)
+            if isinstance(value, datetime):
+                # keep the microseconds, the cursor must be exact
+                value = value.isoformat()
+            values.append(value)
+        return values
+
+    def encode_cursor(self, values, reverse):
+        data = json.dumps({'v': values, 'r': reverse}, separators=(',', ':'))
+        token = urlsafe_b64encode(data.encode()).decode()
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request, model):
+        """
+        Returns the (values, reverse) of the cursor in the request, the
+        values converted by the model fields of the ordering.
+        """
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None, False
+        try:
+            data = json.loads(urlsafe_b64decode(token.encode()).decode())
+            values, reverse = data['v'], bool(data['r'])
+            if (not isinstance(values, list)
+                    or len(values) != len(self.ordering)
+                    or None in values):
+                raise ValueError('cursor values do not match the ordering')
+            values = [model._meta.get_field(field).to_python(value)
+                      for field, value in zip(self.ordering, values)]
+        except (TypeError, ValueError, KeyError, binascii.Error,
+                ValidationError):
+            raise NotFound('Invalid cursor')
+        return values, reverse
+
+    def get_next_link(self):
+        if not self.keyset:
+            return super().get_next_link()
+        if not self.has_next or not self.rows:
+            return None
+        return self.encode_cursor(self.position(self.rows[-1]), False)
+
+    def get_previous_link(self):
+        if not self.keyset:
+            return super().get_previous_link()
+        if not self.has_previous or not self.rows:
+            return None
+        return self.encode_cursor(self.position(self.rows[0]), True)
+
+    def get_paginated_response(self, data):
+        if not self.keyset:
+            return super().get_paginated_response(data)
+        response = OrderedDict()
+        if self.count is not None:
+            response['count'] = self.count
+        response['next'] = self.get_next_link()
+        response['previous'] = self.get_previous_link()
+        response['results'] = data
+        return Response(response)
+
+
+class ProjectKeysetPagination(KeysetPagination):
+    ordering = ('title', 'id')
@@ -0,0 +1,110 @@
+"""
+Read replicas.
+
+ReplicaRouter sends the reads of the requests that ReplicaReadMixin marks
+(the safe-method requests of the project, contributor, issue and comment
+views) to one of DATABASE_REPLICATION['REPLICAS'], everything else goes to
+the primary ('default'). Once such a request writes, its remaining reads go
+to the primary as well. A user who wrote reads from the primary for
+PIN_SECONDS afterwards, so they see their own changes while the replicas
+catch up.
+
+With the SQLite setup of settings.py, `manage.py sync_replica` copies the
+primary file to the replica file.
+"""
+import contextvars
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework.permissions import SAFE_METHODS
+
+DATABASE_REPLICATION_DEFAULTS = {
+    'REPLICAS': [],
+    'PIN_SECONDS': 10,
+    'CACHE': 'default',
+}
+
+current_route = contextvars.ContextVar('database_route', default=None)
+
+
+def replication_options():
+    return {**DATABASE_REPLICATION_DEFAULTS,
+            **getattr(settings, 'DATABASE_REPLICATION', {})}
+
+
+class Route:
+    """The replica a request reads from, until it writes."""
+
+    def __init__(self, replica):
+        self.replica = replica
+        self.wrote = False
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        route = current_route.get()
+        if route is None:
+            return None
+        return DEFAULT_DB_ALIAS if route.wrote else route.replica
+
+    def db_for_write(self, model, **hints):
+        route = current_route.get()
+        if route is None:
+            return None
+        route.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # the rows of a replica are the rows of the primary
+        databases = {DEFAULT_DB_ALIAS, *replication_options()['REPLICAS']}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def pin_key(user_id):
+    return f'replica-pin:{user_id}'
+
+
+def pin_to_primary(user_id):
+    options = replication_options()
+    caches[options['CACHE']].set(pin_key(user_id), True,
+                                 options['PIN_SECONDS'])
+
+
+def is_pinned(user_id):
+    return caches[replication_options()['CACHE']].get(pin_key(user_id),
+                                                      False)
+
+
+class ReplicaReadMixin:
+    """
+    DRF view mixin that reads from a replica on safe-method requests and
+    pins the user to the primary after a write.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        token = current_route.set(None)
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            current_route.reset(token)
+
+    def perform_authentication(self, request):
+        super().perform_authentication(request)
+        replicas = replication_options()['REPLICAS']
+        if (replicas and request.method in SAFE_METHODS
+                and not (request.user.is_authenticated
+                         and is_pinned(request.user.pk))):
+            current_route.set(Route(random.choice(replicas)))
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (request.method not in SAFE_METHODS
+                and request.user.is_authenticated
+                and response.status_code < 400
+                and replication_options()['REPLICAS']):
+            pin_to_primary(request.user.pk)
+        return super().finalize_response(request, response, *args, **kwargs)
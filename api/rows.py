@@ -0,0 +1,160 @@
+"""
+Read path of the list endpoints over .values() rows.
+
+The list actions of the contributor, issue and comment views (and the
+async issue and comment lists) select the columns of the page with
+.values(), the email of a SlugRelatedField is joined in the same query,
+and turn the rows into dicts with a RowMapper. A mapper is compiled once
+per serializer class and set of fields and writes the JSON of the
+serializer, without its per-row field machinery (get_attribute, the
+HiddenField defaults, the related field lookups).
+
+Embedded lists (the comments of an issue) are declared in the
+`row_relations` of the serializer and read with one query per page.
+"""
+import copy
+from datetime import datetime
+
+from django.core.exceptions import ImproperlyConfigured
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+# the representation of these fields is the value .values() returns
+PLAIN_FIELDS = (serializers.BooleanField, serializers.CharField,
+                serializers.ChoiceField, serializers.IntegerField,
+                serializers.SlugRelatedField)
+
+
+def constant(convert):
+    return lambda: convert
+
+
+def datetime_converter(field):
+    """
+    DateTimeField.to_representation with the timezone looked up once, not
+    once per value. The fast path covers the aware datetimes of USE_TZ.
+    """
+    timezone = (field.timezone if hasattr(field, 'timezone')
+                else field.default_timezone())
+    output_format = getattr(field, 'format', api_settings.DATETIME_FORMAT)
+    if (timezone is None or output_format is None
+            or output_format.lower() != ISO_8601):
+        return field.to_representation
+
+    def convert(value):
+        if not isinstance(value, datetime) or value.utcoffset() is None:
+            return field.to_representation(value)
+        value = value.astimezone(timezone).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+    return convert
+
+
+def converter_factory(field):
+    """
+    Returns a function that returns the converter of the field values for
+    one serialization, None if the values are their own representation.
+    """
+    if isinstance(field, PLAIN_FIELDS):
+        return None
+    # an unbound copy, the serializer belongs to a request
+    field = copy.deepcopy(field)
+    if isinstance(field, serializers.DateTimeField):
+        return lambda: datetime_converter(field)
+    return constant(field.to_representation)
+
+
+class RowMapper:
+    """Turns .values() rows into the representation of a serializer."""
+
+    def __init__(self, serializer):
+        model = serializer.Meta.model
+        self.model = model
+        self.pk = model._meta.pk.attname
+        # (name, lookup, converter factory or None), in the field order
+        self.fields = []
+        # name -> (RowMapper, foreign key of the related rows)
+        self.relations = {}
+        relations = getattr(serializer, 'row_relations', {})
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if name in relations:
+                child, foreign_key = relations[name]
+                self.relations[name] = (row_mapper(child()), foreign_key)
+                self.fields.append((name, None, None))
+                continue
+            if (isinstance(field, serializers.SerializerMethodField)
+                    or field.source == '*'):
+                raise ImproperlyConfigured(
+                    f'{type(serializer).__name__}.{name} cannot be read '
+                    f'from .values() rows, add it to row_relations.')
+            lookup = '__'.join(field.source_attrs)
+            if isinstance(field, serializers.SlugRelatedField):
+                lookup = f'{lookup}__{field.slug_field}'
+            self.fields.append((name, lookup, converter_factory(field)))
+        self.lookups = list(dict.fromkeys(
+            [self.pk] + [lookup for _, lookup, _ in self.fields if lookup]))
+
+    def values(self, queryset, extra=()):
+        """
+        The queryset as rows of the looked up columns and the `extra`
+        columns, e.g. the ordering of a keyset page.
+        """
+        return queryset.prefetch_related(None).values(
+            *dict.fromkeys([*self.lookups, *extra]))
+
+    def converters(self):
+        """(name, lookup, converter or None) for one serialization"""
+        return [(name, lookup, factory and factory())
+                for name, lookup, factory in self.fields]
+
+    def related(self, rows):
+        """name -> {pk: representations} of the related rows"""
+        related = {}
+        ids = [row[self.pk] for row in rows]
+        for name, (mapper, foreign_key) in self.relations.items():
+            children = {}
+            queryset = mapper.model.objects.filter(
+                **{f'{foreign_key}__in': ids}).order_by(
+                *(mapper.model._meta.ordering or [mapper.pk]))
+            lookups = dict.fromkeys([*mapper.lookups, foreign_key])
+            fields = mapper.converters()
+            for row in queryset.values(*lookups):
+                children.setdefault(row[foreign_key], []).append(
+                    mapper.to_representation(row, fields))
+            related[name] = children
+        return related
+
+    def to_representation(self, row, fields, related=None):
+        data = {}
+        for name, lookup, convert in fields:
+            if lookup is None:
+                data[name] = related[name].get(row[self.pk], [])
+                continue
+            value = row[lookup]
+            if convert is not None and value is not None:
+                value = convert(value)
+            data[name] = value
+        return data
+
+    def serialize(self, rows):
+        rows = list(rows)
+        related = self.related(rows) if self.relations and rows else None
+        fields = self.converters()
+        return [self.to_representation(row, fields, related) for row in rows]
+
+
+# (serializer class, field names) -> RowMapper, the field names of ?fields=
+# are a subset of the fields of the class
+_mappers = {}
+
+
+def row_mapper(serializer):
+    """The RowMapper of the serializer class with the fields it has"""
+    key = (type(serializer), tuple(serializer.fields))
+    mapper = _mappers.get(key)
+    if mapper is None:
+        mapper = _mappers[key] = RowMapper(serializer)
+    return mapper
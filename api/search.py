@@ -0,0 +1,102 @@
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+# External-content FTS5 index over Issue.title and Issue.description, kept in
+# sync with api_issue by triggers. SQLite drops the triggers whenever Django
+# remakes the api_issue table, so every migration that alters Issue has to
+# run install_issue_fts again.
+ISSUE_FTS_TABLE = 'api_issue_fts'
+
+ISSUE_FTS_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {ISSUE_FTS_TABLE} USING fts5(
+        title, description, content='api_issue', content_rowid='id')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {ISSUE_FTS_TABLE}_ai
+        AFTER INSERT ON api_issue BEGIN
+        INSERT INTO {ISSUE_FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {ISSUE_FTS_TABLE}_ad
+        AFTER DELETE ON api_issue BEGIN
+        INSERT INTO {ISSUE_FTS_TABLE}({ISSUE_FTS_TABLE}, rowid, title,
+        description) VALUES ('delete', old.id, old.title, old.description);
+        END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {ISSUE_FTS_TABLE}_au
+        AFTER UPDATE ON api_issue BEGIN
+        INSERT INTO {ISSUE_FTS_TABLE}({ISSUE_FTS_TABLE}, rowid, title,
+        description) VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {ISSUE_FTS_TABLE}(rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+        END""",
+    f"INSERT INTO {ISSUE_FTS_TABLE}({ISSUE_FTS_TABLE}) VALUES ('rebuild')",
+]
+
+ISSUE_FTS_DROP_SQL = [
+    f'DROP TRIGGER IF EXISTS {ISSUE_FTS_TABLE}_ai',
+    f'DROP TRIGGER IF EXISTS {ISSUE_FTS_TABLE}_ad',
+    f'DROP TRIGGER IF EXISTS {ISSUE_FTS_TABLE}_au',
+    f'DROP TABLE IF EXISTS {ISSUE_FTS_TABLE}',
+]
+
+_fts_available = {}
+
+
+def install_issue_fts(apps, schema_editor):
+    """
+    Migration operation that (re)creates the FTS5 index and its triggers,
+    nothing is done on other backends or without the FTS5 extension.
+    """
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        if 'ENABLE_FTS5' not in {row[0] for row in cursor.fetchall()}:
+            return
+    for sql in ISSUE_FTS_SQL:
+        schema_editor.execute(sql)
+    _fts_available.clear()
+
+
+def uninstall_issue_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for sql in ISSUE_FTS_DROP_SQL:
+        schema_editor.execute(sql)
+    _fts_available.clear()
+
+
+def issue_fts_available(using=DEFAULT_DB_ALIAS):
+    """True if the FTS5 index exists on the database, checked once"""
+    if using not in _fts_available:
+        connection = connections[using]
+        _fts_available[using] = (
+            connection.vendor == 'sqlite'
+            and ISSUE_FTS_TABLE in connection.introspection.table_names())
+    return _fts_available[using]
+
+
+def fts_query(text):
+    """
+    Turns the user input into a safe FTS5 query: every word is quoted and
+    matched as a prefix, all words have to match.
+    """
+    words = text.split()
+    return ' '.join('"{}"*'.format(word.replace('"', '""')) for word in words)
+
+
+def search_issues(queryset, text):
+    """
+    Full-text search over title and description. Uses the FTS5 index on
+    SQLite and falls back to case-insensitive containment elsewhere.
+    """
+    if not text.split():
+        return queryset
+    if issue_fts_available(queryset.db):
+        return queryset.filter(id__in=RawSQL(
+            f'SELECT rowid FROM {ISSUE_FTS_TABLE} '
+            f'WHERE {ISSUE_FTS_TABLE} MATCH %s', [fts_query(text)]))
+    for word in text.split():
+        queryset = queryset.filter(
+            Q(title__icontains=word) | Q(description__icontains=word))
+    return queryset
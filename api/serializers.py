@@ -1,17 +1,116 @@
+from django.db import transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
 from rest_framework_nested.serializers import NestedHyperlinkedModelSerializer
 
 from api.models import *
 from authentication.models import User
+from authentication.permissions import get_project_context
+
+
+def child_expansions(expand, name):
+    """The expansions below the relation name, 'issues.comments' -> 'comments'"""
+    prefix = name + '.'
+    return {path[len(prefix):] for path in expand if path.startswith(prefix)}
+
+
+def query_param_set(query_params, name):
+    """Comma separated query parameter as set, None if it is not given"""
+    value = query_params.get(name)
+    if value is None:
+        return None
+    return {part.strip() for part in value.split(',') if part.strip()}
+
+
+def requested_expand(serializer_class, query_params, default_all):
+    """
+    The expansions of ?expand= (or all / none by default) limited to the
+    relations that are part of ?fields=.
+    """
+    expand = query_param_set(query_params, 'expand')
+    if expand is None:
+        if not default_all:
+            return set()
+        expand = serializer_class.all_expansions()
+    expand = serializer_class.normalize_expand(expand)
+    fields = query_param_set(query_params, 'fields')
+    if fields is not None:
+        expand = {path for path in expand if path.split('.')[0] in fields}
+    return expand
+
+
+def enroll_contributor(project, user):
+    """
+    Adds the user to the project as collaborator unless they contribute
+    already. The lookup is answered by the unique (user, project) index,
+    get_or_create keeps concurrent requests from adding them twice.
+    """
+    Contributor.objects.get_or_create(
+        project=project, user=user,
+        defaults={'permission': 'edit', 'role': 'COLLABORATOR'})
+
+
+def create_issue(project, **data):
+    """
+    Creates the issue and enrolls its assignee in one transaction, the
+    project version is bumped once for both rows.
+    """
+    with transaction.atomic(), coalesce_bumps():
+        enroll_contributor(project, data['assignee'])
+        return Issue.objects.create(project=project, **data)
+
+
+class SparseFieldsMixin:
+    """
+    Serializer-mixin that lets the client choose the representation.
+    fields: names of the fields to serialize, all fields if None.
+    expand: embedded relations to serialize, nested relations are written as
+    'issues.comments'. All relations in expandable_fields if None.
+    Write-only and hidden fields are always kept for the create/update
+    validation.
+    """
+    # relation name -> serializer class of the relation or None
+    expandable_fields = {}
+
+    def __init__(self, *args, fields=None, expand=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        if expand is None:
+            expand = self.all_expansions()
+        self.expand = self.normalize_expand(expand)
+        for name, field in list(self.fields.items()):
+            if field.write_only or isinstance(field, serializers.HiddenField):
+                continue
+            if fields is not None and name not in fields:
+                self.fields.pop(name)
+            elif name in self.expandable_fields and name not in self.expand:
+                self.fields.pop(name)
+
+    @classmethod
+    def all_expansions(cls):
+        expand = set()
+        for name, serializer in cls.expandable_fields.items():
+            expand.add(name)
+            if serializer is not None:
+                expand |= {f'{name}.{path}'
+                           for path in serializer.all_expansions()}
+        return expand
+
+    @staticmethod
+    def normalize_expand(expand):
+        """'issues.comments' implies the expansion of 'issues'"""
+        normalized = set()
+        for path in expand:
+            parts = path.split('.')
+            for i in range(1, len(parts) + 1):
+                normalized.add('.'.join(parts[:i]))
+        return normalized
 
 
 class ContributorSerializer(serializers.ModelSerializer):
     contributor_id = serializers.IntegerField(
         source='id', read_only=True)
-    user_id = serializers.IntegerField(
-        source='user.id', read_only=True)
-    project_id = serializers.IntegerField(
-        source='project.id', read_only=True)
+    user_id = serializers.IntegerField(read_only=True)
+    project_id = serializers.IntegerField(read_only=True)
     user = serializers.SlugRelatedField(
         slug_field='email', queryset=User.objects.all())
 
@@ -22,8 +121,8 @@ class ContributorSerializer(serializers.ModelSerializer):
         Permission gets added automatically matching the role of the
         contributor.
         """
-        project = Project.objects.get(
-            id=self.context['view'].kwargs['project_pk'])
+        project = get_project_context(
+            self.context['request'], self.context['view']).project
         validated_data['project'] = project
         role = validated_data['role']
         if not role:
@@ -47,18 +146,17 @@ class CommentSerializer(serializers.ModelSerializer):
     comment_id = serializers.IntegerField(
         source='id', read_only=True)
     author_user_id = serializers.IntegerField(
-        source='author.id', read_only=True
+        source='author_id', read_only=True
     )
-    issue_id = serializers.IntegerField(
-        source='issue.id', read_only=True)
+    issue_id = serializers.IntegerField(read_only=True)
 
     def create(self, validated_data):
         """
         Create Methode altered to add the issue that matches the PK from URL
         automatically.
         """
-        issue = Issue.objects.get(
-            id=self.context['view'].kwargs['issue_pk'])
+        issue = get_project_context(
+            self.context['request'], self.context['view']).issue
         validated_data['issue'] = issue
         return Comment.objects.create(**validated_data)
 
@@ -68,27 +166,46 @@ class CommentSerializer(serializers.ModelSerializer):
                   'created_time', 'author']
 
 
-class IssueSerializer(serializers.ModelSerializer):
+class IssueSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     issue_id = serializers.IntegerField(
         source='id', read_only=True)
     author = serializers.HiddenField(
         default=serializers.CurrentUserDefault())
     author_user_id = serializers.IntegerField(
-        source='author.id', read_only=True)
+        source='author_id', read_only=True)
     project_id = serializers.IntegerField(default='project.id', read_only=True)
     assignee_user_id = serializers.IntegerField(
-        source='assignee.id', read_only=True)
+        source='assignee_id', read_only=True)
     comments = serializers.SerializerMethodField()  # -> get_comments
     assignee = serializers.SlugRelatedField(
         slug_field='email', queryset=User.objects.all(),
         write_only=True, allow_null=True)
 
+    expandable_fields = {'comments': None}
+    # read by the list actions from .values() rows, see api/rows.py
+    row_relations = {'comments': (CommentSerializer, 'issue_id')}
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, expand=None):
+        """
+        Prefetch the comments of every Issue in the queryset with one query,
+        so get_comments does not hit the database once per Issue.
+        Nothing is prefetched if the comments are not expanded.
+        """
+        if expand is None:
+            expand = cls.all_expansions()
+        if 'comments' in expand:
+            queryset = queryset.prefetch_related('comment_set')
+        return queryset
+
     def get_comments(self, issue):
         """
         Gets representation from CommentSerializer for all the Comment-objects
         that are related to this Issue.
+        Uses the prefetched comments when the queryset was prepared with
+        setup_eager_loading.
         """
-        comments = Comment.objects.filter(issue=issue)
+        comments = issue.comment_set.all()
         return CommentSerializer(
             comments, many=True, read_only=True, required=False).data
 
@@ -101,20 +218,11 @@ class IssueSerializer(serializers.ModelSerializer):
         If the selected assignee is not already a contributor of the related
         project it will be added automatically.
         """
-        project = Project.objects.get(
-            id=self.context['view'].kwargs['project_pk'])
-        validated_data['project'] = project
+        project = get_project_context(
+            self.context['request'], self.context['view']).project
         if not validated_data['assignee']:
             validated_data['assignee'] = validated_data['author']
-        if validated_data['assignee'] not in project.contributors.all():
-            contributor = Contributor.objects.create(
-                user=validated_data['assignee'],
-                project=project,
-                permission='edit',
-                role='COLLABORATOR'
-            )
-            contributor.save()
-        return Issue.objects.create(**validated_data)
+        return create_issue(project, **validated_data)
 
     class Meta:
         model = Issue
@@ -123,26 +231,76 @@ class IssueSerializer(serializers.ModelSerializer):
                   'assignee', 'assignee_user_id', 'created_time', 'comments']
 
 
-class ProjectSerializer(NestedHyperlinkedModelSerializer):
+class BulkIssueSerializer(serializers.ModelSerializer):
+    """
+    Validates one item of a bulk issue import without touching the database,
+    the assignee emails of all items are resolved together afterwards.
+    """
+    assignee = serializers.EmailField(required=False, allow_null=True)
+
+    class Meta:
+        model = Issue
+        fields = ['title', 'description', 'tag', 'priority', 'status',
+                  'assignee']
+
+
+class BulkContributorSerializer(serializers.ModelSerializer):
+    """
+    Validates one item of a bulk contributor request without touching the
+    database, the user emails of all items are resolved together afterwards.
+    """
+    user = serializers.EmailField()
+
+    class Meta:
+        model = Contributor
+        fields = ['user', 'role']
+
+
+class ProjectSerializer(SparseFieldsMixin, NestedHyperlinkedModelSerializer):
     author = serializers.HiddenField(
         default=serializers.CurrentUserDefault()
     )
     author_user_id = serializers.IntegerField(
-        source='author.id', read_only=True)
+        source='author_id', read_only=True)
     project_id = serializers.IntegerField(
         source='id', read_only=True
     )
     issues = serializers.SerializerMethodField()  # -> get_issues
     contributors = serializers.SerializerMethodField()  # -> get_contributors
 
+    expandable_fields = {'issues': IssueSerializer, 'contributors': None}
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, expand=None):
+        """
+        Prefetch the expanded parts of the project tree (contributors with
+        their users, issues and their comments) so that serializing any
+        number of projects costs a fixed number of queries.
+        """
+        if expand is None:
+            expand = cls.all_expansions()
+        expand = cls.normalize_expand(expand)
+        lookups = []
+        if 'contributors' in expand:
+            lookups.append(Prefetch(
+                'project',
+                queryset=Contributor.objects.select_related('user')))
+        if 'issues' in expand:
+            lookups.append(Prefetch(
+                'issue_set',
+                queryset=IssueSerializer.setup_eager_loading(
+                    Issue.objects.all(), child_expansions(expand, 'issues'))))
+        return queryset.prefetch_related(*lookups)
+
     def get_issues(self, project):
         """
         Gets representation from IssueSerializer for all the Issue-objects that
         are related to this project.
         """
-        issues = Issue.objects.filter(project=project)
+        issues = project.issue_set.all()
         return IssueSerializer(
-            issues, many=True, read_only=True, required=False).data
+            issues, many=True, read_only=True, required=False,
+            expand=child_expansions(self.expand, 'issues')).data
 
     def get_contributors(self, project):
         """
@@ -150,7 +308,7 @@ class ProjectSerializer(NestedHyperlinkedModelSerializer):
         objects to serialize the Contributor-table and not the default
         related user.
         """
-        contributors = Contributor.objects.filter(project=project)
+        contributors = project.project.all()
         return ContributorSerializer(
             contributors, many=True, required=False).data
 
@@ -159,14 +317,14 @@ class ProjectSerializer(NestedHyperlinkedModelSerializer):
         Create Methode altered to add the Contributor Table for the author
         automatically.
         """
-        project = Project.objects.create(**validated_data)
-        contributors = Contributor.objects.create(
-            user=validated_data['author'],
-            project=project,
-            permission='manage',
-            role='AUTHOR'
-        )
-        contributors.save()
+        with transaction.atomic():
+            project = Project.objects.create(**validated_data)
+            Contributor.objects.create(
+                user=validated_data['author'],
+                project=project,
+                permission='manage',
+                role='AUTHOR'
+            )
         return project
 
     class Meta:
@@ -0,0 +1,197 @@
+import threading
+
+from django.core.signals import request_started
+from django.db.models import F
+from django.db.models.signals import (
+    pre_save, post_save, pre_delete, post_delete)
+from django.dispatch import receiver
+
+from api.cache import membership_cache
+from api.counters import (
+    COUNTED_FIELDS,
+    PROJECT_COUNTERS,
+    add_counters,
+    issue_counters,
+)
+from api.events import record_event
+from api.models import Project, Contributor, Issue, Comment
+
+# (model, pk) of the projects and issues that are being deleted by this
+# thread, their cascaded children do not need to bump the project version.
+_deleting = threading.local()
+
+
+def deleting():
+    if not hasattr(_deleting, 'objects'):
+        _deleting.objects = set()
+    return _deleting.objects
+
+
+def deleted_comments():
+    """Issue id -> number of its comments deleted along with it"""
+    if not hasattr(_deleting, 'comments'):
+        _deleting.comments = {}
+    return _deleting.comments
+
+
+@receiver(request_started)
+def reset_deleting(sender, **kwargs):
+    """Drops the marks that a failed delete might have left behind"""
+    deleting().clear()
+    deleted_comments().clear()
+
+
+@receiver(pre_save, sender=Contributor)
+def invalidate_previous_membership(sender, instance, using, **kwargs):
+    """
+    An updated Contributor-row can move to another user or project, the
+    membership of the previous pair has to be dropped as well.
+    """
+    if instance.pk is None:
+        return
+    previous = Contributor.objects.filter(pk=instance.pk).values_list(
+        'user_id', 'project_id').first()
+    if previous and previous != (instance.user_id, instance.project_id):
+        membership_cache.invalidate_on_commit(*previous, using=using)
+
+
+@receiver(post_save, sender=Contributor)
+@receiver(post_delete, sender=Contributor)
+def invalidate_membership(sender, instance, using, **kwargs):
+    membership_cache.invalidate_on_commit(
+        instance.user_id, instance.project_id, using=using)
+
+
+@receiver(pre_delete, sender=Project)
+@receiver(pre_delete, sender=Issue)
+def mark_deleting(sender, instance, **kwargs):
+    deleting().add((sender, instance.pk))
+
+
+@receiver(pre_save, sender=Project)
+def keep_project_version(sender, instance, **kwargs):
+    """
+    The in-memory version and counters can be stale, the save writes
+    version = version and leaves the bump to bump_project.
+    """
+    if not instance._state.adding:
+        for field in ('version', *PROJECT_COUNTERS):
+            setattr(instance, field, F(field))
+
+
+@receiver(post_save, sender=Project)
+def bump_project(sender, instance, created, **kwargs):
+    if not created:
+        Project.bump_version(id=instance.id)
+        # reloaded from the database on the next access
+        for field in ('version', *PROJECT_COUNTERS):
+            instance.__dict__.pop(field, None)
+
+
+@receiver(post_delete, sender=Project)
+def unmark_project(sender, instance, **kwargs):
+    deleting().discard((Project, instance.pk))
+
+
+@receiver(post_save, sender=Contributor)
+@receiver(post_delete, sender=Contributor)
+def bump_project_of_contributor(sender, instance, **kwargs):
+    if (Project, instance.project_id) not in deleting():
+        Project.bump_version(id=instance.project_id)
+
+
+@receiver(pre_save, sender=Issue)
+def remember_counted_values(sender, instance, **kwargs):
+    """
+    Keeps the counted fields of an updated Issue as they are in the
+    database, count_issue moves the counters from them. comment_count is
+    left to the database like Project.version.
+    """
+    instance._counted = None
+    if not instance._state.adding:
+        instance.comment_count = F('comment_count')
+        instance._counted = Issue.objects.filter(pk=instance.pk).values(
+            *COUNTED_FIELDS).first()
+
+
+@receiver(post_save, sender=Issue)
+def count_issue(sender, instance, created, **kwargs):
+    previous = getattr(instance, '_counted', None)
+    if created or previous is None:
+        Project.bump_version(issue_counters(instance),
+                             id=instance.project_id)
+        return
+    instance.__dict__.pop('comment_count', None)
+    if previous['project_id'] == instance.project_id:
+        Project.bump_version(
+            add_counters(issue_counters(instance),
+                         issue_counters(previous, -1)),
+            id=instance.project_id)
+    else:
+        # the comments move along
+        comments = instance.comment_count
+        Project.bump_version(
+            add_counters(issue_counters(previous, -1),
+                         {'comment_count': -comments}),
+            id=previous['project_id'])
+        Project.bump_version(
+            add_counters(issue_counters(instance),
+                         {'comment_count': comments}),
+            id=instance.project_id)
+
+
+@receiver(post_delete, sender=Issue)
+def uncount_issue(sender, instance, **kwargs):
+    deleting().discard((Issue, instance.pk))
+    comments = deleted_comments().pop(instance.pk, 0)
+    if (Project, instance.project_id) not in deleting():
+        Project.bump_version(
+            add_counters(issue_counters(instance, -1),
+                         {'comment_count': -comments}),
+            id=instance.project_id)
+
+
+@receiver(post_save, sender=Comment)
+def count_comment(sender, instance, created, **kwargs):
+    if not created:
+        Project.bump_version(issue=instance.issue_id)
+        return
+    Issue.objects.filter(pk=instance.issue_id).update(
+        comment_count=F('comment_count') + 1)
+    Project.bump_version({'comment_count': 1}, issue=instance.issue_id)
+
+
+@receiver(post_delete, sender=Comment)
+def uncount_comment(sender, instance, **kwargs):
+    if (Issue, instance.issue_id) in deleting():
+        # subtracted from the project at once by uncount_issue
+        comments = deleted_comments()
+        comments[instance.issue_id] = comments.get(instance.issue_id, 0) + 1
+        return
+    Issue.objects.filter(pk=instance.issue_id).update(
+        comment_count=F('comment_count') - 1)
+    Project.bump_version({'comment_count': -1}, issue=instance.issue_id)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Contributor)
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=Comment)
+def record_save(sender, instance, created, **kwargs):
+    record_event(instance, 'created' if created else 'updated')
+
+
+@receiver(post_delete, sender=Contributor)
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=Comment)
+def record_delete(sender, instance, **kwargs):
+    """
+    Cascaded deletes are covered by the event of the deleted issue, the
+    events of a deleted project are deleted along with it.
+    """
+    if sender is Comment:
+        parent = (Issue, instance.issue_id)
+    else:
+        parent = (Project, instance.project_id)
+    if parent not in deleting():
+        record_event(instance, 'deleted')
@@ -0,0 +1,11 @@
+"""
+SQLite backend for production use of the db.sqlite3 file.
+
+ENGINE 'api.sqlite' is Django's sqlite3 backend with two more OPTIONS:
+'pragmas', applied in order to every new connection (e.g. journal_mode=WAL,
+synchronous=NORMAL, busy_timeout), and 'transaction_mode', the BEGIN mode
+of atomic blocks. With 'IMMEDIATE' a transaction takes the write lock when
+it starts and waits up to busy_timeout for it, a deferred transaction that
+reads first fails with "database is locked" when another writer got in
+between, no matter the timeout.
+"""
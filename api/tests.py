@@ -1,3 +1,2092 @@
-from django.test import TestCase
+import asyncio
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+import tempfile
+from base64 import urlsafe_b64encode
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.management import call_command
+from django.db import IntegrityError, connection, connections, transaction
+from django.db.models import QuerySet
+from django.db.models.signals import post_save
+from django.test import (
+    AsyncClient, SimpleTestCase, TestCase, override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from api.async_views import read_only
+from api.cache import (
+    LocalLRUCache,
+    MembershipCache,
+    membership_cache,
+    response_cache,
+)
+from api.benchmark import (
+    compare_results,
+    percentile,
+    run_benchmark,
+    run_serialization_benchmark,
+    seed,
+)
+from api.concurrency import (
+    benchmark_database, run_create_benchmark, run_profile)
+from api.counters import PROJECT_COUNTERS, rebuild_counters
+from api.events import compact_events
+from api.instrumentation import RequestMetrics
+from api.live import Broker, LiveUpdatesMiddleware, LocalPubSub, get_broker
+from api.metrics import registry
+from api.models import (
+    Comment,
+    Contributor,
+    Event,
+    Issue,
+    Project,
+    coalesce_bumps,
+)
+from api.replicas import ReplicaRouter, Route, current_route, pin_key
+from api.rows import RowMapper, row_mapper
+from api.serializers import (
+    CommentSerializer,
+    ContributorSerializer,
+    IssueSerializer,
+    enroll_contributor,
+)
+from authentication.models import User
+from authentication.tokens import AccessToken
+from SoftDesk_RESTful_API import settings as project_settings
+
+
+def create_project_tree(author, title, issues=2, comments=2,
+                        collaborators=()):
+    """
+    Create a Project with its author contributor, some collaborators and
+    a number of issues that each have a number of comments.
+    """
+    project = Project.objects.create(
+        title=title, description='description', type='back end',
+        author=author)
+    Contributor.objects.create(
+        user=author, project=project, permission='manage', role='AUTHOR')
+    for user in collaborators:
+        Contributor.objects.create(
+            user=user, project=project, permission='edit',
+            role='COLLABORATOR')
+    for i in range(issues):
+        issue = Issue.objects.create(
+            title=f'issue {i}', description='description', tag='BUG',
+            priority='LOW', project=project, status='To-Do', author=author,
+            assignee=author)
+        for j in range(comments):
+            Comment.objects.create(
+                description=f'comment {j}', author=author, issue=issue)
+    return project
+
+
+class SoftDeskTestCase(APITestCase):
+    """
+    Base test case that starts every test with empty caches, database ids
+    are reused between tests but the rollback does not send any signals.
+    """
+
+    def setUp(self):
+        membership_cache.clear()
+        membership_cache.reset_stats()
+        response_cache.clear()
+        response_cache.reset_stats()
+
+
+class SoftDeskTransactionTestCase(APITransactionTestCase):
+    """
+    SoftDeskTestCase for the async endpoints, their queries run in the
+    thread pool on connections of their own that only see committed rows.
+    """
+    setUp = SoftDeskTestCase.setUp
+
+
+class ProjectListQueryCountTests(SoftDeskTestCase):
+    """
+    The number of queries of a project list must not depend on the number
+    of projects, issues or comments that are serialized.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.collaborator = User.objects.create_user(
+            email='collaborator@test.com', password='password')
+        self.client.force_authenticate(self.author)
+
+    def count_list_queries(
+            self, url='/projects/?expand=contributors,issues.comments'):
+        membership_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries), response
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        create_project_tree(self.author, 'project 0',
+                            collaborators=[self.collaborator])
+        small_count, response = self.count_list_queries()
+        self.assertEqual(response.data['count'], 1)
+
+        for i in range(1, 10):
+            create_project_tree(self.author, f'project {i}', issues=3,
+                                comments=3, collaborators=[self.collaborator])
+        large_count, response = self.count_list_queries()
+        self.assertEqual(response.data['count'], 10)
+        self.assertEqual(small_count, large_count)
+
+    def test_list_contains_nested_tree(self):
+        project = create_project_tree(self.author, 'project',
+                                      collaborators=[self.collaborator])
+        _, response = self.count_list_queries()
+        data = response.data['results'][0]
+        self.assertEqual(data['project_id'], project.id)
+        self.assertEqual(data['author_user_id'], self.author.id)
+        self.assertEqual(
+            sorted(c['user'] for c in data['contributors']),
+            ['author@test.com', 'collaborator@test.com'])
+        self.assertTrue(
+            all(c['project_id'] == project.id for c in data['contributors']))
+        self.assertEqual(len(data['issues']), 2)
+        for issue in data['issues']:
+            self.assertEqual(issue['project_id'], project.id)
+            self.assertEqual(issue['assignee_user_id'], self.author.id)
+            self.assertEqual(len(issue['comments']), 2)
+            for comment in issue['comments']:
+                self.assertEqual(comment['issue_id'], issue['issue_id'])
+
+    def test_issue_list_query_count_does_not_grow(self):
+        project = create_project_tree(self.author, 'project', issues=1)
+        url = f'/projects/{project.id}/issues/?expand=comments'
+        small_count, _ = self.count_list_queries(url)
+        for i in range(5):
+            issue = Issue.objects.create(
+                title='issue', description='description', tag='BUG',
+                priority='LOW', project=project, status='To-Do',
+                author=self.author)
+            Comment.objects.create(
+                description='comment', author=self.author, issue=issue)
+        large_count, response = self.count_list_queries(url)
+        self.assertEqual(response.data['count'], 6)
+        self.assertEqual(small_count, large_count)
+
+
+class ProjectContextTests(SoftDeskTestCase):
+    """
+    The permission classes and viewsets share one lookup of the project,
+    the issue and the Contributor-row per request.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.outsider = User.objects.create_user(
+            email='outsider@test.com', password='password')
+        self.project = create_project_tree(self.author, 'project', issues=1)
+        self.issue = self.project.issue_set.get()
+        self.comments_url = (f'/projects/{self.project.id}/issues/'
+                             f'{self.issue.id}/comments/')
+
+    def test_nested_comment_list_lookups(self):
+        self.client.force_authenticate(self.author)
+        # contributor + project, issue, page count, page
+        with self.assertNumQueries(4):
+            response = self.client.get(self.comments_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+
+    def test_non_contributor_is_forbidden(self):
+        self.client.force_authenticate(self.outsider)
+        response = self.client.get(f'/projects/{self.project.id}/issues/')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(f'/projects/{self.project.id}/')
+        self.assertEqual(response.status_code, 403)
+
+    def test_unknown_project_and_issue_are_not_found(self):
+        self.client.force_authenticate(self.author)
+        response = self.client.get('/projects/999/issues/')
+        self.assertEqual(response.status_code, 404)
+        response = self.client.get(
+            f'/projects/{self.project.id}/issues/999/comments/')
+        self.assertEqual(response.status_code, 404)
+
+    def test_only_issue_author_can_comment(self):
+        collaborator = User.objects.create_user(
+            email='collaborator@test.com', password='password')
+        Contributor.objects.create(user=collaborator, project=self.project,
+                                   permission='edit', role='COLLABORATOR')
+        self.client.force_authenticate(collaborator)
+        response = self.client.post(self.comments_url,
+                                    {'description': 'comment'})
+        self.assertEqual(response.status_code, 403)
+        self.client.force_authenticate(self.author)
+        response = self.client.post(self.comments_url,
+                                    {'description': 'comment'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['issue_id'], self.issue.id)
+
+
+class MembershipCacheTests(SoftDeskTestCase):
+    """
+    Membership checks are answered from the cache and invalidated by
+    Contributor writes.
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.collaborator = User.objects.create_user(
+            email='collaborator@test.com', password='password')
+        self.project = create_project_tree(self.author, 'project', issues=0)
+        self.url = f'/projects/{self.project.id}/issues/'
+
+    def test_membership_is_cached(self):
+        self.client.force_authenticate(self.author)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        # project version for the ETag and the count of the (empty) page,
+        # no membership lookup (another URL, not in the response cache)
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url + '?status=To-Do')
+            self.assertEqual(response.status_code, 200)
+        stats = membership_cache.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['hits'], 1)
+
+    def test_shared_tier_fills_local_tier(self):
+        membership_cache.set(self.author.id, self.project.id, True)
+        membership_cache.local.clear()
+        self.assertTrue(membership_cache.get(self.author.id, self.project.id))
+        self.assertTrue(membership_cache.get(self.author.id, self.project.id))
+        stats = membership_cache.stats()
+        self.assertEqual(stats['shared_hits'], 1)
+        self.assertEqual(stats['local_hits'], 1)
+
+    def test_contributor_writes_invalidate(self):
+        self.client.force_authenticate(self.collaborator)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        contributor = Contributor.objects.create(
+            user=self.collaborator, project=self.project,
+            permission='edit', role='COLLABORATOR')
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        contributor.delete()
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_moved_contributor_invalidates_previous_pair(self):
+        contributor = Contributor.objects.get(user=self.author)
+        membership_cache.set(self.author.id, self.project.id, True)
+        contributor.user = self.collaborator
+        contributor.save()
+        self.assertIsNone(
+            membership_cache.get(self.author.id, self.project.id))
+
+    def test_writes_invalidate_again_on_commit(self):
+        for write in ('create', 'delete'):
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    if write == 'create':
+                        contributor = Contributor.objects.create(
+                            user=self.collaborator, project=self.project,
+                            permission='edit', role='COLLABORATOR')
+                    else:
+                        contributor.delete()
+                    # a concurrent check caches the rows before the commit
+                    membership_cache.set(
+                        self.collaborator.id, self.project.id,
+                        write == 'delete')
+            self.assertIsNone(membership_cache.get(
+                self.collaborator.id, self.project.id))
+
+    def test_shared_tier_is_shared_between_processes(self):
+        backend = project_settings.CACHES['membership']['BACKEND']
+        self.assertNotIn('locmem', backend)
+        # the test runner swaps it for a cache of the test process
+        self.assertIn('locmem', membership_cache.shared.__module__)
+
+    def test_issue_assignee_becomes_member(self):
+        self.client.force_authenticate(self.collaborator)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_authenticate(self.author)
+        response = self.client.post(self.url, {
+            'title': 'issue', 'description': 'description', 'tag': 'BUG',
+            'priority': 'LOW', 'status': 'To-Do',
+            'assignee': self.collaborator.email})
+        self.assertEqual(response.status_code, 201)
+        self.client.force_authenticate(self.collaborator)
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+
+class LocalLRUCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.now = 0
+        self.cache = LocalLRUCache(maxsize=2, timeout=10,
+                                   timer=lambda: self.now)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        self.cache.set('a', 1)
+        self.cache.set('b', 2)
+        self.cache.get('a')
+        self.cache.set('c', 3)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.get('a'), 1)
+        self.assertIsNone(self.cache.get('b'))
+
+    def test_entries_expire(self):
+        self.cache.set('a', 1)
+        self.now = 9
+        self.assertEqual(self.cache.get('a'), 1)
+        self.now = 10
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_membership_cache_local_tier_expires(self):
+        cache = MembershipCache(
+            {'LOCAL_TIMEOUT': 1, 'LOCAL_MAXSIZE': 10},
+            timer=lambda: self.now)
+        cache.local.set(cache.make_key(1, 1), True)
+        self.now = 1
+        self.assertIsNone(cache.local.get(cache.make_key(1, 1)))
+
+
+class KeysetPaginationTests(SoftDeskTestCase):
+    """Opt-in keyset pagination of issues, comments and projects."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(
+            self.author, 'project', issues=25, comments=0)
+        self.url = f'/projects/{self.project.id}/issues/'
+
+    def walk(self, url):
+        """Follow the next links and return the ids and query counts"""
+        ids, query_counts = [], []
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            query_counts.append(len(queries))
+            ids += [issue['issue_id'] for issue in response.data['results']]
+            url = response.data['next']
+        return ids, query_counts
+
+    def test_keyset_pages_cover_all_rows_in_order(self):
+        ids, query_counts = self.walk(self.url + '?pagination=keyset')
+        expected = list(Issue.objects.filter(project=self.project).order_by(
+            'created_time', 'id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(query_counts), 3)
+        # deep pages cost the same as the first one (after membership cache)
+        self.assertEqual(len(set(query_counts[1:])), 1)
+
+    def test_count_only_on_request(self):
+        response = self.client.get(self.url + '?pagination=keyset')
+        self.assertNotIn('count', response.data)
+        self.assertIsNone(response.data['previous'])
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                self.url + '?pagination=keyset&count=true')
+        self.assertEqual(response.data['count'], 25)
+        self.assertTrue(any('COUNT(' in query['sql'] for query in queries))
+
+    def test_previous_link(self):
+        first = self.client.get(self.url + '?pagination=keyset').data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(
+            [issue['issue_id'] for issue in back['results']],
+            [issue['issue_id'] for issue in first['results']])
+        self.assertIsNone(back['previous'])
+
+    def test_invalid_cursor(self):
+        response = self.client.get(self.url + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+        # well-formed, but not values of the ordering fields
+        for data in ({'v': ['garbage', 1], 'r': False},
+                     {'v': [{}, 'x'], 'r': False},
+                     {'v': [None, 1], 'r': True}, ['v', 'r']):
+            token = urlsafe_b64encode(json.dumps(data).encode()).decode()
+            response = self.client.get(self.url, {'cursor': token})
+            self.assertEqual(response.status_code, 404, data)
+
+    def test_page_number_mode_is_default(self):
+        response = self.client.get(self.url + '?page=2')
+        self.assertEqual(response.data['count'], 25)
+        self.assertEqual(len(response.data['results']), 10)
+
+    def test_projects_keyset_by_title(self):
+        for title in ['b', 'a', 'c']:
+            create_project_tree(self.author, title, issues=0)
+        response = self.client.get('/projects/?pagination=keyset')
+        self.assertEqual([project['title'] for project
+                          in response.data['results']],
+                         ['a', 'b', 'c', 'project'])
+
+
+class SparseFieldsTests(SoftDeskTestCase):
+    """?fields= and ?expand= on the project and issue representations."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(self.author, 'project')
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        tables = ' '.join(query['sql'] for query in queries)
+        return response.data, tables
+
+    def test_list_does_not_embed_by_default(self):
+        data, tables = self.get('/projects/')
+        project = data['results'][0]
+        self.assertNotIn('issues', project)
+        self.assertNotIn('contributors', project)
+        self.assertIn('title', project)
+        self.assertNotIn('api_issue', tables)
+        self.assertNotIn('api_comment', tables)
+
+    def test_detail_embeds_everything_by_default(self):
+        data, _ = self.get(f'/projects/{self.project.id}/')
+        self.assertEqual(len(data['contributors']), 1)
+        self.assertEqual(len(data['issues']), 2)
+        self.assertEqual(len(data['issues'][0]['comments']), 2)
+
+    def test_expand_nested_relation(self):
+        data, tables = self.get('/projects/?expand=issues')
+        project = data['results'][0]
+        self.assertNotIn('contributors', project)
+        self.assertNotIn('comments', project['issues'][0])
+        self.assertNotIn('api_comment', tables)
+
+        data, _ = self.get('/projects/?expand=issues.comments')
+        self.assertEqual(
+            len(data['results'][0]['issues'][0]['comments']), 2)
+
+    def test_fields(self):
+        data, tables = self.get(
+            f'/projects/{self.project.id}/?fields=project_id,title')
+        self.assertEqual(set(data), {'project_id', 'title'})
+        self.assertNotIn('api_issue', tables)
+
+    def test_issue_fields_and_expand(self):
+        url = f'/projects/{self.project.id}/issues/'
+        data, tables = self.get(url + '?fields=issue_id,status')
+        self.assertEqual(set(data['results'][0]), {'issue_id', 'status'})
+        self.assertNotIn('api_comment', tables)
+        data, _ = self.get(url + '?expand=comments')
+        self.assertEqual(len(data['results'][0]['comments']), 2)
+
+
+class BulkTests(SoftDeskTestCase):
+    """Bulk endpoints of IssueViewSet and ContributorViewSet."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.users = [User.objects.create_user(
+            email=f'user{i}@test.com', password='password')
+            for i in range(5)]
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(self.author, 'project', issues=0)
+        self.issues_url = f'/projects/{self.project.id}/issues/bulk/'
+        self.users_url = f'/projects/{self.project.id}/users/bulk/'
+
+    def issue_item(self, assignee=None, **kwargs):
+        item = {'title': 'issue', 'description': 'description',
+                'tag': 'BUG', 'priority': 'LOW', 'status': 'To-Do',
+                'assignee': assignee}
+        item.update(kwargs)
+        return item
+
+    def test_bulk_create_issues(self):
+        items = [self.issue_item(user.email) for user in self.users]
+        items += [self.issue_item(), self.issue_item(tag='WRONG'),
+                  self.issue_item('unknown@test.com')]
+        response = self.client.post(self.issues_url, items, format='json')
+        self.assertEqual(response.status_code, 207)
+        results = response.data['results']
+        self.assertEqual([item['index'] for item in results],
+                         list(range(len(items))))
+        self.assertEqual([item['status'] for item in results],
+                         [201] * 6 + [400] * 2)
+        self.assertIn('tag', results[6]['errors'])
+        self.assertIn('assignee', results[7]['errors'])
+        self.assertEqual(results[5]['data']['assignee_user_id'],
+                         self.author.id)
+        self.assertEqual(
+            Issue.objects.filter(project=self.project).count(), 6)
+        self.assertEqual(
+            set(Issue.objects.values_list('id', flat=True)),
+            {item['data']['issue_id'] for item in results[:6]})
+        # every assignee became a contributor
+        self.assertEqual(
+            Contributor.objects.filter(project=self.project).count(), 6)
+        self.client.force_authenticate(self.users[0])
+        response = self.client.get(f'/projects/{self.project.id}/issues/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_bulk_query_count_does_not_grow(self):
+        def count(items):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    self.issues_url, items, format='json')
+            self.assertEqual(response.status_code, 201)
+            return len(queries)
+
+        small = count([self.issue_item(self.users[0].email)])
+        large = count([self.issue_item(user.email)
+                       for user in self.users[1:]] * 20)
+        self.assertEqual(small, large)
+
+    def test_bulk_requires_list(self):
+        response = self.client.post(
+            self.issues_url, self.issue_item(), format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_save_contributors(self):
+        items = [{'user': self.users[0].email},
+                 {'user': self.author.email, 'role': 'AUTHOR'},
+                 {'user': self.users[0].email},
+                 {'user': 'unknown@test.com'}]
+        response = self.client.post(self.users_url, items, format='json')
+        self.assertEqual(response.status_code, 207)
+        results = response.data['results']
+        self.assertEqual([item['status'] for item in results],
+                         [201, 200, 400, 400])
+        self.assertEqual(results[0]['data']['permission'], 'edit')
+        self.assertEqual(results[0]['data']['user'], self.users[0].email)
+        self.assertEqual(results[1]['data']['permission'], 'manage')
+        self.assertTrue(Contributor.objects.filter(
+            project=self.project, user=self.users[0]).exists())
+
+    def test_only_project_author_saves_contributors(self):
+        Contributor.objects.create(user=self.users[0], project=self.project,
+                                   permission='edit', role='COLLABORATOR')
+        self.client.force_authenticate(self.users[0])
+        response = self.client.post(
+            self.users_url, [{'user': self.users[1].email}], format='json')
+        self.assertEqual(response.status_code, 403)
+
+
+class ExportTests(SoftDeskTestCase):
+    """Streaming export of a project and the export_project command."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(
+            self.author, 'project', issues=7, comments=3)
+        self.url = f'/projects/{self.project.id}/export/'
+
+    def export(self, query=''):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content).decode()
+
+    def test_ndjson_matches_api_representation(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = [json.loads(line) for line in content.splitlines()]
+        api = self.client.get(
+            f'/projects/{self.project.id}/issues/?expand=comments'
+        ).data['results']
+        self.assertEqual(len(lines), 7)
+        self.assertEqual(lines, json.loads(json.dumps(api)))
+
+    def test_csv(self):
+        response, content = self.export('?output=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual(len(rows), 7 + 7 * 3)
+        self.assertEqual(rows[0]['record'], 'issue')
+        self.assertEqual(rows[1]['record'], 'comment')
+        self.assertEqual(rows[1]['issue_id'], rows[0]['issue_id'])
+
+    async def test_asgi(self):
+        # the async client iterates the response on the event loop, like
+        # the ASGIHandler
+        await sync_to_async(self.async_client.force_login)(self.author)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        content = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(content.splitlines()), 7)
+
+    def test_unknown_output_format(self):
+        response = self.client.get(self.url + '?output=xml')
+        self.assertEqual(response.status_code, 400)
+
+    def test_queries_per_chunk(self):
+        from api.export import export_ndjson
+
+        with CaptureQueriesContext(connection) as queries:
+            lines = list(export_ndjson(self.project.id, chunk_size=3))
+        self.assertEqual(len(lines), 7)
+        # one issue query, one comment query per chunk of 3 issues
+        self.assertEqual(len(queries), 1 + 3)
+
+    def test_command_writes_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'export.ndjson')
+            call_command('export_project', self.project.id, output=path)
+            with open(path, encoding='utf-8') as file:
+                lines = file.read().splitlines()
+        _, content = self.export()
+        self.assertEqual(lines, content.splitlines())
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN of SQLite')
+class QueryPlanTests(TestCase):
+    """The hot queries of the viewsets are answered from indexes."""
+
+    def assertUsesIndex(self, queryset, index=None):
+        plan = queryset.explain()
+        self.assertIn('INDEX', plan)
+        if index:
+            self.assertIn(index, plan)
+        self.assertNotRegex(plan, r'SCAN (api_\w+)(?! USING)')
+
+    def test_issues_of_project(self):
+        self.assertUsesIndex(
+            Issue.objects.filter(project_id=1).order_by('created_time', 'id'),
+            'issue_project_created_idx')
+
+    def test_issues_by_status(self):
+        self.assertUsesIndex(
+            Issue.objects.filter(project_id=1, status='To-Do',
+                                 priority='HIGH'),
+            'issue_project_status_idx')
+
+    def test_comments_of_issue(self):
+        self.assertUsesIndex(
+            Comment.objects.filter(issue_id=1).order_by('created_time', 'id'),
+            'comment_issue_created_idx')
+
+    def test_contributor_membership(self):
+        self.assertUsesIndex(
+            Contributor.objects.filter(user_id=1, project_id=1))
+
+    def test_projects_of_user(self):
+        self.assertUsesIndex(
+            Project.objects.filter(contributors=1).order_by('title', 'id'))
+
+
+class IssueFilterTests(SoftDeskTestCase):
+    """Filtering, ordering and full-text search of IssueViewSet."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.assignee = User.objects.create_user(
+            email='assignee@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(self.author, 'project', issues=0)
+        self.url = f'/projects/{self.project.id}/issues/'
+        self.login = self.create_issue(
+            'Login fails', 'The login form crashes on submit',
+            status='In-Progress', priority='HIGH', assignee=self.assignee)
+        self.export = self.create_issue(
+            'Export', 'Add a CSV export of all projects', tag='ENHANCEMENT')
+        self.docs = self.create_issue(
+            'Documentation', 'Write the onboarding docs', tag='TASK',
+            status='Completed', priority='MEDIUM')
+
+    def create_issue(self, title, description, tag='BUG', priority='LOW',
+                     status='To-Do', assignee=None):
+        return Issue.objects.create(
+            title=title, description=description, tag=tag,
+            priority=priority, status=status, project=self.project,
+            author=self.author, assignee=assignee or self.author)
+
+    def ids(self, query):
+        response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200, response.data)
+        return [issue['issue_id'] for issue in response.data['results']]
+
+    def test_choice_filters(self):
+        self.assertEqual(self.ids('?status=In-Progress'), [self.login.id])
+        self.assertEqual(self.ids('?priority=LOW,MEDIUM'),
+                         [self.export.id, self.docs.id])
+        self.assertEqual(self.ids('?tag=TASK&status=Completed'),
+                         [self.docs.id])
+
+    def test_invalid_choice(self):
+        response = self.client.get(self.url + '?status=Unknown')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('status', response.data)
+
+    def test_assignee_by_email_and_id(self):
+        self.assertEqual(self.ids('?assignee=assignee@test.com'),
+                         [self.login.id])
+        self.assertEqual(self.ids(f'?assignee={self.author.id}'),
+                         [self.export.id, self.docs.id])
+
+    def test_created_time_range(self):
+        Issue.objects.filter(id=self.login.id).update(
+            created_time='2020-01-01T12:00:00Z')
+        self.assertEqual(self.ids('?created_before=2021-01-01'),
+                         [self.login.id])
+        self.assertEqual(self.ids('?created_after=2021-01-01T00:00:00Z'),
+                         [self.export.id, self.docs.id])
+        response = self.client.get(self.url + '?created_after=yesterday')
+        self.assertEqual(response.status_code, 400)
+
+    def test_ordering(self):
+        self.assertEqual(self.ids('?ordering=title'),
+                         [self.docs.id, self.export.id, self.login.id])
+        self.assertEqual(self.ids('?ordering=-created_time'),
+                         [self.docs.id, self.export.id, self.login.id])
+
+    def test_full_text_search(self):
+        from api.search import issue_fts_available
+
+        if connection.vendor == 'sqlite':
+            self.assertTrue(issue_fts_available())
+        self.assertEqual(self.ids('?q=login'), [self.login.id])
+        self.assertEqual(self.ids('?q=onboard'), [self.docs.id])
+        self.assertEqual(self.ids('?q=csv%20export'), [self.export.id])
+        self.assertEqual(self.ids('?q=%22'), [])
+
+    def test_search_index_follows_updates(self):
+        self.client.patch(self.url + f'{self.export.id}/',
+                          {'title': 'Backup'})
+        self.assertEqual(self.ids('?q=backup'), [self.export.id])
+        self.export.delete()
+        self.assertEqual(self.ids('?q=backup'), [])
+
+    def test_search_fallback(self):
+        from api import search
+
+        search._fts_available['default'] = False
+        try:
+            self.assertEqual(self.ids('?q=LOGIN'), [self.login.id])
+            self.assertEqual(self.ids('?q=csv%20export'), [self.export.id])
+        finally:
+            search._fts_available.clear()
+
+
+class ConditionalGetTests(SoftDeskTestCase):
+    """ETag / Last-Modified of the project tree."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(self.author, 'project')
+        self.issue = self.project.issue_set.first()
+        self.url = f'/projects/{self.project.id}/'
+
+    def get(self, url=None, **headers):
+        return self.client.get(url or self.url, **headers)
+
+    def version(self):
+        return Project.objects.get(id=self.project.id).version
+
+    def test_not_modified(self):
+        etag = self.get()['ETag']
+        self.client.get(self.url)  # fills the membership cache
+        # only the project version, nothing is serialized
+        with self.assertNumQueries(1):
+            response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_if_modified_since(self):
+        last_modified = self.get()['Last-Modified']
+        response = self.get(HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_etag_depends_on_representation(self):
+        self.assertNotEqual(self.get()['ETag'],
+                            self.get(self.url + '?expand=issues')['ETag'])
+
+    def test_changes_in_the_tree_bump_the_version(self):
+        etag = self.get()['ETag']
+        version = self.version()
+        Comment.objects.create(description='new', author=self.author,
+                               issue=self.issue)
+        self.assertEqual(self.version(), version + 1)
+        self.issue.status = 'Completed'
+        self.issue.save()
+        Contributor.objects.create(
+            user=User.objects.create_user(email='new@test.com'),
+            project=self.project, permission='edit', role='COLLABORATOR')
+        self.project.title = 'renamed'
+        self.project.save()
+        self.assertEqual(self.version(), version + 4)
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_nested_lists(self):
+        url = f'/projects/{self.project.id}/issues/{self.issue.id}/comments/'
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+                         304)
+        self.client.post(url, {'description': 'comment'})
+        self.assertEqual(self.get(url, HTTP_IF_NONE_MATCH=etag).status_code,
+                         200)
+
+    def test_bulk_bumps_the_version(self):
+        version = self.version()
+        self.client.post(
+            f'/projects/{self.project.id}/issues/bulk/',
+            [{'title': 'issue', 'description': 'description', 'tag': 'BUG',
+              'priority': 'LOW', 'status': 'To-Do'}], format='json')
+        self.assertEqual(self.version(), version + 1)
+
+    def test_cascaded_deletes_bump_once(self):
+        version = self.version()
+        with CaptureQueriesContext(connection) as queries:
+            self.issue.delete()
+        updates = [query for query in queries
+                   if query['sql'].startswith('UPDATE "api_project"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.version(), version + 1)
+
+    def test_not_modified_requires_permission(self):
+        etag = self.get()['ETag']
+        self.client.force_authenticate(
+            User.objects.create_user(email='outsider@test.com'))
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 403)
+
+
+class ResponseCacheTests(SoftDeskTestCase):
+    """Rendered responses are cached per project version."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(self.author, 'project')
+        self.issue = self.project.issue_set.first()
+        self.url = f'/projects/{self.project.id}/'
+
+    def test_detail_is_served_from_cache(self):
+        first = self.client.get(self.url)
+        # project version only, the membership is cached as well
+        with self.assertNumQueries(1):
+            second = self.client.get(self.url)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(second['Content-Type'], 'application/json')
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(response_cache.stats(), {'hits': 1, 'misses': 1})
+
+    def test_writes_invalidate(self):
+        self.client.get(self.url)
+        self.client.patch(f'/projects/{self.project.id}/issues/'
+                          f'{self.issue.id}/', {'title': 'renamed'})
+        response = self.client.get(self.url)
+        self.assertEqual(response_cache.stats()['hits'], 0)
+        self.assertIn('renamed', [issue['title']
+                                  for issue in response.json()['issues']])
+
+    def test_issue_list_pages(self):
+        url = f'/projects/{self.project.id}/issues/'
+        self.client.get(url)
+        self.client.get(url)
+        self.client.get(url + '?fields=title')
+        self.assertEqual(response_cache.stats(), {'hits': 1, 'misses': 2})
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'api.example.com'])
+    def test_hosts_are_cached_apart(self):
+        self.client.get(self.url)
+        response = self.client.get(self.url, HTTP_HOST='api.example.com')
+        self.assertEqual(response_cache.stats(), {'hits': 0, 'misses': 2})
+        self.assertTrue(response.json()['url'].startswith(
+            'http://api.example.com/'))
+        response = self.client.get(self.url, secure=True)
+        self.assertTrue(response.json()['url'].startswith('https://'))
+
+    def test_browsable_api_is_not_cached(self):
+        self.client.get(self.url, HTTP_ACCEPT='text/html')
+        self.client.get(self.url, HTTP_ACCEPT='text/html')
+        self.assertEqual(response_cache.stats(), {'hits': 0, 'misses': 0})
+
+    def test_permissions_before_cache(self):
+        self.client.get(self.url)
+        self.client.force_authenticate(
+            User.objects.create_user(email='outsider@test.com'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class CounterTests(SoftDeskTestCase):
+    """The issue and comment counters follow every change of the tree."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(self.author, 'project',
+                                           issues=2, comments=2)
+        self.other = create_project_tree(self.author, 'other', issues=1,
+                                         comments=1)
+
+    def counters(self):
+        return {project.id: {counter: getattr(project, counter)
+                             for counter in PROJECT_COUNTERS}
+                for project in Project.objects.all()}
+
+    def assertCountersMatch(self):
+        counters = self.counters()
+        issues = dict(Issue.objects.values_list('id', 'comment_count'))
+        rebuild_counters()
+        self.assertEqual(counters, self.counters())
+        self.assertEqual(
+            issues, dict(Issue.objects.values_list('id', 'comment_count')))
+
+    def test_created_tree(self):
+        counters = self.counters()[self.project.id]
+        self.assertEqual(counters['issue_count'], 2)
+        self.assertEqual(counters['comment_count'], 4)
+        self.assertEqual(counters['todo_count'], 2)
+        self.assertEqual(counters['bug_count'], 2)
+        self.assertCountersMatch()
+
+    def test_issue_update(self):
+        issue = self.project.issue_set.first()
+        issue.status = 'Completed'
+        issue.tag = 'TASK'
+        issue.save()
+        counters = self.counters()[self.project.id]
+        self.assertEqual((counters['todo_count'], counters['completed_count'],
+                          counters['bug_count'], counters['task_count']),
+                         (1, 1, 1, 1))
+        issue.project = self.other
+        issue.save()
+        self.assertEqual(self.counters()[self.other.id]['comment_count'], 3)
+        self.assertCountersMatch()
+
+    def test_stale_instances_keep_the_counters(self):
+        issue = self.project.issue_set.first()
+        Comment.objects.create(description='new', author=self.author,
+                               issue=issue)
+        self.project.title = 'renamed'
+        self.project.save()
+        issue.title = 'renamed'
+        issue.save()
+        self.assertEqual(issue.comment_count, 3)
+        self.assertEqual(self.project.comment_count, 5)
+        self.assertCountersMatch()
+
+    def test_deletes(self):
+        self.project.issue_set.first().comment_set.first().delete()
+        self.project.issue_set.last().delete()
+        counters = self.counters()[self.project.id]
+        self.assertEqual(
+            (counters['issue_count'], counters['comment_count']), (1, 1))
+        self.assertCountersMatch()
+        User.objects.create_user(email='other@test.com')
+        self.author.delete()
+        self.assertEqual(self.counters(), {})
+
+    def test_api_writes(self):
+        issues_url = f'/projects/{self.project.id}/issues/'
+        response = self.client.post(issues_url, {
+            'title': 'issue', 'description': 'description', 'tag': 'TASK',
+            'priority': 'HIGH', 'status': 'In-Progress', 'assignee': None},
+            format='json')
+        issue_id = response.data['issue_id']
+        self.client.post(f'{issues_url}{issue_id}/comments/',
+                         {'description': 'comment'})
+        self.client.post(f'{issues_url}bulk/', [
+            {'title': 'issue', 'description': 'description', 'tag': 'BUG',
+             'priority': 'LOW', 'status': 'Completed'}], format='json')
+        self.client.patch(f'{issues_url}{issue_id}/', {'priority': 'LOW'})
+        counters = self.counters()[self.project.id]
+        self.assertEqual(counters['issue_count'], 4)
+        self.assertEqual(counters['comment_count'], 5)
+        self.assertEqual(counters['low_priority_count'], 4)
+        self.assertCountersMatch()
+
+    def test_stats(self):
+        outsider = User.objects.create_user(email='outsider@test.com')
+        create_project_tree(outsider, 'not mine')
+        with self.assertNumQueries(1):
+            response = self.client.get('/projects/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([project['title'] for project in
+                          response.data['projects']], ['other', 'project'])
+        self.assertEqual(response.data['projects'][1], {
+            'project_id': self.project.id, 'title': 'project',
+            'issues': 2, 'comments': 4,
+            'status': {'To-Do': 2, 'In-Progress': 0, 'Completed': 0},
+            'priority': {'LOW': 2, 'MEDIUM': 0, 'HIGH': 0},
+            'tag': {'BUG': 2, 'ENHANCEMENT': 0, 'TASK': 0}})
+        self.assertEqual(response.data['total']['issues'], 3)
+        self.assertEqual(response.data['total']['comments'], 5)
+
+    def test_rebuild_command(self):
+        Project.objects.update(issue_count=0, comment_count=99)
+        Issue.objects.update(comment_count=0)
+        out = io.StringIO()
+        call_command('rebuild_counters', str(self.project.id), stdout=out)
+        self.assertIn('Recounted 1 projects', out.getvalue())
+        counters = self.counters()
+        self.assertEqual(counters[self.project.id]['comment_count'], 4)
+        self.assertEqual(counters[self.other.id]['comment_count'], 99)
+
+
+class EventLogTests(SoftDeskTestCase):
+    """Writes are recorded in the event log, clients sync from a cursor."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(self.author, 'project', issues=1,
+                                           comments=2)
+        self.issue = self.project.issue_set.get()
+        self.url = f'/projects/{self.project.id}/changes/'
+        self.cursor = self.client.get(self.url).data['cursor']
+
+    def changes(self, since=None, **params):
+        response = self.client.get(
+            self.url, {'since': self.cursor if since is None else since,
+                       **params})
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def summary(self, events):
+        return [(event['model'], event['action']) for event in events]
+
+    def test_cursor_of_a_new_client(self):
+        self.assertEqual(self.cursor, Event.objects.latest('id').id)
+        self.assertEqual(self.changes()['events'], [])
+        self.assertEqual(len(self.changes(since=0)['events']), 5)
+
+    def test_writes_are_recorded(self):
+        issues_url = f'/projects/{self.project.id}/issues/'
+        self.client.patch(f'{issues_url}{self.issue.id}/',
+                          {'status': 'Completed'})
+        comments_url = f'{issues_url}{self.issue.id}/comments/'
+        comment_id = self.client.post(
+            comments_url, {'description': 'new'}).data['comment_id']
+        self.client.delete(f'{comments_url}{comment_id}/')
+        self.client.patch(f'/projects/{self.project.id}/',
+                          {'title': 'renamed'})
+
+        changes = self.changes()
+        self.assertEqual(self.summary(changes['events']), [
+            ('issue', 'updated'), ('comment', 'created'),
+            ('comment', 'deleted'), ('project', 'updated')])
+        issue = changes['events'][0]
+        self.assertEqual(issue['id'], self.issue.id)
+        self.assertEqual(issue['data']['status'], 'Completed')
+        self.assertNotIn('comment_count', issue['data'])
+        self.assertEqual(changes['events'][2]['data'], {})
+        self.assertEqual(changes['cursor'], changes['events'][-1]['cursor'])
+        self.assertEqual(self.changes(since=changes['cursor'])['events'], [])
+
+    def test_pages(self):
+        for i in range(3):
+            Comment.objects.create(description=f'new {i}',
+                                   author=self.author, issue=self.issue)
+        page = self.changes(limit=2)
+        self.assertEqual(len(page['events']), 2)
+        self.assertTrue(page['has_more'])
+        page = self.changes(since=page['cursor'], limit=2)
+        self.assertEqual(len(page['events']), 1)
+        self.assertFalse(page['has_more'])
+
+    def test_cascaded_deletes(self):
+        self.issue.delete()
+        self.assertEqual(self.summary(self.changes()['events']),
+                         [('issue', 'deleted')])
+        self.project.delete()
+        self.assertFalse(Event.objects.exists())
+
+    def test_bulk_writes_are_recorded(self):
+        other = User.objects.create_user(email='other@test.com')
+        self.client.post(
+            f'/projects/{self.project.id}/issues/bulk/',
+            [{'title': 'issue', 'description': 'description', 'tag': 'BUG',
+              'priority': 'LOW', 'status': 'To-Do',
+              'assignee': 'other@test.com'}], format='json')
+        events = self.changes()['events']
+        self.assertEqual(self.summary(events),
+                         [('contributor', 'created'), ('issue', 'created')])
+        self.assertEqual(events[0]['data']['user_id'], other.id)
+
+    def test_atomic_contributor_save_invalidates_after_commit(self):
+        other = User.objects.create_user(email='other@test.com')
+
+        def concurrent_check(instance, **kwargs):
+            # another request caches the membership before the commit
+            membership_cache.set(instance.user_id, instance.project_id,
+                                 False)
+
+        post_save.connect(concurrent_check, sender=Contributor)
+        self.addCleanup(post_save.disconnect, concurrent_check,
+                        sender=Contributor)
+        with self.captureOnCommitCallbacks(execute=True):
+            Contributor.objects.create(user=other, project=self.project,
+                                       permission='edit',
+                                       role='COLLABORATOR')
+        self.assertIsNone(membership_cache.get(other.id, self.project.id))
+
+    def test_compaction(self):
+        Comment.objects.create(description='new', author=self.author,
+                               issue=self.issue)
+        Event.objects.filter(id__lte=self.cursor).update(
+            created_time=timezone.now() - timedelta(days=40))
+        out = io.StringIO()
+        call_command('compact_events', stdout=out)
+        self.assertIn('Deleted 5 events', out.getvalue())
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.compacted_event_id, self.cursor)
+        self.assertEqual(self.client.get(self.url, {'since': 0}).status_code,
+                         410)
+        self.assertEqual(len(self.changes()['events']), 1)
+        self.assertEqual(compact_events(), 0)
+
+    def test_errors(self):
+        self.assertEqual(
+            self.client.get(self.url, {'since': 'x'}).status_code, 400)
+        self.assertEqual(
+            self.client.get(self.url, {'limit': 0}).status_code, 400)
+        self.client.force_authenticate(
+            User.objects.create_user(email='outsider@test.com'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+
+class CreatePathTests(SoftDeskTestCase):
+    """Issues and projects are created in one transaction, rows once."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.other = User.objects.create_user(
+            email='other@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(self.author, 'project', issues=0)
+        self.url = f'/projects/{self.project.id}/issues/'
+        self.cursor = Event.objects.latest('id').id
+
+    def create_issue(self, assignee):
+        return self.client.post(self.url, {
+            'title': 'issue', 'description': 'description', 'tag': 'BUG',
+            'priority': 'LOW', 'status': 'To-Do', 'assignee': assignee},
+            format='json')
+
+    def new_events(self):
+        return list(Event.objects.filter(id__gt=self.cursor).values_list(
+            'model', 'action'))
+
+    def test_assignee_is_enrolled_once(self):
+        version = Project.objects.get(pk=self.project.pk).version
+        self.assertEqual(self.create_issue(self.other.email).status_code, 201)
+        self.assertTrue(Contributor.objects.filter(
+            project=self.project, user=self.other,
+            role='COLLABORATOR').exists())
+        # no second save of the contributor
+        self.assertEqual(self.new_events(), [('contributor', 'created'),
+                                             ('issue', 'created')])
+        # one UPDATE of the project for both rows
+        self.assertEqual(Project.objects.get(pk=self.project.pk).version,
+                         version + 1)
+
+        self.cursor = Event.objects.latest('id').id
+        self.assertEqual(self.create_issue(self.other.email).status_code, 201)
+        self.assertEqual(self.new_events(), [('issue', 'created')])
+
+    def test_membership_check_does_not_load_the_contributors(self):
+        self.client.get(self.url)  # caches the membership of the author
+        with CaptureQueriesContext(connection) as queries:
+            self.create_issue(None)
+        contributor_queries = [query['sql'] for query in queries
+                               if '"api_contributor"' in query['sql']]
+        # the get of get_or_create, through the unique index
+        self.assertEqual(len(contributor_queries), 1)
+        self.assertIn('"api_contributor"."user_id" = ', contributor_queries[0])
+
+    def test_concurrent_enrollment(self):
+        # the contributor was added after the check of the request
+        missed = []
+        get = QuerySet.get
+
+        def get_after_insert(queryset, *args, **kwargs):
+            if not missed:
+                missed.append(kwargs)
+                raise Contributor.DoesNotExist()
+            return get(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'get', get_after_insert):
+            enroll_contributor(self.project, self.author)
+        self.assertEqual(len(missed), 1)
+        self.assertEqual(Contributor.objects.filter(
+            project=self.project, user=self.author).count(), 1)
+
+    def test_project_is_created_with_its_author(self):
+        response = self.client.post('/projects/', {
+            'title': 'new', 'description': 'description',
+            'type': 'back end'})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(self.new_events(), [('project', 'created'),
+                                             ('contributor', 'created')])
+
+        count = Project.objects.count()
+        with mock.patch.object(Contributor.objects, 'create',
+                               side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.client.post('/projects/', {
+                    'title': 'failed', 'description': 'description',
+                    'type': 'back end'})
+        self.assertEqual(Project.objects.count(), count)
+
+
+class RowMapperTests(SoftDeskTestCase):
+    """The .values() rows of the list actions serialize like the models."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.other = User.objects.create_user(
+            email='other@test.com', password='password')
+        self.project = create_project_tree(self.author, 'project', issues=3,
+                                           comments=2,
+                                           collaborators=[self.other])
+        Contributor.objects.filter(user=self.other).update(permission=None)
+        self.issue = self.project.issue_set.first()
+
+    def assertParity(self, serializer_class, queryset, **kwargs):
+        expected = serializer_class(queryset, many=True, **kwargs).data
+        mapper = row_mapper(serializer_class(**kwargs))
+        rows = mapper.serialize(mapper.values(queryset))
+        renderer = JSONRenderer()
+        self.assertEqual(renderer.render(rows), renderer.render(expected))
+
+    def test_parity(self):
+        issues = Issue.objects.order_by('created_time', 'id')
+        self.assertParity(IssueSerializer, issues, expand=set())
+        self.assertParity(IssueSerializer,
+                          issues.prefetch_related('comment_set'),
+                          expand={'comments'})
+        self.assertParity(IssueSerializer, issues,
+                          fields={'title', 'created_time'}, expand=set())
+        self.assertParity(CommentSerializer,
+                          Comment.objects.order_by('created_time', 'id'))
+        self.assertParity(ContributorSerializer,
+                          Contributor.objects.order_by('id'))
+        with timezone.override('Europe/Paris'):
+            self.assertParity(CommentSerializer, Comment.objects.all())
+
+    def test_list_endpoints(self):
+        self.client.force_authenticate(self.author)
+        base = f'/projects/{self.project.id}/'
+        issues = self.client.get(f'{base}issues/?expand=comments')
+        self.assertEqual(
+            issues.json()['results'],
+            json.loads(JSONRenderer().render(IssueSerializer(
+                self.project.issue_set.order_by('created_time', 'id'),
+                many=True, expand={'comments'}).data)))
+        response_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(f'{base}issues/?expand=comments')
+        # the comments of the page with one query
+        self.assertEqual(len([query for query in queries
+                              if 'FROM "api_comment"' in query['sql']]), 1)
+        contributors = self.client.get(f'{base}users/').json()['results']
+        self.assertEqual({contributor['user'] for contributor in contributors},
+                         {'author@test.com', 'other@test.com'})
+
+    def test_sparse_fields_and_keyset_pages(self):
+        for i in range(3, 12):
+            Issue.objects.create(
+                title=f'issue {i}', description='description', tag='BUG',
+                priority='LOW', project=self.project, status='To-Do',
+                author=self.author, assignee=self.author)
+        self.client.force_authenticate(self.author)
+        url = (f'/projects/{self.project.id}/issues/?fields=title'
+               f'&pagination=keyset')
+        page = self.client.get(url).json()
+        self.assertEqual(page['results'],
+                         [{'title': f'issue {i}'} for i in range(10)])
+        page = self.client.get(page['next']).json()
+        self.assertEqual(page['results'],
+                         [{'title': 'issue 10'}, {'title': 'issue 11'}])
+
+    def test_method_fields_need_row_relations(self):
+        serializer = IssueSerializer(expand={'comments'})
+        with mock.patch.object(IssueSerializer, 'row_relations', {}):
+            with self.assertRaises(ImproperlyConfigured):
+                RowMapper(serializer)
+
+
+class AsyncViewTests(SoftDeskTransactionTestCase):
+    """The async read endpoints answer like the DRF viewsets."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.outsider = User.objects.create_user(
+            email='outsider@test.com', password='password')
+        self.project = create_project_tree(self.author, 'project', issues=3)
+        self.issue = self.project.issue_set.first()
+        self.async_client = AsyncClient()
+
+    def get(self, url, user=None):
+        # the AsyncClient of Django 4.0 takes the raw ASGI header names
+        headers = {}
+        if user is not None:
+            headers['authorization'] = f'Bearer {AccessToken.for_user(user)}'
+
+        async def request():
+            return await self.async_client.get(url, **headers)
+        return async_to_sync(request)()
+
+    def assertSameAsSync(self, path):
+        self.client.force_authenticate(self.author)
+        expected = self.client.get(path)
+        response = self.get(f'/async{path}', self.author)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertEqual(response.json(), expected.json())
+
+    def test_project_detail(self):
+        self.assertSameAsSync(f'/projects/{self.project.id}/')
+        self.assertSameAsSync(
+            f'/projects/{self.project.id}/?fields=id,title,issues'
+            f'&expand=issues')
+
+    def test_issue_list(self):
+        base = f'/projects/{self.project.id}/issues/'
+        self.assertSameAsSync(base)
+        self.assertSameAsSync(base + '?status=To-Do&ordering=-title')
+        self.assertSameAsSync(base + '?pagination=keyset&page_size=2')
+        self.assertSameAsSync(base + '?expand=comments&fields=id,comments')
+        self.assertSameAsSync(base + '?pagination=keyset&fields=title')
+
+    def test_comment_list(self):
+        self.assertSameAsSync(
+            f'/projects/{self.project.id}/issues/{self.issue.id}/comments/')
+
+    def test_errors(self):
+        url = f'/async/projects/{self.project.id}/issues/'
+        self.assertEqual(self.get(url).status_code, 401)
+        self.assertEqual(self.get(url, self.outsider).status_code, 403)
+        self.assertEqual(
+            self.get('/async/projects/999/issues/', self.author).status_code,
+            404)
+        response = self.get(
+            f'/async/projects/{self.project.id}/issues/999/comments/',
+            self.author)
+        self.assertEqual(response.status_code, 404)
+        response = self.get(url + '?status=Unknown', self.author)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('status', response.json()['detail'])
+
+    def test_steps_close_their_connections(self):
+        # CONN_MAX_AGE would keep them open in the pool threads
+        step = read_only(Project.objects.exists)
+        wrapper = type(connections['default'])
+        with mock.patch.object(wrapper, 'close') as close:
+            self.assertTrue(async_to_sync(step)())
+        close.assert_called()
+
+    def test_membership_is_cached(self):
+        self.get(f'/async/projects/{self.project.id}/', self.author)
+        self.get(f'/async/projects/{self.project.id}/', self.author)
+        self.assertEqual(membership_cache.stats()['local_hits'], 1)
+
+
+class LiveUpdateTests(SoftDeskTransactionTestCase):
+    """Issue and comment events reach the live connections of the project."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.project = create_project_tree(self.author, 'project', issues=1,
+                                           comments=0)
+        self.issue = self.project.issue_set.get()
+        self.path = f'/live/projects/{self.project.id}/'
+        self.application = LiveUpdatesMiddleware(None)
+
+    def scope(self, query='', user=None, headers=(), method='GET',
+              path=None):
+        user = self.author if user is None else user
+        return {
+            'type': 'http', 'method': method, 'path': path or self.path,
+            'query_string': query.encode(), 'root_path': '',
+            'headers': [
+                (b'authorization', f'Bearer {AccessToken.for_user(user)}'
+                 .encode()), *headers],
+        }
+
+    def comment(self, description='new'):
+        # autocommit, the events are published right away
+        return Comment.objects.create(description=description,
+                                      author=self.author, issue=self.issue)
+
+    async def serve(self, scope, while_connected=None):
+        """
+        Runs the live endpoint, while_connected(next_chunk) runs once the
+        response started. Returns the response start and the body.
+        """
+        sent = asyncio.Queue()
+        disconnected = asyncio.Event()
+
+        async def receive():
+            await disconnected.wait()
+            return {'type': 'http.disconnect'}
+
+        async def next_chunk():
+            message = await asyncio.wait_for(sent.get(), 5)
+            return message.get('body', b'')
+
+        task = asyncio.ensure_future(
+            self.application(scope, receive, sent.put))
+        start = await asyncio.wait_for(sent.get(), 5)
+        chunks = []
+        if while_connected is not None and start['status'] == 200:
+            chunks = await while_connected(next_chunk)
+            disconnected.set()
+        await asyncio.wait_for(task, 5)
+        while not sent.empty():
+            chunks.append(sent.get_nowait().get('body', b''))
+        return start, b''.join(chunks).decode()
+
+    def connect(self, scope, while_connected=None):
+        return async_to_sync(self.serve)(scope, while_connected)
+
+    def test_stream(self):
+        async def while_connected(next_chunk):
+            chunks = [await next_chunk()]
+            await sync_to_async(self.comment)()
+            chunks.append(await next_chunk())
+            return chunks
+
+        start, body = self.connect(self.scope(), while_connected)
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'),
+                      start['headers'])
+        self.assertTrue(body.startswith('retry: '))
+        event = Event.objects.latest('id')
+        self.assertIn(f'id: {event.id}\nevent: comment.created\n', body)
+        data = json.loads(body.split('data: ')[1].split('\n')[0])
+        self.assertEqual(data['data']['description'], 'new')
+        self.assertEqual(get_broker().subscribers, 0)
+
+    def test_replay_from_last_event_id(self):
+        cursor = Event.objects.latest('id').id
+        self.comment('missed')
+        # project events are not streamed
+        self.project.title = 'renamed'
+        self.project.save()
+
+        async def while_connected(next_chunk):
+            return [await next_chunk()]
+
+        start, body = self.connect(
+            self.scope(headers=[(b'last-event-id', str(cursor).encode())]),
+            while_connected)
+        self.assertEqual(body.count('event: '), 1)
+        self.assertIn('event: comment.created', body)
+        self.assertIn('missed', body)
+
+    def test_brokers_share_the_pubsub(self):
+        pubsub = LocalPubSub()
+        brokers = [Broker(pubsub), Broker(pubsub)]
+
+        async def fan_out():
+            subscriptions = [broker.subscribe(self.project.id)
+                             for broker in brokers]
+            other = brokers[0].subscribe(self.project.id + 1)
+            brokers[1].publish([{'project': self.project.id, 'cursor': 1}])
+            received = [await subscription.get(1)
+                        for subscription in subscriptions]
+            self.assertEqual(await other.get(0.01), [])
+            for broker, subscription in zip(brokers, subscriptions):
+                broker.unsubscribe(subscription)
+            return received
+
+        self.assertEqual(async_to_sync(fan_out)(),
+                         [[{'project': self.project.id, 'cursor': 1}]] * 2)
+        self.assertEqual(brokers[0].subscribers, 1)
+
+    @override_settings(LIVE_UPDATES={'QUEUE_SIZE': 2})
+    def test_overflow(self):
+        async def while_connected(next_chunk):
+            chunks = [await next_chunk()]
+            # three messages before the connection reads any of them
+            subscription, = get_broker()._subscriptions[self.project.id]
+            for cursor in range(1000, 1003):
+                subscription.deliver({
+                    'project': self.project.id, 'cursor': cursor,
+                    'type': 'comment.created', 'event': '{}'})
+            chunks.append(await next_chunk())
+            return chunks
+
+        start, body = self.connect(self.scope(), while_connected)
+        self.assertIn('event: overflow', body)
+        self.assertNotIn('comment.created', body)
+
+    @override_settings(LIVE_UPDATES={'HEARTBEAT': 0.01,
+                                     'IDLE_TIMEOUT': 0.05})
+    def test_heartbeat_and_idle_timeout(self):
+        start, body = self.connect(self.scope())
+        self.assertIn(': heartbeat', body)
+        self.assertTrue(body.endswith('event: timeout\ndata: {}\n\n'))
+
+    @override_settings(LIVE_UPDATES={'HEARTBEAT': 0.01})
+    def test_removed_contributor_is_disconnected(self):
+        collaborator = User.objects.create_user(
+            email='collaborator@test.com', password='password')
+        contributor = Contributor.objects.create(
+            user=collaborator, project=self.project, permission='read',
+            role='COLLABORATOR')
+
+        async def while_connected(next_chunk):
+            chunks = [await next_chunk()]
+            await sync_to_async(contributor.delete)()
+            while not chunks[-1].startswith(b'event: '):
+                chunks.append(await next_chunk())
+            return chunks
+
+        start, body = self.connect(self.scope(user=collaborator),
+                                   while_connected)
+        self.assertEqual(start['status'], 200)
+        self.assertTrue(body.endswith('event: revoked\ndata: {}\n\n'))
+        self.assertEqual(get_broker().subscribers, 0)
+
+    @override_settings(LIVE_UPDATES={'POLL_TIMEOUT': 0.05})
+    def test_long_poll(self):
+        cursor = Event.objects.latest('id').id
+        start, body = self.connect(self.scope(f'mode=poll&since={cursor}'))
+        self.assertEqual(json.loads(body), {
+            'events': [], 'cursor': cursor, 'has_more': False})
+
+        self.comment('missed')
+        start, body = self.connect(self.scope(f'mode=poll&since={cursor}'))
+        events = json.loads(body)['events']
+        self.assertEqual(events[0]['data']['description'], 'missed')
+
+    @override_settings(LIVE_UPDATES={'POLL_TIMEOUT': 5})
+    def test_long_poll_wakes_up(self):
+        async def poll():
+            task = asyncio.ensure_future(self.serve(self.scope('mode=poll')))
+            while not get_broker().subscribers:
+                await asyncio.sleep(0.001)
+            await sync_to_async(self.comment)('live')
+            return await asyncio.wait_for(task, 5)
+
+        start, body = async_to_sync(poll)()
+        self.assertEqual(start['status'], 200)
+        self.assertEqual(json.loads(body)['events'][0]['data']['description'],
+                         'live')
+
+    def test_errors(self):
+        outsider = User.objects.create_user(email='outsider@test.com')
+        self.assertEqual(self.connect(self.scope(user=outsider))[0]['status'],
+                         403)
+        self.assertEqual(
+            self.connect({**self.scope(), 'headers': []})[0]['status'], 401)
+        self.assertEqual(
+            self.connect(self.scope('since=x'))[0]['status'], 400)
+        Project.objects.filter(pk=self.project.pk).update(
+            compacted_event_id=10 ** 6)
+        self.assertEqual(
+            self.connect(self.scope('since=1'))[0]['status'], 410)
+        with override_settings(LIVE_UPDATES={'MAX_SUBSCRIBERS': 0}):
+            start, body = self.connect(self.scope())
+        self.assertEqual(start['status'], 503)
+        self.assertIn((b'retry-after', b'10'), start['headers'])
+
+    def ticket(self, user=None):
+        start, body = self.connect(self.scope(
+            user=user, method='POST', path=self.path + 'tickets/'))
+        if start['status'] != 201:
+            return start['status']
+        return json.loads(body)['ticket']
+
+    def test_stream_ticket(self):
+        ticket = self.ticket()
+        scope = {**self.scope(f'mode=poll&since=0&ticket={ticket}'),
+                 'headers': []}
+        self.assertEqual(self.connect(scope)[0]['status'], 200)
+        # single-use
+        self.assertEqual(self.connect(scope)[0]['status'], 401)
+
+    def test_stream_ticket_errors(self):
+        outsider = User.objects.create_user(email='outsider@test.com')
+        self.assertEqual(self.ticket(outsider), 403)
+        self.assertEqual(self.connect({
+            **self.scope(method='POST', path=self.path + 'tickets/'),
+            'headers': []})[0]['status'], 401)
+        self.assertEqual(self.connect(
+            self.scope(path=self.path + 'tickets/'))[0]['status'], 405)
+
+        other = create_project_tree(self.author, 'other', issues=0)
+        self.path = f'/live/projects/{other.id}/'
+        ticket = self.ticket()
+        self.path = f'/live/projects/{self.project.id}/'
+        for query in (f'ticket={ticket}', 'ticket=unknown'):
+            scope = {**self.scope(f'mode=poll&since=0&{query}'),
+                     'headers': []}
+            self.assertEqual(self.connect(scope)[0]['status'], 401)
+        # access tokens are not taken from the URL
+        token = AccessToken.for_user(self.author)
+        scope = {**self.scope(f'mode=poll&since=0&token={token}'),
+                 'headers': []}
+        self.assertEqual(self.connect(scope)[0]['status'], 401)
+
+
+class BenchmarkTests(SoftDeskTestCase):
+    """The benchmark seeds at the requested scale and measures every route."""
+
+    def test_seed_scale(self):
+        user = seed(users=4, projects=3, contributors=2, issues=5,
+                    comments=2)
+        self.assertTrue(user.is_staff)
+        self.assertEqual(User.objects.count(), 4)
+        self.assertEqual(Project.objects.count(), 3)
+        self.assertEqual(Contributor.objects.count(), 3 * 2)
+        self.assertEqual(Issue.objects.count(), 3 * 5)
+        self.assertEqual(Comment.objects.count(), 3 * 5 * 2)
+        self.assertTrue(user.check_password('Benchmark-Password-1'))
+
+    def test_run_benchmark(self):
+        user = seed(users=3, projects=2, contributors=2, issues=3,
+                    comments=2)
+        results = run_benchmark(user, requests=3, warmup=1, endpoints={
+            'projects-list', 'issues-list', 'comment-create', 'users-list'})
+        self.assertEqual(set(results), {
+            'projects-list', 'issues-list', 'comment-create', 'users-list'})
+        self.assertEqual(results['issues-list']['statuses'], {'200': 3})
+        self.assertEqual(results['comment-create']['statuses'], {'201': 3})
+        for result in results.values():
+            self.assertEqual(result['errors'], 0)
+            self.assertGreater(result['queries_per_request'], 0)
+            self.assertLessEqual(result['p50_ms'], result['p99_ms'])
+        json.dumps(results)
+
+    def test_streamed_responses_are_read(self):
+        user = seed(users=2, projects=1, contributors=2, issues=3,
+                    comments=2)
+        results = run_benchmark(user, requests=1, warmup=0,
+                                endpoints={'project-export'})
+        # the project, its issues and their comments are read while streaming
+        self.assertGreaterEqual(
+            results['project-export']['queries_per_request'], 3)
+
+    def test_serialization_benchmark(self):
+        seed(users=3, projects=2, contributors=2, issues=3, comments=2)
+        results = run_serialization_benchmark(rows=5, repeat=1)
+        self.assertEqual(set(results), {
+            'issues', 'issues-expanded', 'comments', 'contributors'})
+        for result in results.values():
+            self.assertTrue(result['identical'])
+            self.assertGreater(result['rows'], 0)
+        json.dumps(results)
+
+    def test_compare_results(self):
+        def report(p50, queries):
+            return {'endpoints': {'issues-list': {
+                'p50_ms': p50, 'queries_per_request': queries}}}
+
+        comparison = compare_results(report(10, 2), report(10.5, 2))
+        self.assertFalse(comparison['issues-list']['regressed'])
+        comparison = compare_results(report(10, 2), report(12, 2))
+        self.assertTrue(comparison['issues-list']['regressed'])
+        comparison = compare_results(report(10, 2), report(9, 3))
+        self.assertTrue(comparison['issues-list']['regressed'])
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([3], 99), 3)
+        self.assertIsNone(percentile([], 50))
+
+
+class InstrumentationTests(SoftDeskTestCase):
+    """Queries and timings are recorded per request with DEBUG = False."""
+
+    def setUp(self):
+        super().setUp()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(self.author, 'project')
+        self.url = f'/projects/{self.project.id}/issues/?fields=id'
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        names = re.findall(r'(\w+);dur=', response['Server-Timing'])
+        self.assertEqual(
+            set(names), {'db', 'auth', 'permissions', 'serializer', 'total'})
+        self.assertIn(f'desc="{len(queries)} queries, 0 duplicates"',
+                      response['Server-Timing'])
+
+    @override_settings(REQUEST_METRICS={'SLOW_REQUEST_MS': 0})
+    def test_slow_request_log(self):
+        with self.assertLogs('api.requests', 'WARNING') as logs:
+            self.client.get(self.url)
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['event'], 'slow_request')
+        self.assertEqual(record['view'], 'IssueViewSet.list')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['queries'], 0)
+        self.assertIn('permissions_ms', record)
+
+    def test_writes_do_not_repeat_the_project_update(self):
+        other = User.objects.create_user(email='other@test.com')
+        issue = {'title': 'issue', 'description': 'description',
+                 'tag': 'BUG', 'priority': 'LOW', 'status': 'To-Do',
+                 'assignee': other.email}
+        with self.assertNoLogs('api.requests', 'WARNING'):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.post(
+                    f'/projects/{self.project.id}/issues/', issue,
+                    format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len([query for query in queries if query[
+            'sql'].startswith('UPDATE "api_project"')]), 1)
+
+    def test_coalesced_bumps(self):
+        self.project.refresh_from_db()
+        version = self.project.version
+        with transaction.atomic(), coalesce_bumps():
+            Project.bump_version({'issue_count': 1}, id=self.project.id)
+            with coalesce_bumps():
+                Project.bump_version({'issue_count': 1, 'bug_count': 1},
+                                     id=self.project.id)
+            self.assertEqual(Project.objects.get(pk=self.project.pk).version,
+                             version)
+        project = Project.objects.get(pk=self.project.pk)
+        self.assertEqual(project.version, version + 1)
+        self.assertEqual(project.issue_count, self.project.issue_count + 2)
+        self.assertEqual(project.bug_count, self.project.bug_count + 1)
+
+    @override_settings(REQUEST_METRICS={'SERVER_TIMING': False})
+    def test_server_timing_can_be_disabled(self):
+        self.assertNotIn('Server-Timing', self.client.get(self.url))
+
+    def test_repeated_statements(self):
+        metrics = RequestMetrics()
+        sql = 'SELECT * FROM api_project WHERE id = %s'
+        for params in ((1,), (1,), (2,)):
+            metrics.add_query(sql, params, 0.001)
+        metrics.add_query('SELECT 1', (), 0.001)
+        self.assertEqual(metrics.queries, 4)
+        self.assertEqual(metrics.duplicate_queries, 1)
+        repeated = metrics.repeated_statements(threshold=3)
+        self.assertEqual(len(repeated), 1)
+        self.assertEqual(repeated[0]['count'], 3)
+        self.assertEqual(repeated[0]['same_params'], 2)
+        self.assertIn('api/tests.py', repeated[0]['locations'][0])
+
+    def test_nested_timer_counts_once(self):
+        metrics = RequestMetrics()
+        with metrics.timer('serializer'):
+            with metrics.timer('serializer'):
+                pass
+        self.assertEqual(list(metrics.timings), ['serializer'])
+
+
+@override_settings(METRICS={'TOKEN': 'secret'})
+class MetricsTests(SoftDeskTestCase):
+    """/metrics exposes the request, database and cache counters."""
+
+    def setUp(self):
+        super().setUp()
+        registry.reset()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(self.author, 'project')
+
+    def metric_lines(self):
+        response = self.client.get('/metrics',
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode().splitlines()
+
+    def test_requests_by_view_and_status(self):
+        url = f'/projects/{self.project.id}/issues/'
+        self.client.get(url)
+        self.client.get(url)
+        self.client.get('/projects/999/issues/')
+        lines = self.metric_lines()
+        self.assertIn(
+            'softdesk_http_requests_total{route="issue-list",'
+            'view="IssueViewSet",action="list",method="GET",status="200"} 2',
+            lines)
+        self.assertIn(
+            'softdesk_http_requests_total{route="issue-list",'
+            'view="IssueViewSet",action="list",method="GET",status="404"} 1',
+            lines)
+        self.assertIn(
+            'softdesk_http_request_duration_seconds_bucket{route="issue-list",'
+            'view="IssueViewSet",action="list",le="+Inf"} 3', lines)
+        self.assertIn(
+            'softdesk_http_request_duration_seconds_count{route="issue-list",'
+            'view="IssueViewSet",action="list"} 3', lines)
+        self.assertIn('# TYPE softdesk_db_queries_per_request histogram',
+                      lines)
+        self.assertIn(
+            'softdesk_cache_requests_total{cache="response",result="hits"} 1',
+            lines)
+
+    def test_processes_are_added_up(self):
+        with tempfile.TemporaryDirectory() as directory, override_settings(
+                METRICS={'DIRECTORY': directory, 'TOKEN': 'secret'}):
+            with open(os.path.join(directory, 'metrics_1_other.json'),
+                      'w') as file:
+                json.dump({'softdesk_http_requests_total': [
+                    [['project-list', 'ProjectViewSet', 'list', 'GET',
+                      '200'], 5]]}, file)
+            self.client.get('/projects/')
+            lines = self.metric_lines()
+        self.assertIn(
+            'softdesk_http_requests_total{route="project-list",'
+            'view="ProjectViewSet",action="list",method="GET",status="200"} 6',
+            lines)
+
+    def test_token(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.assertEqual(self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer other').status_code, 403)
+        self.assertEqual(self.client.get(
+            '/metrics', HTTP_AUTHORIZATION='Bearer sécret').status_code, 403)
+        self.metric_lines()
+
+    def test_closed_without_a_token(self):
+        with override_settings(METRICS={'TOKEN': None}):
+            self.assertEqual(self.client.get('/metrics').status_code, 403)
+        with override_settings(METRICS={'TOKEN': None, 'PUBLIC': True}):
+            self.assertEqual(self.client.get('/metrics').status_code, 200)
+
+
+@override_settings(DATABASE_REPLICATION={'REPLICAS': ['replica'],
+                                         'PIN_SECONDS': 10})
+class ReplicaTests(APITransactionTestCase):
+    """
+    GET requests read from the replica, which is a test mirror of the
+    primary here: a connection of its own that only sees committed rows,
+    hence the TransactionTestCase.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        membership_cache.clear()
+        response_cache.clear()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(self.author, 'project')
+        self.addCleanup(cache.delete, pin_key(self.author.id))
+
+    def get_queries(self, method, url, data=None):
+        with CaptureQueriesContext(connections['replica']) as replica, \
+                CaptureQueriesContext(connection) as primary:
+            response = getattr(self.client, method)(url, data, format='json')
+        self.assertLess(response.status_code, 400)
+        return len(primary), len(replica)
+
+    def test_reads_go_to_the_replica(self):
+        # the membership lookup reads the primary, see the test below
+        membership_cache.set(self.author.id, self.project.id, True)
+        for url in ('/projects/', f'/projects/{self.project.id}/',
+                    f'/projects/{self.project.id}/issues/',
+                    f'/projects/{self.project.id}/users/'):
+            primary, replica = self.get_queries('get', url)
+            self.assertEqual(primary, 0, url)
+            self.assertGreater(replica, 0, url)
+
+    def test_writes_pin_the_user_to_the_primary(self):
+        primary, replica = self.get_queries(
+            'post', f'/projects/{self.project.id}/issues/',
+            {'title': 'issue', 'description': 'description', 'tag': 'BUG',
+             'priority': 'LOW', 'status': 'To-Do', 'assignee': None})
+        self.assertEqual(replica, 0)
+        url = f'/projects/{self.project.id}/issues/'
+        self.assertEqual(self.get_queries('get', url)[1], 0)
+
+        other = User.objects.create_user(email='other@test.com',
+                                         password='password')
+        Contributor.objects.create(user=other, project=self.project,
+                                   permission='edit', role='COLLABORATOR')
+        self.client.force_authenticate(other)
+        # only the membership lookup
+        self.assertEqual(self.get_queries('get', url)[0], 1)
+
+    def test_membership_is_read_from_the_primary(self):
+        url = f'/projects/{self.project.id}/issues/'
+        with CaptureQueriesContext(connection) as primary:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(primary), 1)
+        self.assertIn('"api_contributor"', primary[0]['sql'])
+
+    def test_read_after_write_in_a_request(self):
+        router = ReplicaRouter()
+        token = current_route.set(Route('replica'))
+        self.addCleanup(current_route.reset, token)
+        self.assertEqual(router.db_for_read(Issue), 'replica')
+        self.assertEqual(router.db_for_write(Issue), 'default')
+        self.assertEqual(router.db_for_read(Issue), 'default')
+
+    def test_replica_rows_relate_to_primary_rows(self):
+        project = Project.objects.using('replica').get(pk=self.project.pk)
+        self.assertTrue(ReplicaRouter().allow_relation(project, self.author))
+        Contributor.objects.create(
+            user=User.objects.create_user(email='other@test.com'),
+            project=project, permission='edit', role='COLLABORATOR')
+
+    def test_other_databases_outside_requests(self):
+        # e.g. migrate --database, the instance keeps its database
+        router = ReplicaRouter()
+        project = Project.objects.using('replica').get(pk=self.project.pk)
+        self.assertIsNone(router.db_for_read(Issue))
+        self.assertIsNone(router.db_for_write(Issue, instance=project))
+
+    @override_settings(DATABASE_REPLICATION={'REPLICAS': []})
+    def test_without_replicas(self):
+        primary, replica = self.get_queries('get', '/projects/')
+        self.assertEqual(replica, 0)
+        self.assertGreater(primary, 0)
+
+
+@override_settings(DATABASE_REPLICATION={'REPLICAS': ['replica'],
+                                         'PIN_SECONDS': 10})
+class LaggingReplicaTests(APITransactionTestCase):
+    """
+    The replica is a database file of its own here, copied from the
+    primary with sync_replica, so it lags behind until the next copy.
+    """
+    databases = {'default', 'replica'}
+
+    def setUp(self):
+        membership_cache.clear()
+        response_cache.clear()
+        self.author = User.objects.create_user(
+            email='author@test.com', password='password')
+        self.client.force_authenticate(self.author)
+        self.project = create_project_tree(self.author, 'project', issues=0)
+        self.addCleanup(cache.delete, pin_key(self.author.id))
+
+        replica = connections['replica']
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        # the test mirror shares the settings dict of the primary
+        self.addCleanup(setattr, replica, 'settings_dict',
+                        replica.settings_dict)
+        self.addCleanup(replica.close)
+        # close() keeps the connection of an in-memory database
+        if replica.connection is not None:
+            replica.connection.close()
+            replica.connection = None
+        replica.settings_dict = {
+            **replica.settings_dict,
+            'NAME': os.path.join(directory.name, 'replica.sqlite3')}
+        self.sync()
+
+    def sync(self):
+        call_command('sync_replica', 'replica', stdout=io.StringIO())
+
+    def etag_version(self, response):
+        return int(response['ETag'].strip('"').split('-')[1])
+
+    def test_version_and_body_come_from_the_replica(self):
+        url = f'/projects/{self.project.id}/'
+        # a write that only reached the primary
+        Issue.objects.create(
+            title='issue', description='description', tag='BUG',
+            priority='LOW', status='To-Do', project=self.project,
+            author=self.author, assignee=self.author)
+
+        # the membership lookup (on the primary) runs in the request
+        membership_cache.clear()
+        response = self.client.get(url)
+        self.assertEqual(response.json()['issues'], [])
+        self.assertEqual(
+            self.etag_version(response),
+            Project.objects.using('replica').get(pk=self.project.pk).version)
+        stale_etag = response['ETag']
+
+        self.sync()
+        membership_cache.clear()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=stale_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['issues']), 1)
+        self.assertEqual(self.etag_version(response),
+                         Project.objects.get(pk=self.project.pk).version)
+
+
+class SQLiteProfileTests(SimpleTestCase):
+    """The pragmas and the transaction mode of the api.sqlite backend."""
+
+    def test_pragmas(self):
+        with benchmark_database('configured') as alias:
+            with connections[alias].cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode')
+                self.assertEqual(cursor.fetchone()[0], 'wal')
+                cursor.execute('PRAGMA synchronous')
+                self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+                cursor.execute('PRAGMA busy_timeout')
+                self.assertEqual(cursor.fetchone()[0], 5000)
+
+    def test_transactions_take_the_write_lock(self):
+        with benchmark_database('configured') as alias:
+            other = sqlite3.connect(connections[alias].settings_dict['NAME'],
+                                    timeout=0, isolation_level=None)
+            self.addCleanup(other.close)
+            with transaction.atomic(using=alias):
+                Project.objects.using(alias).exists()
+                with self.assertRaisesMessage(sqlite3.OperationalError,
+                                              'locked'):
+                    other.execute('BEGIN IMMEDIATE')
+            other.execute('BEGIN IMMEDIATE')
+            other.execute('ROLLBACK')
+
+    def test_concurrency_benchmark(self):
+        result = run_profile('configured', threads=2, operations=10,
+                             write_ratio=0.5, issues=5)
+        self.assertEqual(result['errors'], {'read': 0, 'write': 0})
+        self.assertEqual(result['settings']['CONN_MAX_AGE'], 600)
+        self.assertGreater(result['operations_per_second'], 0)
+
+    def test_create_benchmark(self):
+        results = run_create_benchmark(threads=2, operations=5,
+                                       contributors=3, outsiders=2)
+        self.assertEqual(set(results), {'previous', 'coalesced'})
+        coalesced = results['coalesced']
+        self.assertEqual(coalesced['errors'], {})
+        self.assertEqual(coalesced['issues'], 10)
+        self.assertLessEqual(coalesced['enrolled'], 2)
+        self.assertGreater(coalesced['issues_per_second'], 0)
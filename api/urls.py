@@ -2,7 +2,7 @@ from django.urls import path, include
 from rest_framework_nested import routers
 from rest_framework.routers import DefaultRouter
 
-from api import views
+from api import async_views, metrics, views
 
 router = DefaultRouter()
 router.register(r'projects', views.ProjectViewSet)
@@ -35,4 +35,11 @@ urlpatterns = [
     path('', include(contributor_router.urls)),
     path('', include(issue_router.urls)),
     path('', include(comment_router.urls)),
+    path('async/projects/<int:pk>/', async_views.project_detail,
+         name='async-project-detail'),
+    path('async/projects/<int:project_pk>/issues/', async_views.issue_list,
+         name='async-issue-list'),
+    path('async/projects/<int:project_pk>/issues/<int:issue_pk>/comments/',
+         async_views.comment_list, name='async-comment-list'),
+    path('metrics', metrics.metrics_view, name='metrics'),
 ]
@@ -1,10 +1,28 @@
-from rest_framework import viewsets, permissions
+import hashlib
+
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
 from rest_framework.response import Response
-from rest_framework.exceptions import NotFound
 from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
 
+from .bulk import bulk_create_issues, bulk_save_contributors
+from .cache import response_cache
+from .counters import PROJECT_COUNTERS, project_stats
+from .events import event_log_options, project_changes
+from .export import EXPORT_FORMATS, export_project
+from .filters import IssueFilterBackend, IssueOrderingFilter
+from .instrumentation import RequestMetricsMixin, timer
+from .pagination import KeysetPagination, ProjectKeysetPagination
+from .replicas import ReplicaReadMixin
+from .rows import row_mapper
 from .serializers import *
 from authentication.permissions import (
+    get_project_context,
     IsContributor,
     IsAuthorOrReadOnly,
     IsRelatedIssueAuthor,
@@ -14,20 +32,181 @@ from authentication.permissions import (
 User = get_user_model()
 
 
-class ProjectViewSet(viewsets.ModelViewSet):
+class BulkMixin:
+    """
+    Helpers for the bulk actions, which take a JSON array of items and
+    answer with a result per item.
+    """
+    bulk_max_items = 5000
+
+    def get_bulk_items(self):
+        items = self.request.data
+        if not isinstance(items, list):
+            raise ParseError('Expected a list of items.')
+        if len(items) > self.bulk_max_items:
+            raise ParseError(
+                f'A bulk request is limited to {self.bulk_max_items} items.')
+        return items
+
+
+class ConditionalGetMixin:
+    """
+    Answers If-None-Match / If-Modified-Since on list and retrieve with
+    304 Not Modified, using the version stamp of the project the request
+    refers to. Nothing is serialized for a 304, the permissions are checked
+    before as usual.
+    """
+    conditional_actions = ('list', 'retrieve')
+
+    def get_etag(self, project):
+        """
+        The representation depends on the project version and on the
+        requested URL (fields, expansions, pages, filters) and format.
+        """
+        renderer = getattr(self.request, 'accepted_media_type', '')
+        key = f'{self.request.get_full_path()}|{renderer}'
+        digest = hashlib.md5(key.encode()).hexdigest()[:16]
+        return quote_etag(f'{project.id}-{project.version}-{digest}')
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        project = get_project_context(request, self).project
+        etag = self.get_etag(project)
+        last_modified = int(project.updated_time.timestamp())
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        if 'list' not in self.conditional_actions:
+            return super().list(request, *args, **kwargs)
+        return self.conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs)
+
+
+class ResponseCacheMixin:
+    """
+    Serves list and retrieve from the response_cache. The key contains the
+    project version, the permission scope of the user, the requested URL
+    and the media type; the permissions are checked before the lookup.
+    Only JSON is cached, the browsable API renders user specific pages.
+    Goes after ConditionalGetMixin, so a 304 does not even read the cache.
+    """
+    response_cache_actions = ('list', 'retrieve')
+    response_cache_key = None
+
+    def get_permission_scope(self):
+        return 'staff' if self.request.user.is_staff else 'contributor'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        renderer = getattr(request, 'accepted_renderer', None)
+        if (self.action not in self.response_cache_actions
+                or getattr(renderer, 'format', None) != 'json'):
+            return handler(request, *args, **kwargs)
+        project = get_project_context(request, self).project
+        # scheme and host included, the hyperlinks of the body are absolute
+        key = response_cache.make_key(
+            self.basename, project.id, project.version,
+            self.get_permission_scope(), request.build_absolute_uri(),
+            request.accepted_media_type)
+        entry = response_cache.get(key)
+        if entry is not None:
+            content, content_type = entry
+            return HttpResponse(content, content_type=content_type)
+        response = handler(request, *args, **kwargs)
+        self.response_cache_key = key
+        return response
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs)
+        if (self.response_cache_key is not None
+                and isinstance(response, Response)
+                and response.status_code == 200):
+            response.render()
+            response_cache.set(self.response_cache_key, response.content,
+                               response['Content-Type'])
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs)
+
+
+class SparseFieldsViewMixin:
+    """
+    Reads ?fields= and ?expand= and hands them to a serializer that uses the
+    SparseFieldsMixin. Embedded relations are not expanded by default on
+    list views, detail views embed everything unless ?expand= is given.
+    """
+
+    def get_fields(self):
+        return query_param_set(self.request.query_params, 'fields')
+
+    def get_expand(self):
+        return requested_expand(self.serializer_class,
+                                self.request.query_params,
+                                default_all=self.action != 'list')
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_fields())
+        kwargs.setdefault('expand', self.get_expand())
+        return super().get_serializer(*args, **kwargs)
+
+
+class RowListMixin:
+    """
+    List action that reads the page with .values() and serializes the rows
+    with the RowMapper of the serializer (api/rows.py) instead of building
+    model instances for the serializer.
+    """
+
+    def list(self, request, *args, **kwargs):
+        mapper = row_mapper(self.get_serializer())
+        # the cursors of KeysetPagination are made of its ordering fields
+        rows = mapper.values(self.filter_queryset(self.get_queryset()),
+                             getattr(self.paginator, 'ordering', ()))
+        page = self.paginate_queryset(rows)
+        with timer('serializer'):
+            data = mapper.serialize(rows if page is None else page)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+class ProjectViewSet(RequestMetricsMixin, ReplicaReadMixin,
+                     ConditionalGetMixin, ResponseCacheMixin,
+                     SparseFieldsViewMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows projects to be viewed.
     """
-    queryset = Project.objects.all().order_by('title')
+    queryset = Project.objects.all().order_by('title', 'id')
     serializer_class = ProjectSerializer
+    pagination_class = ProjectKeysetPagination
+    # the project list has no single version stamp
+    conditional_actions = ('retrieve',)
+    response_cache_actions = ('retrieve',)
     permission_classes = [permissions.IsAuthenticated, IsAuthorOrReadOnly,
                           IsContributor]
 
     def get_queryset(self, *args, **kwargs):
         """Show only Project in which the User is a contributor."""
-        user = self.request.user
-        projects = self.queryset.filter(contributors=user)
-        return projects
+        # the id, request.user can be a LazyUser
+        projects = self.queryset.filter(contributors=self.request.user.id)
+        return self.serializer_class.setup_eager_loading(
+            projects, self.get_expand())
 
     def destroy(self, request, *args, **kwargs):
         """Destroy method with response"""
@@ -40,8 +219,74 @@ class ProjectViewSet(viewsets.ModelViewSet):
         kwargs['partial'] = True
         return super().update(request, *args, **kwargs)
 
+    @action(detail=False, methods=['get'])
+    def stats(self, request, *args, **kwargs):
+        """
+        Issue and comment counts of every project of the user and their
+        totals, read from the counters of the projects with one query.
+        """
+        rows = self.queryset.filter(contributors=request.user.id).values(
+            'id', 'title', *PROJECT_COUNTERS)
+        projects = [{'project_id': row['id'], 'title': row['title'],
+                     **project_stats(row)} for row in rows]
+        totals = {counter: sum(row[counter] for row in rows)
+                  for counter in PROJECT_COUNTERS}
+        return Response({'projects': projects,
+                         'total': project_stats(totals)})
+
+    @action(detail=True, methods=['get'])
+    def changes(self, request, *args, **kwargs):
+        """
+        The events of the project after ?since=<cursor>, up to ?limit=
+        (EVENT_LOG['PAGE_SIZE'] at most), see api/events.py. Without
+        ?since= only the current cursor.
+        """
+        since = request.query_params.get('since')
+        limit = request.query_params.get('limit')
+        page_size = event_log_options()['PAGE_SIZE']
+        try:
+            since = None if since is None else int(since)
+            limit = page_size if limit is None else int(limit)
+        except ValueError:
+            raise ParseError('since and limit must be integers.')
+        if limit < 1:
+            raise ParseError('limit must be positive.')
+        project = get_project_context(request, self).project
+        changes = project_changes(project, since, min(limit, page_size))
+        if changes is None:
+            return Response(
+                {'detail': 'The events after this cursor were compacted, '
+                           'load the project again.'},
+                status=status.HTTP_410_GONE)
+        return Response(changes)
+
+    @action(detail=True, methods=['get'])
+    def export(self, request, *args, **kwargs):
+        """
+        Streams every issue of the project with its comments, as NDJSON by
+        default or as CSV with ?output=csv. Served by ASGI, the export is
+        read completely before the response starts.
+        """
+        export_format = request.query_params.get('output', 'ndjson')
+        if export_format not in EXPORT_FORMATS:
+            raise ParseError(
+                f'output must be one of {", ".join(EXPORT_FORMATS)}.')
+        project = get_project_context(request, self).project
+        chunks = export_project(project.id, export_format)
+        if isinstance(request._request, ASGIRequest):
+            # the ASGIHandler of Django 4.0 iterates the response on its
+            # event loop, where the ORM cannot run: read the rows here
+            chunks = list(chunks)
+        response = StreamingHttpResponse(
+            chunks, content_type=EXPORT_FORMATS[export_format])
+        response['Content-Disposition'] = (
+            f'attachment; filename="project-{project.id}.{export_format}"')
+        return response
+
 
-class ContributorViewSet(viewsets.ModelViewSet):
+class ContributorViewSet(RequestMetricsMixin, ReplicaReadMixin,
+                         ConditionalGetMixin, BulkMixin, RowListMixin,
+                         viewsets.ModelViewSet):
     """
     API endpoint that allows contributor-tables to be viewed.
     """
@@ -52,12 +297,10 @@ class ContributorViewSet(viewsets.ModelViewSet):
                           IsContributor]
 
     def get_queryset(self, *args, **kwargs):
-        project_id = self.kwargs.get('project_pk')
-        try:
-            project = Project.objects.get(id=project_id)
-        except Project.DoesNotExist:
-            raise NotFound('A Project with that id does not exist')
-        return self.queryset.filter(project=project)
+        # IsContributor has already checked that the project exists
+        project_id = get_project_context(self.request, self).project_id
+        return self.queryset.filter(
+            project_id=project_id).select_related('user')
 
     def destroy(self, request, *args, **kwargs):
         """Destroy method with response"""
@@ -65,13 +308,26 @@ class ContributorViewSet(viewsets.ModelViewSet):
         contributor.delete()
         return Response({'message': 'contributor has been deleted'})
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        """Creates or updates a list of contributors in one transaction"""
+        project = get_project_context(request, self).project
+        result = bulk_save_contributors(project, self.get_bulk_items())
+        return Response(result.data, status=result.status_code)
+
 
-class IssueViewSet(viewsets.ModelViewSet):
+class IssueViewSet(RequestMetricsMixin, ReplicaReadMixin,
+                   ConditionalGetMixin, ResponseCacheMixin, BulkMixin,
+                   SparseFieldsViewMixin, RowListMixin,
+                   viewsets.ModelViewSet):
     """
     API endpoint that allows issues to be viewed.
     """
-    queryset = Issue.objects.all()
+    queryset = Issue.objects.all().order_by('created_time', 'id')
     serializer_class = IssueSerializer
+    pagination_class = KeysetPagination
+    filter_backends = [IssueFilterBackend, IssueOrderingFilter]
+    ordering_fields = ['created_time', 'title', 'tag', 'priority', 'status']
     permission_classes = [permissions.IsAuthenticated, IsAuthorOrReadOnly,
                           IsContributor]
 
@@ -81,12 +337,11 @@ class IssueViewSet(viewsets.ModelViewSet):
         return context
 
     def get_queryset(self, *args, **kwargs):
-        project_id = self.kwargs.get('project_pk')
-        try:
-            project = Project.objects.get(id=project_id)
-        except Project.DoesNotExist:
-            raise NotFound('A Project with that id does not exist')
-        return self.queryset.filter(project=project)
+        # IsContributor has already checked that the project exists
+        project_id = get_project_context(self.request, self).project_id
+        issues = self.queryset.filter(project_id=project_id)
+        return self.serializer_class.setup_eager_loading(
+            issues, self.get_expand())
 
     def destroy(self, request, *args, **kwargs):
         """Destroy method with response"""
@@ -99,22 +354,29 @@ class IssueViewSet(viewsets.ModelViewSet):
         kwargs['partial'] = True
         return super().update(request, *args, **kwargs)
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        """Creates a list of issues in one transaction"""
+        project = get_project_context(request, self).project
+        result = bulk_create_issues(
+            project, request.user, self.get_bulk_items())
+        return Response(result.data, status=result.status_code)
 
-class CommentViewSet(viewsets.ModelViewSet):
+
+class CommentViewSet(RequestMetricsMixin, ReplicaReadMixin,
+                     ConditionalGetMixin, ResponseCacheMixin, RowListMixin,
+                     viewsets.ModelViewSet):
     """
     API endpoint that allows comments to be viewed.
     """
-    queryset = Comment.objects.all()
+    queryset = Comment.objects.all().order_by('created_time', 'id')
     serializer_class = CommentSerializer
+    pagination_class = KeysetPagination
     permission_classes = [permissions.IsAuthenticated, IsAuthorOrReadOnly,
                           IsRelatedIssueAuthor, IsContributor]
 
     def get_queryset(self, *args, **kwargs):
-        issue_id = self.kwargs.get('issue_pk')
-        try:
-            issue = Issue.objects.get(id=issue_id)
-        except Issue.DoesNotExist:
-            raise NotFound('A Issue with that id does not exist')
+        issue = get_project_context(self.request, self).issue
         return self.queryset.filter(issue=issue)
 
     def destroy(self, request, *args, **kwargs):
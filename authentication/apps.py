@@ -4,3 +4,16 @@ from django.apps import AppConfig
 class AuthenticationConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'authentication'
+
+    def ready(self):
+        from django.contrib.auth.password_validation import (
+            get_default_password_validators)
+        from django.core import checks
+
+        from authentication import signals  # noqa: F401 -> receivers
+        from authentication.revocation import check_revocation_cache
+
+        checks.register(check_revocation_cache, checks.Tags.caches)
+
+        # loads the common password list now instead of in the first signup
+        get_default_password_validators()
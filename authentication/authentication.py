@@ -0,0 +1,92 @@
+from functools import cached_property
+
+from django.contrib.auth import get_user_model
+from django.db.models import Model
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from authentication.revocation import revocation_list
+
+
+class LazyUser:
+    """
+    The user of a verified token, built from its signed claims.
+    id, pk, is_staff and is_active come from the token, reading any other
+    attribute loads the User row (once).
+    """
+    is_authenticated = True
+    is_anonymous = False
+
+    def __init__(self, user_id, is_staff, is_active):
+        self.id = self.pk = user_id
+        self.is_staff = is_staff
+        self.is_active = is_active
+
+    @cached_property
+    def _user(self):
+        try:
+            return get_user_model().objects.get(pk=self.id)
+        except get_user_model().DoesNotExist:
+            raise AuthenticationFailed('User not found',
+                                       code='user_not_found')
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return getattr(self._user, name)
+
+    def __eq__(self, other):
+        if isinstance(other, (LazyUser, Model)):
+            return self.pk == other.pk
+        return NotImplemented
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return str(self._user)
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that trusts the is_staff / is_active claims of the
+    token (authentication.tokens) on read requests and returns a LazyUser
+    instead of loading the User row.
+    Writes and tokens without the claims load the User as before. Both
+    paths reject the tokens of users on the revocation list.
+    """
+
+    def authenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(
+                'Token contained no recognizable user identification')
+        issued_at = validated_token.get('auth_time',
+                                        validated_token.get('iat'))
+        if revocation_list.is_revoked(user_id, issued_at):
+            raise AuthenticationFailed('Token has been revoked',
+                                       code='token_revoked')
+
+        if (request.method in SAFE_METHODS
+                and 'is_staff' in validated_token
+                and 'is_active' in validated_token):
+            if not validated_token['is_active']:
+                raise AuthenticationFailed('User is inactive',
+                                           code='user_inactive')
+            user = LazyUser(user_id, validated_token['is_staff'],
+                            validated_token['is_active'])
+        else:
+            user = self.get_user(validated_token)
+        return user, validated_token
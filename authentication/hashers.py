@@ -0,0 +1,190 @@
+"""
+Password hashers with parameters from settings.PASSWORD_HASHING (see the
+calibrate_password_hasher command) that hash in a bounded worker pool.
+
+The pool runs at most WORKERS hashes at the same time, so a burst of
+signups / logins cannot take all cores from the other requests. Up to
+QUEUE more wait for a worker, everything beyond that is answered with
+503 after TIMEOUT seconds.
+"""
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+from django.utils.crypto import get_random_string
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+PASSWORD_HASHING_DEFAULTS = {
+    'SCRYPT': {'work_factor': 2 ** 14, 'block_size': 8, 'parallelism': 1},
+    'ARGON2': {'time_cost': 2, 'memory_cost': 102400, 'parallelism': 8},
+    'PBKDF2': {'iterations': hashers.PBKDF2PasswordHasher.iterations},
+    'WORKERS': 4,
+    'QUEUE': 64,
+    'TIMEOUT': 10,
+}
+
+
+def hashing_options():
+    return {**PASSWORD_HASHING_DEFAULTS,
+            **getattr(settings, 'PASSWORD_HASHING', {})}
+
+
+class PasswordHashingBusy(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many password operations, try again later.'
+    default_code = 'password_hashing_busy'
+
+
+class HashingPool:
+    """Bounded thread pool, hashlib and argon2 release the GIL."""
+
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def start(self):
+        with self._lock:
+            if self._executor is None:
+                options = hashing_options()
+                self._executor = ThreadPoolExecutor(
+                    max_workers=options['WORKERS'],
+                    thread_name_prefix='password-hashing',
+                    initializer=self._mark_worker)
+                self._slots = threading.BoundedSemaphore(
+                    options['WORKERS'] + options['QUEUE'])
+                self.timeout = options['TIMEOUT']
+        return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def _mark_worker(self):
+        self._local.worker = True
+
+    def run(self, function, *args):
+        if getattr(self._local, 'worker', False):
+            # scrypt's verify() calls encode(), no second round trip
+            return function(*args)
+        executor = self.start()
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PasswordHashingBusy()
+        try:
+            return executor.submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+
+hashing_pool = HashingPool()
+
+
+class PooledHasherMixin:
+    """Runs encode() and verify() of the hasher in the hashing_pool"""
+    options_key = None
+
+    def __init__(self):
+        for name, value in hashing_options()[self.options_key].items():
+            setattr(self, name, value)
+
+    def encode(self, *args, **kwargs):
+        return hashing_pool.run(lambda: super(
+            PooledHasherMixin, self).encode(*args, **kwargs))
+
+    def verify(self, password, encoded):
+        return hashing_pool.run(lambda: super(
+            PooledHasherMixin, self).verify(password, encoded))
+
+
+class ScryptPasswordHasher(PooledHasherMixin, hashers.ScryptPasswordHasher):
+    options_key = 'SCRYPT'
+
+    def __init__(self):
+        super().__init__()
+        # hashlib refuses more than 32 MiB unless maxmem allows it
+        self.maxmem = 2 * 128 * self.work_factor * self.block_size
+
+
+class Argon2PasswordHasher(PooledHasherMixin, hashers.Argon2PasswordHasher):
+    """Needs argon2-cffi (pip install django[argon2])."""
+    options_key = 'ARGON2'
+
+
+class PBKDF2PasswordHasher(PooledHasherMixin, hashers.PBKDF2PasswordHasher):
+    options_key = 'PBKDF2'
+
+
+HASHERS = {
+    'scrypt': (ScryptPasswordHasher, 'work_factor'),
+    'argon2': (Argon2PasswordHasher, 'time_cost'),
+    'pbkdf2': (PBKDF2PasswordHasher, 'iterations'),
+}
+
+
+def time_hasher(hasher, parameters, rounds=3):
+    """Median seconds of encode() with the parameters set on the hasher"""
+    for name, value in parameters.items():
+        setattr(hasher, name, value)
+    if hasattr(hasher, 'maxmem'):
+        hasher.maxmem = 2 * 128 * hasher.work_factor * hasher.block_size
+    times = []
+    for _ in range(rounds):
+        salt = get_random_string(22)
+        start = time.perf_counter()
+        # the unpooled encode, the calibration measures the algorithm
+        super(PooledHasherMixin, hasher).encode('calibration password', salt)
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def cost_steps(algorithm, max_memory_mb):
+    if algorithm == 'scrypt':
+        work_factor = 2 ** 12
+        # scrypt needs 128 * n * r bytes
+        while 128 * work_factor * 8 <= max_memory_mb * 2 ** 20:
+            yield work_factor
+            work_factor *= 2
+    elif algorithm == 'argon2':
+        yield from range(1, 21)
+    else:
+        iterations = 100000
+        while True:
+            yield iterations
+            iterations += 100000
+
+
+def calibrate(algorithm, target_ms=250, max_memory_mb=64, rounds=3):
+    """
+    Raises the cost parameter of the algorithm (scrypt: work_factor,
+    argon2: time_cost, pbkdf2: iterations) until one hash takes longer
+    than target_ms, returns the last parameters below the target and
+    every measurement.
+    """
+    hasher_class, parameter = HASHERS[algorithm]
+    hasher = hasher_class()
+    if algorithm == 'argon2':
+        # fails early without argon2-cffi
+        hasher._load_library()
+    parameters = dict(hashing_options()[hasher_class.options_key])
+    chosen, measurements = None, []
+    for cost in cost_steps(algorithm, max_memory_mb):
+        parameters[parameter] = cost
+        seconds = time_hasher(hasher, parameters, rounds)
+        measurements.append({parameter: cost,
+                             'milliseconds': round(seconds * 1000, 2)})
+        if seconds * 1000 > target_ms:
+            break
+        chosen = dict(parameters)
+    return {
+        'algorithm': algorithm,
+        'target_ms': target_ms,
+        'parameters': chosen,
+        'measurements': measurements,
+    }
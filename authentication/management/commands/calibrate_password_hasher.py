@@ -0,0 +1,34 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from authentication.hashers import HASHERS, calibrate
+
+
+class Command(BaseCommand):
+    help = ('Measures the password hashers on this machine and prints the '
+            'highest cost parameters that hash within the target time, for '
+            'settings.PASSWORD_HASHING.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algorithm', choices=list(HASHERS),
+                            default='scrypt')
+        parser.add_argument('--target-ms', type=float, default=250,
+                            help='time one hash may take')
+        parser.add_argument('--max-memory-mb', type=int, default=64,
+                            help='memory limit of one scrypt hash')
+        parser.add_argument('--rounds', type=int, default=3,
+                            help='hashes per measurement, the median counts')
+
+    def handle(self, *args, **options):
+        try:
+            result = calibrate(options['algorithm'], options['target_ms'],
+                               options['max_memory_mb'], options['rounds'])
+        except ValueError as error:
+            # raised by Argon2PasswordHasher without argon2-cffi
+            raise CommandError(error)
+        if result['parameters'] is None:
+            raise CommandError(
+                f'Even the lowest cost takes longer than '
+                f'{options["target_ms"]} ms: {result["measurements"]}')
+        self.stdout.write(json.dumps(result, indent=2))
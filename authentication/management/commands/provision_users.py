@@ -0,0 +1,68 @@
+import csv
+import json
+import os
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from api.models import Project
+from authentication.provisioning import ON_CONFLICT, PROVISIONING_BATCH_SIZE
+
+FORMATS = ('csv', 'ndjson')
+
+
+def read_rows(path, file_format):
+    """The rows of a csv file with a header line or of a JSON lines file"""
+    with open(path, newline='', encoding='utf-8') as file:
+        if file_format == 'csv':
+            return list(csv.DictReader(file))
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class Command(BaseCommand):
+    help = ('Creates users from a csv (email,password,first_name,last_name '
+            'header) or ndjson file, hashing the passwords in a process pool, '
+            'and prints the counts and the throughput.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS,
+                            help='default: from the file extension')
+        parser.add_argument('--batch-size', type=int,
+                            default=PROVISIONING_BATCH_SIZE,
+                            help='users per insert and transaction')
+        parser.add_argument('--processes', type=int,
+                            help='hashing processes, default: one per core')
+        parser.add_argument('--on-conflict', choices=ON_CONFLICT,
+                            default='skip',
+                            help='what happens to existing emails')
+        parser.add_argument('--project', type=int,
+                            help='adds every user to this project')
+
+    def handle(self, *args, **options):
+        file_format = options['format']
+        if file_format is None:
+            file_format = os.path.splitext(options['path'])[1].lstrip('.')
+            if file_format in ('jsonl', 'json'):
+                file_format = 'ndjson'
+            if file_format not in FORMATS:
+                raise CommandError('Cannot tell the format, use --format.')
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+        project = None
+        if options['project'] is not None:
+            try:
+                project = Project.objects.get(pk=options['project'])
+            except Project.DoesNotExist:
+                raise CommandError(
+                    f'Project {options["project"]} does not exist.')
+        try:
+            rows = read_rows(options['path'], file_format)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+
+        report = get_user_model().objects.bulk_provision(
+            rows, batch_size=options['batch_size'],
+            on_conflict=options['on_conflict'], project=project,
+            processes=options['processes'])
+        self.stdout.write(json.dumps(report.data, indent=2))
@@ -1,6 +1,9 @@
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 from django.db import models
 
+from authentication.provisioning import (
+    PROVISIONING_BATCH_SIZE, provision_users)
+
 
 class UserManager(BaseUserManager):
     """Model manager for User model with no username field."""
@@ -23,6 +26,15 @@ class UserManager(BaseUserManager):
         extra_fields.setdefault('is_superuser', False)
         return self._create_user(email, password, **extra_fields)
 
+    def bulk_provision(self, rows, batch_size=PROVISIONING_BATCH_SIZE,
+                       on_conflict='skip', project=None, processes=None):
+        """
+        Create (or with on_conflict='update' update) many users at once,
+        see authentication/provisioning.py.
+        """
+        return provision_users(self, rows, batch_size, on_conflict, project,
+                               processes)
+
     def create_superuser(self, email, password, **extra_fields):
         """Create and save a SuperUser with the given email and password."""
         extra_fields.setdefault('is_staff', True)
@@ -1,7 +1,97 @@
+from functools import cached_property
+
+from django.db import DEFAULT_DB_ALIAS, router
 from rest_framework import permissions
 from rest_framework.exceptions import NotFound
 
-from api.models import Project, Issue
+from api.cache import membership_cache
+from api.models import Project, Issue, Contributor
+
+
+class ProjectContext:
+    """
+    Request-scoped resolver for the Project, the Issue and the Contributor-row
+    of the current user that a (nested) request refers to.
+    Every object is loaded at most once per request and shared between the
+    permission classes, the viewsets and the serializers.
+    """
+
+    def __init__(self, request, view):
+        self.user = request.user
+        self.kwargs = view.kwargs
+
+    @cached_property
+    def project_id(self):
+        """Project-id from the URL, 'pk' is the project on the project routes"""
+        if 'project_pk' in self.kwargs.keys():
+            project_id = self.kwargs['project_pk']
+        elif 'pk' in self.kwargs.keys():
+            project_id = self.kwargs['pk']
+        else:
+            return None
+        try:
+            return int(project_id)
+        except ValueError:
+            raise NotFound('A Project with that id does not exist')
+
+    @cached_property
+    def contributor(self):
+        """
+        Contributor-row of the user for the project (or None), loaded together
+        with the project through the (user, project) unique index.
+        Read from the primary, the answer is cached as the membership and a
+        lagging replica would keep a new (or removed) member out (or in).
+        """
+        if self.project_id is None or not self.user.is_authenticated:
+            return None
+        contributors = Contributor.objects.using(DEFAULT_DB_ALIAS)
+        return contributors.select_related('project').filter(
+            project_id=self.project_id, user_id=self.user.id).first()
+
+    @cached_property
+    def project(self):
+        # reuse the project of the contributor lookup if it already ran and
+        # the request reads the primary as well. From a replica, the version
+        # (ETag, response cache key) has to be the one of the body.
+        contributor = self.__dict__.get('contributor')
+        if contributor is not None and router.db_for_read(
+                Project) in (None, DEFAULT_DB_ALIAS):
+            return contributor.project
+        try:
+            return Project.objects.get(id=self.project_id)
+        except Project.DoesNotExist:
+            raise NotFound('A Project with that id does not exist')
+
+    @cached_property
+    def issue(self):
+        try:
+            return Issue.objects.get(
+                id=self.kwargs['issue_pk'], project_id=self.project_id)
+        except Issue.DoesNotExist:
+            raise NotFound('A Issue with that id does not exist')
+
+    @cached_property
+    def is_contributor(self):
+        """Membership of the user, answered from the membership_cache if set"""
+        if not self.user.is_authenticated:
+            return False
+        is_member = membership_cache.get(self.user.id, self.project_id)
+        if is_member is None:
+            is_member = self.contributor is not None
+            if not is_member:
+                # raises NotFound if the project does not exist at all
+                self.project
+            membership_cache.set(self.user.id, self.project_id, is_member)
+        return is_member
+
+
+def get_project_context(request, view):
+    """Returns the ProjectContext of the request, creates it on first use."""
+    context = getattr(request, '_project_context', None)
+    if context is None:
+        context = ProjectContext(request, view)
+        request._project_context = context
+    return context
 
 
 class IsAuthorOrReadOnly(permissions.BasePermission):
@@ -14,7 +104,7 @@ class IsAuthorOrReadOnly(permissions.BasePermission):
         if request.method in permissions.SAFE_METHODS:
             return True
         # write permissions are only allowed to the author
-        return obj.author == request.user
+        return obj.author_id == request.user.id
 
 
 class IsContributor(permissions.BasePermission):
@@ -23,19 +113,10 @@ class IsContributor(permissions.BasePermission):
     or a directly related Object (Issue, ect.)
     """
     def has_permission(self, request, view):
-        if 'project_pk' in view.kwargs.keys():
-            project_id = view.kwargs['project_pk']
-        elif 'pk' in view.kwargs.keys():
-            project_id = view.kwargs['pk']
-        else:
+        context = get_project_context(request, view)
+        if context.project_id is None:
             return True
-        try:
-            project = Project.objects.get(id=project_id)
-        except Project.DoesNotExist:
-            raise NotFound('A Project with that id does not exist')
-        if request.user in project.contributors.all():
-            return True
-        return False
+        return context.is_contributor
 
 
 class IsRelatedProjectAuthorOrReadOnly(permissions.BasePermission):
@@ -48,11 +129,8 @@ class IsRelatedProjectAuthorOrReadOnly(permissions.BasePermission):
         Only the author of the Project is allowed to add (post) a new
         object to it.
         """
-        try:
-            project = Project.objects.get(id=view.kwargs['project_pk'])
-        except Project.DoesNotExist:
-            raise NotFound('A Project with that id does not exist')
-        if request.user == project.author:
+        project = get_project_context(request, view).project
+        if project.author_id == request.user.id:
             return True
         return request.method in permissions.SAFE_METHODS
 
@@ -67,8 +145,8 @@ class IsRelatedIssueAuthor(permissions.BasePermission):
         """
         Only the author of the issue is allowed to add a new comment.
         """
-        issue = Issue.objects.get(id=view.kwargs['issue_pk'])
-        if request.user == issue.author:
+        issue = get_project_context(request, view).issue
+        if issue.author_id == request.user.id:
             return True
         return request.method in permissions.SAFE_METHODS
 
@@ -0,0 +1,190 @@
+"""
+Bulk provisioning of users, e.g. from a directory export.
+
+Passwords are hashed in parallel in a process pool, the users are
+inserted with bulk_create and existing emails are looked up with one query
+per batch and skipped or updated. Optionally all provisioned users become
+collaborators of a project in the same pass.
+"""
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from rest_framework import serializers
+
+from authentication.revocation import revocation_list
+
+PROVISIONING_BATCH_SIZE = 1000
+ON_CONFLICT = ('skip', 'update')
+FIELDS = ('first_name', 'last_name')
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def _init_worker():
+    # spawned workers import the settings again
+    if not apps.ready:
+        django.setup()
+
+
+def process_pool(processes):
+    """A process pool per size that is reused by later provisionings"""
+    with _pools_lock:
+        if processes not in _pools:
+            _pools[processes] = ProcessPoolExecutor(
+                max_workers=processes,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker)
+        return _pools[processes]
+
+
+def hash_passwords(passwords, processes):
+    """make_password of every password (None -> unusable) in order"""
+    if processes <= 1:
+        return [make_password(password) for password in passwords]
+    chunksize = max(1, len(passwords) // (processes * 4))
+    return list(process_pool(processes).map(make_password, passwords,
+                                            chunksize=chunksize))
+
+
+class ProvisioningRowSerializer(serializers.Serializer):
+    """One row of a provisioning, no password makes it unusable"""
+    email = serializers.EmailField(max_length=254)
+    password = serializers.CharField(required=False, allow_null=True,
+                                     allow_blank=True, trim_whitespace=False)
+    first_name = serializers.CharField(required=False, allow_null=True,
+                                       allow_blank=True, max_length=150)
+    last_name = serializers.CharField(required=False, allow_null=True,
+                                      allow_blank=True, max_length=150)
+
+
+class ProvisioningReport:
+    """Counts of a provisioning run, the errors by row index."""
+
+    def __init__(self):
+        self.created = self.updated = self.skipped = 0
+        self.contributors = 0
+        self.errors = {}
+        self.start = time.perf_counter()
+        self.seconds = None
+
+    def finish(self):
+        self.seconds = time.perf_counter() - self.start
+
+    @property
+    def data(self):
+        provisioned = self.created + self.updated
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'contributors_added': self.contributors,
+            'errors': [{'index': index, 'errors': errors}
+                       for index, errors in sorted(self.errors.items())],
+            'seconds': round(self.seconds or 0, 3),
+            'users_per_second': round(provisioned / self.seconds, 1)
+            if self.seconds else None,
+        }
+
+
+def clean_rows(manager, rows, report):
+    """
+    The (index, row) of the valid rows with normalized emails, the first
+    row of an email wins.
+    """
+    valid, seen = [], set()
+    for index, row in enumerate(rows):
+        serializer = ProvisioningRowSerializer(data=row)
+        if not serializer.is_valid():
+            report.errors[index] = serializer.errors
+            continue
+        row = serializer.validated_data
+        email = manager.normalize_email(row['email'])
+        if email.lower() in seen:
+            report.errors[index] = {'email': ['Duplicate email in input.']}
+            continue
+        seen.add(email.lower())
+        valid.append((index, {**row, 'email': email}))
+    return valid
+
+
+def provision_batch(manager, batch, on_conflict, processes, report):
+    """Creates / updates one batch, returns its users"""
+    model = manager.model
+    existing = {user.email: user for user in manager.filter(
+        email__in=[row['email'] for _, row in batch])}
+    create = [row for _, row in batch if row['email'] not in existing]
+    update = [row for _, row in batch if row['email'] in existing]
+    if on_conflict == 'skip':
+        report.skipped += len(update)
+        update = []
+
+    # updates keep the password unless the row has one
+    update_passwords = [row for row in update if row.get('password')]
+    hashed = iter(hash_passwords(
+        [row.get('password') for row in create + update_passwords],
+        processes))
+    users = [model(email=row['email'], password=next(hashed),
+                   **{field: row.get(field) or '' for field in FIELDS})
+             for row in create]
+    manager.bulk_create(users, batch_size=len(users) or None)
+    report.created += len(users)
+
+    updated = []
+    for row in update:
+        user = existing[row['email']]
+        if row.get('password'):
+            user.password = next(hashed)
+            # bulk_update sends no pre_save, see authentication/signals.py
+            revocation_list.revoke(user.pk)
+        for field in FIELDS:
+            if row.get(field) is not None:
+                setattr(user, field, row[field])
+        updated.append(user)
+    manager.bulk_update(updated, ['password', *FIELDS],
+                        batch_size=len(updated) or None)
+    report.updated += len(updated)
+    if on_conflict == 'skip':
+        return users + [existing[row['email']] for _, row in batch
+                        if row['email'] in existing]
+    return users + updated
+
+
+def provision_users(manager, rows, batch_size=PROVISIONING_BATCH_SIZE,
+                    on_conflict='skip', project=None, processes=None):
+    """
+    Provisions the rows ({'email', 'password', 'first_name', 'last_name'},
+    a missing password makes it unusable) and adds the users to the project
+    if one is given. Every batch is a transaction of its own.
+    Returns the ProvisioningReport.
+    """
+    from api.bulk import add_missing_contributors
+    from api.models import Project
+
+    if on_conflict not in ON_CONFLICT:
+        raise ValueError(f'on_conflict must be one of {ON_CONFLICT}')
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    report = ProvisioningReport()
+    rows = clean_rows(manager, rows, report)
+    for start in range(0, len(rows), batch_size):
+        batch = rows[start:start + batch_size]
+        with transaction.atomic():
+            users = provision_batch(manager, batch, on_conflict, processes,
+                                    report)
+            if project is not None:
+                if any(user.pk is None for user in users):
+                    # backends that cannot return the ids of bulk_create
+                    users = list(manager.filter(
+                        email__in=[user.email for user in users]))
+                report.contributors += add_missing_contributors(
+                    project, users)
+                Project.bump_version(id=project.id)
+    report.finish()
+    return report
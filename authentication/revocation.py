@@ -0,0 +1,85 @@
+import os
+import time
+
+from django.conf import settings
+from django.core import checks
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from rest_framework_simplejwt.settings import api_settings
+
+TOKEN_REVOCATION_DEFAULTS = {
+    'CACHE': 'default',
+}
+
+
+class RevocationList:
+    """
+    The time from which on the tokens of a user are revoked: tokens that
+    were issued before are rejected. That is the "auth_time" claim of
+    authentication.tokens, other tokens only have the whole seconds of "iat"
+    and are rejected if they were issued in the same second.
+    Users are added when they are deactivated, deleted or change their
+    password or staff status (authentication/signals.py). An entry lives as
+    long as the longest token lifetime, older tokens are expired anyway.
+    Kept in the Django cache selected by settings.TOKEN_REVOCATION['CACHE'],
+    it has to be a shared cache when there are several processes: the
+    stateless read path (authentication.authentication) only asks this list
+    and a worker that misses a revocation keeps serving the token.
+    """
+    key_prefix = 'revoked'
+
+    def __init__(self, options=None):
+        if options is None:
+            options = getattr(settings, 'TOKEN_REVOCATION', {})
+        options = {**TOKEN_REVOCATION_DEFAULTS, **options}
+        self.alias = options['CACHE']
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    @property
+    def timeout(self):
+        return int(max(api_settings.ACCESS_TOKEN_LIFETIME,
+                       api_settings.REFRESH_TOKEN_LIFETIME).total_seconds())
+
+    def make_key(self, user_id):
+        return f'{self.key_prefix}:{int(user_id)}'
+
+    def revoke(self, user_id, at=None):
+        self.cache.set(self.make_key(user_id), at or time.time(),
+                       self.timeout)
+
+    def is_revoked(self, user_id, issued_at):
+        revoked_at = self.cache.get(self.make_key(user_id))
+        if revoked_at is None:
+            return False
+        return issued_at is None or issued_at <= revoked_at
+
+    def clear(self):
+        self.cache.clear()
+
+
+revocation_list = RevocationList()
+
+
+def check_revocation_cache(app_configs=None, **kwargs):
+    """
+    A LocMemCache only holds the revocations of its own process, that is
+    an error once the server runs several workers (WEB_CONCURRENCY, as set
+    for gunicorn / uvicorn).
+    """
+    try:
+        workers = int(os.environ.get('WEB_CONCURRENCY', 1))
+    except ValueError:
+        workers = 1
+    revocations = RevocationList()
+    if workers > 1 and isinstance(revocations.cache, LocMemCache):
+        return [checks.Error(
+            f"TOKEN_REVOCATION['CACHE'] ({revocations.alias!r}) is a "
+            f'per-process LocMemCache but {workers} workers run.',
+            hint='Use a cache that all workers share (file based, Redis or '
+                 'Memcached).',
+            id='authentication.E001',
+        )]
+    return []
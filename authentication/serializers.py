@@ -1,6 +1,9 @@
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
 from rest_framework_nested.serializers import NestedHyperlinkedModelSerializer
+from rest_framework_simplejwt import serializers as jwt_serializers
+
+from authentication.tokens import RefreshToken
 
 
 class UserSerializer(NestedHyperlinkedModelSerializer):
@@ -25,3 +28,8 @@ class SignUpSerializer(serializers.ModelSerializer):
             last_name=validated_data['last_name'],
             password=validated_data['password']
         )
+
+
+class TokenObtainPairSerializer(jwt_serializers.TokenObtainPairSerializer):
+    """Issues tokens with the claims of authentication.tokens"""
+    token_class = RefreshToken
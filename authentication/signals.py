@@ -0,0 +1,29 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save, post_delete
+from django.dispatch import receiver
+
+from authentication.revocation import revocation_list
+
+User = get_user_model()
+
+# a change of one of these invalidates the tokens of the user
+REVOKING_FIELDS = ('password', 'is_active', 'is_staff')
+
+
+@receiver(pre_save, sender=User)
+def revoke_changed_user(sender, instance, update_fields=None, **kwargs):
+    if instance.pk is None:
+        return
+    if update_fields is not None and not set(REVOKING_FIELDS) & set(
+            update_fields):
+        return
+    previous = User.objects.filter(pk=instance.pk).values_list(
+        *REVOKING_FIELDS).first()
+    current = tuple(getattr(instance, field) for field in REVOKING_FIELDS)
+    if previous is not None and previous != current:
+        revocation_list.revoke(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user(sender, instance, **kwargs):
+    revocation_list.revoke(instance.pk)
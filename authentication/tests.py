@@ -1,3 +1,318 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import (
+    get_default_password_validators)
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+from rest_framework_simplejwt import tokens as jwt_tokens
+
+from api.cache import membership_cache, response_cache
+from api.models import Contributor, Project
+from authentication.authentication import LazyUser
+from authentication.hashers import (
+    HashingPool,
+    PasswordHashingBusy,
+    calibrate,
+)
+from authentication.models import User
+from authentication.revocation import (
+    check_revocation_cache,
+    revocation_list,
+)
+from authentication.tokens import AccessToken, RefreshToken
+from authentication.views import UserViewSet
+
+
+class StatelessJWTTests(APITestCase):
+    """Read requests trust the signed claims instead of the User row."""
+
+    def setUp(self):
+        revocation_list.clear()
+        membership_cache.clear()
+        response_cache.clear()
+        self.user = User.objects.create_user(
+            email='user@test.com', password='Password-123',
+            first_name='First', last_name='Last')
+
+    def authorize(self, token):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def count_queries(self, url='/projects/'):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_login_issues_claims(self):
+        response = self.client.post('/login/token/', {
+            'email': 'user@test.com', 'password': 'Password-123'})
+        access = AccessToken(response.data['access'])
+        self.assertIs(access['is_staff'], False)
+        self.assertIs(access['is_active'], True)
+
+    def test_read_skips_user_query(self):
+        self.authorize(jwt_tokens.AccessToken.for_user(self.user))
+        with_user_row = self.count_queries()
+        self.authorize(AccessToken.for_user(self.user))
+        self.assertEqual(self.count_queries(), with_user_row - 1)
+
+    def test_writes_load_user(self):
+        self.authorize(AccessToken.for_user(self.user))
+        response = self.client.post('/projects/', {
+            'title': 'project', 'description': 'description',
+            'type': 'back end'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_staff_claim(self):
+        self.authorize(AccessToken.for_user(self.user))
+        self.assertEqual(self.client.get('/users/').status_code, 403)
+        self.user.is_staff = True
+        self.user.save()
+        self.authorize(AccessToken.for_user(self.user))
+        self.assertEqual(self.client.get('/users/').status_code, 200)
+
+    def test_inactive_claim(self):
+        token = AccessToken.for_user(self.user)
+        token['is_active'] = False
+        self.authorize(token)
+        # 403, not 401: the first authentication class (Session) sends no
+        # WWW-Authenticate header
+        self.assertEqual(self.client.get('/projects/').status_code, 403)
+
+    def test_password_change_revokes(self):
+        self.authorize(AccessToken.for_user(self.user))
+        self.user.set_password('Password-456')
+        self.user.save()
+        self.assertEqual(self.client.get('/projects/').status_code, 403)
+
+    def test_deactivation_revokes_refreshed_tokens(self):
+        refresh = RefreshToken.for_user(self.user)
+        self.user.is_active = False
+        self.user.save()
+        self.authorize(refresh.access_token)
+        self.assertEqual(self.client.get('/projects/').status_code, 403)
+
+    def test_unrelated_change_keeps_tokens(self):
+        self.authorize(AccessToken.for_user(self.user))
+        self.user.first_name = 'Changed'
+        self.user.save()
+        self.assertEqual(self.client.get('/projects/').status_code, 200)
+
+    @override_settings(TOKEN_REVOCATION={'CACHE': 'default'})
+    def test_revocation_cache_check(self):
+        self.assertEqual(check_revocation_cache(), [])
+        with mock.patch.dict(os.environ, {'WEB_CONCURRENCY': '4'}):
+            errors = check_revocation_cache()
+            self.assertEqual([error.id for error in errors],
+                             ['authentication.E001'])
+            shared = {'BACKEND': 'django.core.cache.backends.filebased.'
+                                 'FileBasedCache',
+                      'LOCATION': tempfile.gettempdir()}
+            with override_settings(CACHES={'default': shared}):
+                self.assertEqual(check_revocation_cache(), [])
+
+    def test_lazy_user(self):
+        user = LazyUser(self.user.id, False, True)
+        with self.assertNumQueries(0):
+            self.assertEqual(user.pk, self.user.id)
+            self.assertFalse(user.is_staff)
+            self.assertTrue(user.is_authenticated)
+            self.assertEqual(user, self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(user.email, 'user@test.com')
+            self.assertEqual(user.first_name, 'First')
+
+
+class PasswordHashingTests(APITestCase):
+    """Passwords are hashed with the configured hasher in the pool."""
+
+    def test_new_passwords_use_scrypt(self):
+        user = User.objects.create_user(email='user@test.com',
+                                        password='Password-123')
+        self.assertTrue(user.password.startswith('scrypt$16384$'))
+        self.assertTrue(user.check_password('Password-123'))
+        self.assertFalse(user.check_password('wrong'))
+
+    def test_legacy_hash_is_upgraded(self):
+        user = User.objects.create_user(email='user@test.com')
+        user.password = make_password('Password-123', hasher='pbkdf2_sha256')
+        user.save()
+        self.assertTrue(user.check_password('Password-123'))
+        user.refresh_from_db()
+        self.assertTrue(user.password.startswith('scrypt$'))
+
+    def test_token_login(self):
+        User.objects.create_user(email='user@test.com',
+                                 password='Password-123')
+        response = self.client.post('/login/token/', {
+            'email': 'user@test.com', 'password': 'Password-123'})
+        self.assertEqual(response.status_code, 200)
+
+    def test_validators_are_preloaded(self):
+        self.assertEqual(
+            get_default_password_validators.cache_info().currsize, 1)
+
+
+class HashingPoolTests(SimpleTestCase):
+
+    @override_settings(PASSWORD_HASHING={
+        'WORKERS': 1, 'QUEUE': 0, 'TIMEOUT': 0.05})
+    def test_busy_pool(self):
+        pool = HashingPool()
+        self.addCleanup(pool.shutdown)
+        started, release = threading.Event(), threading.Event()
+
+        def block():
+            started.set()
+            release.wait(5)
+            return 'done'
+
+        thread = threading.Thread(target=pool.run, args=(block,))
+        thread.start()
+        started.wait(5)
+        with self.assertRaises(PasswordHashingBusy):
+            pool.run(lambda: 'second')
+        release.set()
+        thread.join()
+        self.assertEqual(pool.run(lambda: 'third'), 'third')
+
+    def test_calibrate(self):
+        result = calibrate('scrypt', target_ms=10000, max_memory_mb=4,
+                           rounds=1)
+        self.assertEqual(result['parameters']['work_factor'], 2 ** 12)
+        self.assertEqual(len(result['measurements']), 1)
+
+
+class ProvisioningTests(APITestCase):
+    """Bulk provisioning of users with the UserManager."""
+
+    def setUp(self):
+        revocation_list.clear()
+        membership_cache.clear()
+        self.existing = User.objects.create_user(
+            email='existing@test.com', password='Password-123',
+            first_name='Old')
+        self.rows = [
+            {'email': f'user{i}@test.com', 'password': f'Password-{i}',
+             'first_name': f'First {i}', 'last_name': 'Last'}
+            for i in range(3)]
+
+    def test_create_and_skip(self):
+        rows = self.rows + [{'email': 'existing@test.com',
+                             'password': 'Password-456'}]
+        # savepoint, existing emails, insert, release
+        with self.assertNumQueries(4):
+            report = User.objects.bulk_provision(rows, processes=1)
+        self.assertEqual((report.created, report.updated, report.skipped),
+                         (3, 0, 1))
+        user = User.objects.get(email='user1@test.com')
+        self.assertTrue(user.check_password('Password-1'))
+        self.assertEqual(user.first_name, 'First 1')
+        self.existing.refresh_from_db()
+        self.assertTrue(self.existing.check_password('Password-123'))
+
+    def test_update(self):
+        token = AccessToken.for_user(self.existing)
+        report = User.objects.bulk_provision(
+            [{'email': 'existing@test.com', 'first_name': 'New'},
+             {'email': 'EXISTING@test.com', 'password': 'Password-456'}],
+            on_conflict='update', processes=1)
+        self.assertEqual(report.updated, 1)
+        self.assertEqual(list(report.errors), [1])
+        self.existing.refresh_from_db()
+        self.assertEqual(self.existing.first_name, 'New')
+        # no password in the row, the old one stays and so do the tokens
+        self.assertTrue(self.existing.check_password('Password-123'))
+        self.assertFalse(revocation_list.is_revoked(
+            self.existing.id, token['auth_time']))
+
+        User.objects.bulk_provision(
+            [{'email': 'existing@test.com', 'password': 'Password-456'}],
+            on_conflict='update', processes=1)
+        self.existing.refresh_from_db()
+        self.assertTrue(self.existing.check_password('Password-456'))
+        self.assertTrue(revocation_list.is_revoked(
+            self.existing.id, token['auth_time']))
+
+    def test_invalid_rows(self):
+        report = User.objects.bulk_provision(
+            [{'email': 'not an email'}, 'row', self.rows[0]], processes=1)
+        self.assertEqual(report.created, 1)
+        self.assertEqual(sorted(report.errors), [0, 1])
+        self.assertEqual(report.data['errors'][0]['index'], 0)
+
+    def test_rows_of_wrong_types(self):
+        report = User.objects.bulk_provision(
+            [{'email': 5}, {'email': 'user@test.com', 'password': ['x']},
+             {'email': 'other@test.com', 'first_name': {}},
+             {'email': 'number@test.com', 'password': 123}], processes=1)
+        self.assertEqual(report.created, 1)
+        self.assertEqual(sorted(report.errors), [0, 1, 2])
+        self.assertIn('email', report.errors[0])
+        self.assertIn('password', report.errors[1])
+        # numbers are taken as strings, like the other endpoints do
+        user = User.objects.get(email='number@test.com')
+        self.assertTrue(user.check_password('123'))
+
+    def test_batches_and_project(self):
+        project = Project.objects.create(
+            title='project', description='description', type='back end',
+            author=self.existing)
+        Contributor.objects.create(user=self.existing, project=project,
+                                   permission='manage', role='AUTHOR')
+        version = project.version
+        report = User.objects.bulk_provision(
+            self.rows + [{'email': 'existing@test.com'}], batch_size=2,
+            project=project, processes=1)
+        self.assertEqual(report.created, 3)
+        self.assertEqual(report.contributors, 3)
+        self.assertEqual(
+            Contributor.objects.filter(project=project,
+                                       role='COLLABORATOR').count(), 3)
+        project.refresh_from_db()
+        self.assertGreater(project.version, version)
+
+    def test_process_pool(self):
+        report = User.objects.bulk_provision(self.rows, processes=2)
+        self.assertEqual(report.created, 3)
+        self.assertIsNotNone(report.data['users_per_second'])
+        user = User.objects.get(email='user2@test.com')
+        self.assertTrue(user.check_password('Password-2'))
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'users.ndjson')
+            with open(path, 'w') as file:
+                file.writelines(json.dumps(row) + '\n' for row in self.rows)
+            out = tempfile.SpooledTemporaryFile(mode='w+')
+            call_command('provision_users', path, '--processes', '1',
+                         stdout=out)
+        out.seek(0)
+        self.assertEqual(json.loads(out.read())['created'], 3)
+        self.assertEqual(User.objects.count(), 4)
+
+    def test_endpoint(self):
+        self.client.force_authenticate(self.existing)
+        response = self.client.post('/users/bulk/', self.rows, format='json')
+        self.assertEqual(response.status_code, 403)
+
+        self.existing.is_staff = True
+        self.existing.save()
+        UserViewSet.provisioning_processes = 1
+        self.addCleanup(setattr, UserViewSet, 'provisioning_processes', 2)
+        response = self.client.post('/users/bulk/?on_conflict=update',
+                                    self.rows + [{'email': 'invalid'}],
+                                    format='json')
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual(response.data['created'], 3)
+        response = self.client.post('/users/bulk/?on_conflict=replace',
+                                    self.rows, format='json')
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,28 @@
+import time
+
+from rest_framework_simplejwt import tokens
+
+
+class UserClaimsMixin:
+    """
+    Adds the claims that StatelessJWTAuthentication trusts instead of
+    loading the User row and the exact "auth_time" for the revocation
+    list ("iat" has whole seconds). Access tokens that are created from a
+    refresh token copy them.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['is_staff'] = user.is_staff
+        token['is_active'] = user.is_active
+        token['auth_time'] = time.time()
+        return token
+
+
+class AccessToken(UserClaimsMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(UserClaimsMixin, tokens.RefreshToken):
+    access_token_class = AccessToken
@@ -1,15 +1,22 @@
 from django.contrib.auth import get_user_model
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError
+from django.shortcuts import get_object_or_404
 from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.exceptions import ParseError
 from rest_framework.generics import GenericAPIView
 from rest_framework.response import Response
 
+from api.instrumentation import RequestMetricsMixin
+from api.models import Project
+from api.views import BulkMixin
+from authentication.provisioning import ON_CONFLICT
 from authentication.serializers import UserSerializer, SignUpSerializer
 from .permissions import IsNotAuthenticated
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(RequestMetricsMixin, BulkMixin, viewsets.ModelViewSet):
     """
     API endpoint that allows users to be viewed or edited.
     """
@@ -17,9 +24,41 @@ class UserViewSet(viewsets.ModelViewSet):
     queryset = User.objects.all().order_by('-date_joined')
     serializer_class = UserSerializer
     permission_classes = [permissions.IsAuthenticated, permissions.IsAdminUser]
+    # hashing processes of a request, the worker serves other requests too.
+    # Large directories go through the provision_users command.
+    provisioning_processes = 2
 
+    @action(detail=False, methods=['post'])
+    def bulk(self, request, *args, **kwargs):
+        """
+        Provisions a list of users ({email, password, first_name,
+        last_name}), ?on_conflict=skip|update decides about existing emails
+        and ?project=<id> adds all of them to that project.
+        """
+        items = self.get_bulk_items()
+        on_conflict = request.query_params.get('on_conflict', 'skip')
+        if on_conflict not in ON_CONFLICT:
+            raise ParseError(f'on_conflict must be one of {ON_CONFLICT}.')
+        project = None
+        if 'project' in request.query_params:
+            if not request.query_params['project'].isdigit():
+                raise ParseError('project must be a project id.')
+            project = get_object_or_404(
+                Project, pk=request.query_params['project'])
 
-class UserSignUpView(GenericAPIView):
+        report = self.User.objects.bulk_provision(
+            items, on_conflict=on_conflict, project=project,
+            processes=self.provisioning_processes)
+        if not report.errors:
+            code = status.HTTP_201_CREATED
+        elif len(report.errors) == len(items):
+            code = status.HTTP_400_BAD_REQUEST
+        else:
+            code = status.HTTP_207_MULTI_STATUS
+        return Response(report.data, status=code)
+
+
+class UserSignUpView(RequestMetricsMixin, GenericAPIView):
     """
     API endpoint that allows not new users to signup.
     Only passwords which correspond to the validity assignments are accepted.